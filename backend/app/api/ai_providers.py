@@ -3,10 +3,12 @@ AI提供商配置管理 API
 """
 
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import Optional, Dict, Any, List
 from loguru import logger
+import json
 
 from app.core.multi_model_engine import multi_model_engine
 from app.models.database import get_db, EmbeddingProvider
@@ -26,6 +28,7 @@ class ProviderVerifyRequest(BaseModel):
     provider: str
     api_key: str
     base_url: Optional[str] = None
+    force_refresh: bool = False  # 忽略缓存的验证结果/模型列表
 
 
 class ChatRequest(BaseModel):
@@ -119,7 +122,8 @@ async def verify_provider(request: ProviderVerifyRequest):
         result = await multi_model_engine.verify_api_key(
             request.provider,
             request.api_key,
-            request.base_url
+            request.base_url,
+            force_refresh=request.force_refresh
         )
         
         if result["valid"]:
@@ -167,7 +171,8 @@ async def fetch_provider_models(request: ProviderVerifyRequest):
         result = await multi_model_engine.verify_api_key(
             request.provider,
             request.api_key,
-            request.base_url
+            request.base_url,
+            force_refresh=request.force_refresh
         )
         
         if result["valid"] and result.get("models"):
@@ -329,6 +334,20 @@ async def chat_completions(request: ChatRequest):
             max_tokens=request.max_tokens
         )
         
+        if request.stream:
+            # 流式输出：按OpenAI SSE格式逐段转发增量文本
+            async def generate():
+                try:
+                    async for delta in response:
+                        yield f"data: {json.dumps({'choices': [{'delta': {'content': delta}}]}, ensure_ascii=False)}\n\n"
+                    logger.info(f"✅ 流式推理完成: {request.provider}/{request.model}")
+                except Exception as e:
+                    logger.error(f"流式聊天补全失败: {e}")
+                    yield f"data: {json.dumps({'error': str(e)}, ensure_ascii=False)}\n\n"
+                yield "data: [DONE]\n\n"
+            
+            return StreamingResponse(generate(), media_type="text/event-stream")
+        
         logger.info(f"✅ 推理完成: {request.provider}/{request.model}")
         
         return response
@@ -504,8 +523,7 @@ async def remove_provider_config(provider: str):
     删除提供商配置
     """
     try:
-        if provider in multi_model_engine.api_keys:
-            del multi_model_engine.api_keys[provider]
+        if multi_model_engine.remove_api_key(provider):
             logger.info(f"✅ 已删除提供商配置: {provider}")
             return {"message": "配置已删除", "provider": provider}
         else:
@@ -603,7 +603,7 @@ async def app_chat_completion(
                 provider=app.ai_provider,
                 model=app.llm_model,
                 messages=[{"role": msg.role, "content": msg.content} for msg in enhanced_messages],
-                stream=request.stream,
+                stream=False,  # 需要完整回答以附带引用与记录日志
                 temperature=request.temperature or app.temperature or 0.7,
                 max_tokens=request.max_tokens or context["app_config"].get("max_tokens", 2000)
             )
@@ -706,7 +706,7 @@ async def app_chat_completion(
                 provider=app.ai_provider,
                 model=app.llm_model,
                 messages=[{"role": msg.role, "content": msg.content} for msg in enhanced_messages],
-                stream=request.stream,
+                stream=False,  # 需要完整回答以附带引用与记录日志
                 temperature=request.temperature or app.temperature,
                 max_tokens=request.max_tokens or context["app_config"].get("max_tokens", 2000)
             )
@@ -103,7 +103,7 @@ def serialize_application(app: Application, include_kb: bool = False, db: Sessio
     }
     
     # 获取完整配置（含默认值）
-    result["full_config"] = app.get_mode_config_with_defaults()
+    result["full_config"] = dict(app.get_mode_config_with_defaults())
     
     # 获取模式描述
     result["mode_description"] = get_mode_description(app.mode)
@@ -18,6 +18,7 @@ from app.models.database import (
     KnowledgeBase as KnowledgeBaseModel
 )
 from app.core.document_processor import DocumentProcessor
+from app.core.semantic_cache import invalidate_answer_caches
 from app.core.config import settings
 
 router = APIRouter()
@@ -103,7 +104,7 @@ async def upload_document(
                     db.commit()
                     logger.info(f"开始处理文档: {file_path}, 分块模式: {chunk_mode}")
                     
-                    processed_result = DocumentProcessor.process_document(Path(file_path), chunk_mode=chunk_mode)
+                    processed_result = await DocumentProcessor.process_document(Path(file_path), chunk_mode=chunk_mode)
                     chunks = processed_result["chunks"]
                     actual_mode = processed_result["metadata"].get("chunk_mode", chunk_mode)
                     logger.info(f"文档处理完成，生成 {len(chunks)} 个文本块（模式: {actual_mode}）")
@@ -240,6 +241,7 @@ async def upload_document(
                     doc.doc_metadata = processed_result["metadata"]
                     doc.processed_at = datetime.utcnow()
                     db.commit()
+                    invalidate_answer_caches()
                     logger.info(f"✅ 文档状态已更新: {file.filename} -> completed ({len(chunks)} chunks)")
                     
                     # 重新查询知识库并更新文档计数
@@ -335,7 +337,7 @@ async def process_document(
         
         # 处理文档
         file_path = Path(doc.original_path)
-        result = DocumentProcessor.process_document(file_path)
+        result = await DocumentProcessor.process_document(file_path)
         
         # 更新记录
         doc.status = "completed"
@@ -419,7 +421,7 @@ async def generate_qa_preview(
             f.write(content)
         
         # 处理文档获取chunks
-        processed_result = DocumentProcessor.process_document(Path(temp_path))
+        processed_result = await DocumentProcessor.process_document(Path(temp_path))
         chunks = processed_result["chunks"][:3]  # 只处理前3个chunk作为预览
         
         # 删除临时文件
@@ -545,7 +547,7 @@ async def get_document_chunks(
         
         logger.info(f"📄 正在加载文档chunks: {doc.filename}")
         # 使用auto模式重新处理，自动识别FAQ格式
-        processed_result = DocumentProcessor.process_document(file_path, chunk_mode="auto")
+        processed_result = await DocumentProcessor.process_document(file_path, chunk_mode="auto")
         chunks = processed_result["chunks"]
         actual_mode = processed_result["metadata"].get("chunk_mode", "standard")
         
@@ -590,6 +592,7 @@ async def delete_document(
     # 删除数据库记录
     db.delete(doc)
     db.commit()
+    invalidate_answer_caches()
     
     return {"message": "文档删除成功"}
 
@@ -12,15 +12,27 @@ import csv
 import io
 from datetime import datetime
 import docx
+import numpy as np
 import PyPDF2
 
 from app.models.database import get_db, FixedQAPair, Application, EmbeddingProvider
 from app.core.embedding_engine import embedding_engine
 from app.core.multi_model_engine import multi_model_engine
+from app.core.hybrid_retrieval_engine import hybrid_retrieval_engine
+from app.core.fixed_qa_matcher import invalidate_matcher
+from app.core.semantic_cache import SemanticAnswerCache, exact_answer_cache
 
 router = APIRouter()
 
 
+def _invalidate_qa_caches(application_id: int):
+    """Q&A变更后清除该应用的所有进程内缓存"""
+    hybrid_retrieval_engine.invalidate_fixed_qa_cache(application_id)
+    invalidate_matcher(application_id)
+    SemanticAnswerCache.invalidate_app(application_id)
+    exact_answer_cache.invalidate_app(application_id)
+
+
 # Pydantic模型
 class FixedQACreate(BaseModel):
     question: str
@@ -153,6 +165,7 @@ async def create_fixed_qa(
     db.add(db_qa)
     db.commit()
     db.refresh(db_qa)
+    _invalidate_qa_caches(application_id)
     
     logger.info(f"✅ 创建固定Q&A: {qa_data.question[:50]}...")
     
@@ -220,6 +233,7 @@ async def create_batch_fixed_qa(
         created_count += 1
     
     db.commit()
+    _invalidate_qa_caches(application_id)
     
     logger.info(f"✅ 批量创建固定Q&A: {created_count}条")
     
@@ -371,6 +385,7 @@ async def update_fixed_qa(
     
     db.commit()
     db.refresh(qa)
+    _invalidate_qa_caches(application_id)
     
     logger.info(f"✅ 更新固定Q&A: {qa_id}")
     
@@ -402,6 +417,7 @@ async def batch_delete_fixed_qa(
     ).delete(synchronize_session=False)
     
     db.commit()
+    _invalidate_qa_caches(application_id)
     
     logger.info(f"✅ 批量删除固定Q&A: {deleted_count}条")
     
@@ -423,6 +439,7 @@ async def delete_all_fixed_qa(
     ).delete(synchronize_session=False)
     
     db.commit()
+    _invalidate_qa_caches(application_id)
     
     logger.info(f"✅ 删除应用{application_id}的所有固定Q&A: {deleted_count}条")
     
@@ -449,6 +466,7 @@ async def delete_fixed_qa(
     
     db.delete(qa)
     db.commit()
+    _invalidate_qa_caches(application_id)
     
     logger.info(f"✅ 删除固定Q&A: {qa_id}")
     
@@ -507,20 +525,32 @@ async def search_fixed_qa(
         logger.error(f"生成查询embedding失败: {e}")
         raise HTTPException(status_code=500, detail=f"生成查询embedding失败: {str(e)}")
     
-    # 计算相似度并排序
+    # 计算相似度并排序：复用检索引擎缓存的行归一化Q&A矩阵，
+    # 查询向量只归一化一次，余弦相似度即一次矩阵-向量点积
+    qa_by_id = {qa.id: qa for qa in qa_pairs}
+    qa_candidates, qa_matrix, _ = hybrid_retrieval_engine.get_fixed_qa_matrix(
+        application_id,
+        [
+            {"id": qa.id, "question": qa.question, "embedding_vector": qa.embedding_vector}
+            for qa in qa_pairs
+        ]
+    )
+    
     matches = []
-    for qa in qa_pairs:
-        if qa.embedding_vector:
-            similarity = embedding_engine.compute_similarity(query_vector, qa.embedding_vector)
-            if similarity >= search_request.threshold:
-                matches.append({
-                    "id": qa.id,
-                    "question": qa.question,
-                    "answer": qa.answer,
-                    "category": qa.category,
-                    "similarity": round(similarity, 4),
-                    "hit_count": qa.hit_count
-                })
+    query_np = np.asarray(query_vector, dtype=np.float32)
+    query_norm = np.linalg.norm(query_np)
+    if qa_matrix is not None and query_norm > 0:
+        similarities = qa_matrix @ (query_np / query_norm)
+        for idx in np.nonzero(similarities >= search_request.threshold)[0]:
+            qa = qa_by_id[qa_candidates[idx]["id"]]
+            matches.append({
+                "id": qa.id,
+                "question": qa.question,
+                "answer": qa.answer,
+                "category": qa.category,
+                "similarity": round(float(similarities[idx]), 4),
+                "hit_count": qa.hit_count
+            })
     
     # 按相似度排序并限制返回数量
     matches.sort(key=lambda x: x["similarity"], reverse=True)
@@ -569,6 +599,7 @@ async def regenerate_embedding(
         qa.embedding_vector = vector
         
         db.commit()
+        _invalidate_qa_caches(application_id)
         
         logger.info(f"✅ 重新生成Q&A embedding: {qa_id}")
         
@@ -16,6 +16,7 @@ from app.models.database import (
     VectorDBProvider
 )
 from app.core.rag_engine import RAGEngine
+from app.core.semantic_cache import invalidate_answer_caches
 from app.core.document_processor import DocumentProcessor
 from pathlib import Path
 
@@ -380,6 +381,7 @@ async def add_texts_to_kb(
             text_records.append(text_record)
         
         db.commit()
+        invalidate_answer_caches()
         
         logger.info(f"✅ 手动添加 {len(request.texts)} 条文本到知识库: {kb.name}")
         
@@ -419,7 +421,7 @@ async def add_document_to_kb(
         # 处理文档（如果还未处理）
         if doc.status != "completed":
             file_path = Path(doc.original_path)
-            result = DocumentProcessor.process_document(file_path)
+            result = await DocumentProcessor.process_document(file_path)
             chunks = result["chunks"]
             
             doc.status = "completed"
@@ -428,7 +430,7 @@ async def add_document_to_kb(
         else:
             # 重新读取并分块
             file_path = Path(doc.original_path)
-            result = DocumentProcessor.process_document(file_path)
+            result = await DocumentProcessor.process_document(file_path)
             chunks = result["chunks"]
         
         # 获取默认 Embedding 提供商
@@ -466,6 +468,7 @@ async def add_document_to_kb(
         ).count()
         
         db.commit()
+        invalidate_answer_caches()
         
         logger.info(f"✅ 文档已添加到知识库: {doc.filename} -> {kb.name}")
         
@@ -702,6 +705,7 @@ async def update_text(
         text.word_count = len(content.split())
         
         db.commit()
+        invalidate_answer_caches()
         db.refresh(text)
         
         logger.info(f"✅ 更新文本: {text_id}, 新向量ID: {text.vector_id}")
@@ -767,6 +771,7 @@ async def delete_text(
         # 从数据库删除
         db.delete(text)
         db.commit()
+        invalidate_answer_caches()
         
         logger.info(f"✅ 删除文本: {text_id}")
         
@@ -954,6 +959,7 @@ async def batch_add_texts(
             text_records.append(text_record)
         
         db.commit()
+        invalidate_answer_caches()
         
         logger.info(f"✅ 批量添加 {len(texts)} 条文本到知识库: {kb.name}")
         
@@ -996,6 +1002,7 @@ async def delete_knowledge_base(
     # 删除数据库记录
     db.delete(kb)
     db.commit()
+    invalidate_answer_caches()
     
     return {"message": "知识库删除成功"}
 
@@ -12,6 +12,7 @@ import httpx
 from datetime import datetime, date
 
 from app.models.database import get_db, SearchProvider
+from app.core.hybrid_retrieval_engine import hybrid_retrieval_engine
 
 router = APIRouter()
 
@@ -467,6 +468,9 @@ async def set_default_provider(provider_id: int, db: Session = Depends(get_db)):
 @router.post("/{provider_id}/reset-usage/")
 async def reset_usage(provider_id: int, db: Session = Depends(get_db)):
     """重置使用量"""
+    # 先写入尚未提交的累计使用量，避免重置后又被旧的增量加回
+    await hybrid_retrieval_engine.flush_search_usage()
+    
     provider = db.query(SearchProvider).filter(SearchProvider.id == provider_id).first()
     
     if not provider:
@@ -136,7 +136,7 @@ async def generate_training_dataset(
         for doc in documents:
             # 处理文档
             file_path = Path(doc.original_path)
-            result = DocumentProcessor.process_document(file_path)
+            result = await DocumentProcessor.process_document(file_path)
             chunks = result["chunks"]
             
             if request.use_openai and qa_generator.client:
@@ -11,6 +11,7 @@ from loguru import logger
 import httpx
 
 from app.models.database import get_db, VectorDBProvider, KnowledgeBase
+from app.core.hybrid_retrieval_engine import hybrid_retrieval_engine
 
 router = APIRouter()
 
@@ -329,6 +330,7 @@ async def create_provider(
     
     db.add(db_provider)
     db.commit()
+    hybrid_retrieval_engine.invalidate_vector_db_cache()
     db.refresh(db_provider)
     
     logger.info(f"✅ 创建向量数据库提供商: {db_provider.name}")
@@ -388,6 +390,7 @@ async def update_provider(
         setattr(db_provider, key, value)
     
     db.commit()
+    hybrid_retrieval_engine.invalidate_vector_db_cache()
     db.refresh(db_provider)
     
     logger.info(f"✅ 更新向量数据库提供商: {db_provider.name}")
@@ -412,6 +415,7 @@ async def delete_provider(provider_id: int, db: Session = Depends(get_db)):
     
     db.delete(db_provider)
     db.commit()
+    hybrid_retrieval_engine.invalidate_vector_db_cache()
     
     logger.info(f"✅ 删除向量数据库提供商: {db_provider.name}")
     
@@ -530,6 +534,7 @@ async def set_default_provider(provider_id: int, db: Session = Depends(get_db)):
     # 设置当前提供商为默认
     provider.is_default = True
     db.commit()
+    hybrid_retrieval_engine.invalidate_vector_db_cache()
     
     logger.info(f"✅ 设置默认向量数据库提供商: {provider.name}")
     
@@ -677,6 +682,7 @@ async def delete_collection(
     
     try:
         from app.core.vector_db_interface import create_vector_db_adapter
+        from app.core.rag_engine import RAGEngine
         
         # 创建适配器
         adapter_config = {
@@ -689,6 +695,7 @@ async def delete_collection(
         
         adapter = create_vector_db_adapter(adapter_config)
         adapter.delete_collection(collection_name)
+        RAGEngine.invalidate_collection_cache(collection_name)
         
         logger.info(f"✅ 删除collection: {collection_name} from {provider.name}")
         
@@ -847,6 +854,7 @@ async def cleanup_orphan_collections(
         
         # 删除所有孤儿collections
         from app.core.vector_db_interface import create_vector_db_adapter
+        from app.core.rag_engine import RAGEngine
         
         adapter_config = {
             "provider_type": provider.provider_type,
@@ -864,6 +872,7 @@ async def cleanup_orphan_collections(
         for col_name in orphan_collections:
             try:
                 adapter.delete_collection(col_name)
+                RAGEngine.invalidate_collection_cache(col_name)
                 deleted.append(col_name)
                 logger.info(f"✅ 清理孤儿collection: {col_name}")
             except Exception as e:
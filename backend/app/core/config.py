@@ -28,6 +28,8 @@ class Settings(BaseSettings):
     SQLITE_DB_PATH: Path = _project_root / "app" / "data" / "forge.db"
     UPLOAD_DIR: Path = _project_root / "app" / "data" / "uploads"
     PROCESSED_DIR: Path = _project_root / "app" / "data" / "processed"
+    QA_INDEX_DIR: Path = _project_root / "app" / "data" / "qa_index"  # 固定Q&A向量索引持久化目录
+    EMBEDDING_CACHE_PATH: Path = _project_root / "app" / "data" / "embedding_cache.db"  # Embedding持久化缓存
     
     # 服务配置
     API_HOST: str = "0.0.0.0"
@@ -52,6 +54,13 @@ class Settings(BaseSettings):
     CHUNK_SIZE: int = 512
     CHUNK_OVERLAP: int = 50
     EMBEDDING_MODEL: str = "BAAI/bge-small-zh-v1.5"
+    EMBEDDING_FP16: bool = True  # GPU上以fp16运行本地Embedding模型
+    EMBEDDING_CACHE_ENABLED: bool = True  # 按文本内容持久化缓存Embedding向量
+    EMBEDDING_CACHE_MAX_ROWS: int = 200000  # 持久化缓存的最大向量条数（超出后按LRU淘汰）
+    EMBEDDING_BATCH_SIZE: int = 256  # 云端Embedding单次请求的文本数（OpenAI上限2048）
+    EMBEDDING_CONCURRENCY: int = 8  # 云端Embedding并发请求数
+    EMBEDDING_UPSERT_BATCH: int = 32  # 远程向量数据库每个写入请求的向量数
+    UPSERT_CONCURRENCY: int = 4  # 远程向量数据库并发写入请求数
     
     # 训练配置
     DEFAULT_LEARNING_RATE: float = 2e-4
@@ -8,9 +8,22 @@ import fitz  # PyMuPDF
 from docx import Document as DocxDocument
 import openpyxl
 from loguru import logger
+import asyncio
+import mmap
 import re
 
 
+# clean_text 使用的预编译正则
+_CONTROL_CHARS_RE = re.compile(r'[\x00-\x08\x0b-\x0c\x0e-\x1f\x7f-\x9f]')
+_MULTI_NEWLINE_RE = re.compile(r'\n{3,}')
+_INLINE_WS_RE = re.compile(r'[ \t]+')
+_WS_RE = re.compile(r'\s+')
+
+# chunk_text 使用的段落分隔符与句子分隔符
+_PARAGRAPH_SPLIT_RE = re.compile(r'\n\s*\n+')
+_SENTENCE_SPLIT_RE = re.compile(r'[。！？\n]+')
+
+
 class DocumentProcessor:
     """文档处理器"""
     
@@ -51,29 +64,39 @@ class DocumentProcessor:
         """处理 Excel 文件"""
         try:
             wb = openpyxl.load_workbook(file_path, read_only=True)
-            text = ""
+            _str = str
+            rows_out = []
+            append = rows_out.append
             for sheet in wb.worksheets:
                 for row in sheet.iter_rows(values_only=True):
-                    row_text = " | ".join([str(cell) if cell else "" for cell in row])
-                    text += row_text + "\n"
+                    append(" | ".join(_str(cell) if cell else "" for cell in row))
             wb.close()
+            text = "\n".join(rows_out)
             return DocumentProcessor.clean_text(text)
         except Exception as e:
             logger.error(f"Excel 处理失败: {e}")
             raise
     
+    @staticmethod
+    def _read_text_mmap(file_path: Path, encoding: str) -> str:
+        """通过内存映射读取文本文件，避免 f.read() 额外的 bytes 缓冲区拷贝"""
+        with open(file_path, "rb") as f:
+            # 空文件无法 mmap
+            if Path(file_path).stat().st_size == 0:
+                return ""
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return str(mm, encoding)
+    
     @staticmethod
     def process_txt(file_path: Path) -> str:
         """处理纯文本文件"""
         try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                text = f.read()
+            text = DocumentProcessor._read_text_mmap(file_path, "utf-8")
             return DocumentProcessor.clean_text(text)
         except UnicodeDecodeError:
             # 尝试其他编码
             try:
-                with open(file_path, "r", encoding="gbk") as f:
-                    text = f.read()
+                text = DocumentProcessor._read_text_mmap(file_path, "gbk")
                 return DocumentProcessor.clean_text(text)
             except Exception as e:
                 logger.error(f"文本文件处理失败: {e}")
@@ -94,19 +117,23 @@ class DocumentProcessor:
             preserve_structure: 是否保留段落结构（用于FAQ等结构化文档）
         """
         # 移除特殊字符
-        text = re.sub(r'[\x00-\x08\x0b-\x0c\x0e-\x1f\x7f-\x9f]', '', text)
+        text = _CONTROL_CHARS_RE.sub('', text)
         
         if preserve_structure:
             # 保留段落结构，只规范化换行
-            text = re.sub(r'\n{3,}', '\n\n', text)  # 多个换行变成两个
-            text = re.sub(r'[ \t]+', ' ', text)  # 只清理行内空格
+            text = _MULTI_NEWLINE_RE.sub('\n\n', text)  # 多个换行变成两个
+            text = _INLINE_WS_RE.sub(' ', text)  # 只清理行内空格
         else:
-            # 标准清洗
-            text = re.sub(r'\s+', ' ', text)
-            text = re.sub(r'\n\s*\n', '\n\n', text)
+            # 标准清洗（所有空白折叠为单个空格，此后不再有换行需要处理）
+            text = _WS_RE.sub(' ', text)
         
         return text.strip()
     
+    @staticmethod
+    def _word_count(text: str) -> int:
+        """估算词数（仅用作分块大小的启发式，避免 split() 产生临时列表）"""
+        return text.count(' ') + 1 if text else 0
+    
     @staticmethod
     def chunk_text_faq(text: str) -> List[str]:
         """
@@ -213,7 +240,7 @@ class DocumentProcessor:
         
         # 模式2：标准段落分块
         # 先按段落分割
-        paragraphs = re.split(r'\n\s*\n+', text)
+        paragraphs = _PARAGRAPH_SPLIT_RE.split(text)
         chunks = []
         current_chunk = ""
         current_words = 0
@@ -223,7 +250,7 @@ class DocumentProcessor:
             if not para:
                 continue
                 
-            para_words = len(para.split())
+            para_words = DocumentProcessor._word_count(para)
             
             # 如果当前段落太大，单独分块
             if para_words > chunk_size * 1.5:
@@ -234,7 +261,7 @@ class DocumentProcessor:
                     current_words = 0
                 
                 # 大段落按句子分块
-                sentences = re.split(r'[。！？\n]+', para)
+                sentences = _SENTENCE_SPLIT_RE.split(para)
                 temp_chunk = ""
                 temp_words = 0
                 
@@ -242,7 +269,7 @@ class DocumentProcessor:
                     sent = sent.strip()
                     if not sent:
                         continue
-                    sent_words = len(sent.split())
+                    sent_words = DocumentProcessor._word_count(sent)
                     
                     if temp_words + sent_words > chunk_size:
                         if temp_chunk:
@@ -273,7 +300,7 @@ class DocumentProcessor:
         # 确保每个chunk不会太小
         final_chunks = []
         for chunk in chunks:
-            if len(chunk.split()) >= 50 or not final_chunks:  # 至少50词
+            if DocumentProcessor._word_count(chunk) >= 50 or not final_chunks:  # 至少50词
                 final_chunks.append(chunk)
             else:
                 # 合并到上一个chunk
@@ -282,10 +309,12 @@ class DocumentProcessor:
         return final_chunks
     
     @classmethod
-    def process_document(cls, file_path: Path, chunk_mode: str = "auto") -> Dict[str, Any]:
+    async def process_document(cls, file_path: Path, chunk_mode: str = "auto") -> Dict[str, Any]:
         """
         处理文档（主入口）
         
+        解析与分块均为同步CPU/IO密集操作，放到线程池中执行，避免阻塞事件循环
+        
         Args:
             file_path: 文档路径
             chunk_mode: 分块模式 ("auto", "faq", "standard")
@@ -317,14 +346,16 @@ class DocumentProcessor:
             raise ValueError(f"不支持的文件类型: {file_ext}")
         
         # 提取文本
-        text = processor(file_path)
+        text = await asyncio.to_thread(processor, file_path)
         
         logger.info(f"📄 文档提取完成: {file_path.name}, 总字符数: {len(text)}")
         logger.info(f"🔧 使用分块模式: {chunk_mode}")
         
         # 智能分块
         from app.core.config import settings
-        chunks = cls.chunk_text(text, settings.CHUNK_SIZE, settings.CHUNK_OVERLAP, mode=chunk_mode)
+        chunks = await asyncio.to_thread(
+            cls.chunk_text, text, settings.CHUNK_SIZE, settings.CHUNK_OVERLAP, mode=chunk_mode
+        )
         
         # 确定实际使用的模式
         actual_mode = "faq" if (chunk_mode in ["auto", "faq"] and chunks and chunks[0].startswith("Q")) else "standard"
@@ -0,0 +1,154 @@
+"""
+Embedding持久化缓存
+按 (提供商, 模型, 地址, 文本) 的内容哈希把向量以float16存入SQLite，重启后仍可命中，
+重复文本无需再次编码或调用云端Embedding API
+"""
+
+from typing import Dict, List, Optional, Tuple
+from pathlib import Path
+from loguru import logger
+import hashlib
+import sqlite3
+import threading
+import time
+import numpy as np
+
+from app.core.config import settings
+
+
+# 单条SQL中IN查询的最大参数个数（SQLite默认上限999）
+_SQL_BATCH_SIZE = 500
+
+# 命中条目的访问时间至少间隔多久才刷新（秒），避免每次读取都产生写事务
+_ACCESS_UPDATE_INTERVAL = 600
+
+
+class EmbeddingCache:
+    """SQLite持久化的Embedding缓存（键为blake2b内容摘要，值为float16向量）
+
+    超过 max_rows 条时按最近访问时间淘汰最久未使用的条目（保留 max_rows 的90%，避免每次写入都触发清理）。
+    """
+
+    def __init__(self, db_path: Path, max_rows: int):
+        self.db_path = Path(db_path)
+        self.max_rows = max_rows
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()  # 缓存在线程池中读写，共享同一连接
+        self._disabled = False
+        self._row_count = 0  # 近似行数（INSERT OR REPLACE 覆盖时偏大，清理时重新统计）
+
+    @staticmethod
+    def make_key(provider_key: Tuple, text: str) -> bytes:
+        """缓存键：提供商标识（类型、模型、地址）+ 文本的blake2b摘要"""
+        digest = hashlib.blake2b(digest_size=16)
+        for part in provider_key:
+            digest.update(str(part or "").encode("utf-8"))
+            digest.update(b"\x00")
+        digest.update(text.encode("utf-8"))
+        return digest.digest()
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        """惰性打开数据库（失败后禁用缓存，不影响向量化）"""
+        if self._conn is None and not self._disabled:
+            try:
+                self.db_path.parent.mkdir(parents=True, exist_ok=True)
+                conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings "
+                    "(key BLOB PRIMARY KEY, vector BLOB NOT NULL, accessed_at REAL NOT NULL DEFAULT 0)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_accessed_at ON embeddings (accessed_at)")
+                conn.commit()
+                self._row_count = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+                self._conn = conn
+                logger.info(f"✅ Embedding持久化缓存已打开: {self.db_path}")
+            except Exception as e:
+                self._disabled = True
+                logger.warning(f"⚠️ Embedding持久化缓存不可用，已禁用: {e}")
+        return self._conn
+
+    def get_many(self, keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+        """批量读取，返回命中的 键 -> float32向量"""
+        if not keys:
+            return {}
+
+        found: Dict[bytes, np.ndarray] = {}
+        stale_keys: List[bytes] = []
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return found
+            try:
+                for start in range(0, len(keys), _SQL_BATCH_SIZE):
+                    batch = keys[start:start + _SQL_BATCH_SIZE]
+                    rows = conn.execute(
+                        f"SELECT key, vector, accessed_at FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                        batch
+                    ).fetchall()
+                    for key, blob, accessed_at in rows:
+                        found[key] = np.frombuffer(blob, dtype=np.float16).astype(np.float32)
+                        if accessed_at < now - _ACCESS_UPDATE_INTERVAL:
+                            stale_keys.append(key)
+                if stale_keys:
+                    # 刷新命中条目的访问时间（LRU淘汰依据，近期已刷新过的条目跳过）
+                    with conn:
+                        for start in range(0, len(stale_keys), _SQL_BATCH_SIZE):
+                            batch = stale_keys[start:start + _SQL_BATCH_SIZE]
+                            conn.execute(
+                                f"UPDATE embeddings SET accessed_at = ? WHERE key IN ({','.join('?' * len(batch))})",
+                                [now, *batch]
+                            )
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️ 读取Embedding缓存失败: {e}")
+        return found
+
+    def put_many(self, pairs: List[Tuple[bytes, List[float]]]):
+        """批量写入（向量以float16存储，磁盘占用与读取IO减半）"""
+        if not pairs:
+            return
+
+        now = time.time()
+        rows = [(key, np.asarray(vector, dtype=np.float16).tobytes(), now) for key, vector in pairs]
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return
+            try:
+                with conn:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO embeddings (key, vector, accessed_at) VALUES (?, ?, ?)", rows
+                    )
+                self._row_count += len(rows)
+                if self._row_count > self.max_rows:
+                    self._prune(conn)
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️ 写入Embedding缓存失败: {e}")
+
+    def _prune(self, conn: sqlite3.Connection):
+        """按最近访问时间淘汰最久未使用的条目，保留 max_rows 的90%（调用方持有锁）"""
+        self._row_count = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = self._row_count - int(self.max_rows * 0.9)
+        if self._row_count <= self.max_rows or excess <= 0:
+            return
+        with conn:
+            conn.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY accessed_at LIMIT ?)",
+                (excess,)
+            )
+        self._row_count -= excess
+        logger.info(f"🧹 Embedding持久化缓存淘汰 {excess} 条最久未使用的向量")
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# 全局Embedding持久化缓存实例
+embedding_cache = EmbeddingCache(settings.EMBEDDING_CACHE_PATH, settings.EMBEDDING_CACHE_MAX_ROWS)
@@ -2,19 +2,31 @@
 Embedding向量化引擎 - 支持多种提供商
 """
 
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Union
 from loguru import logger
+from collections import OrderedDict
+import asyncio
 import httpx
+import math
 import numpy as np
 from sentence_transformers import SentenceTransformer
+from app.core.config import settings
+from app.core.embedding_cache import embedding_cache
 
 
 class EmbeddingEngine:
     """统一的Embedding向量化引擎"""
     
+    # 查询向量LRU缓存容量
+    QUERY_CACHE_SIZE = 1024
+    # 本地模型编码批大小（GPU上填满张量核心，同时控制显存占用）
+    LOCAL_BATCH_SIZE = 64
+    
     def __init__(self):
         self._local_models: Dict[str, SentenceTransformer] = {}
         self._default_provider: Optional[Dict[str, Any]] = None
+        # 查询向量缓存: (provider_type, model_name, base_url, text) -> 向量
+        self._query_cache: "OrderedDict[tuple, List[float]]" = OrderedDict()
     
     def set_default_provider(self, provider_config: Dict[str, Any]):
         """设置默认Embedding提供商"""
@@ -25,10 +37,24 @@ class EmbeddingEngine:
         """获取或加载本地模型（延迟加载+缓存）"""
         if model_name not in self._local_models:
             logger.info(f"正在加载本地Embedding模型: {model_name}")
-            self._local_models[model_name] = SentenceTransformer(model_name)
+            try:
+                # 优先使用PyTorch SDPA融合注意力（GPU上可调度FlashAttention内核）
+                model = SentenceTransformer(model_name, model_kwargs={"attn_implementation": "sdpa"})
+            except (TypeError, ValueError, ImportError) as e:
+                logger.info(f"模型不支持SDPA注意力，使用默认实现: {e}")
+                model = SentenceTransformer(model_name)
+            # GPU上以fp16推理：显存与带宽减半、编码吞吐提升，余弦检索精度几乎无损
+            if settings.EMBEDDING_FP16 and model.device.type == "cuda":
+                model.half()
+                logger.info(f"⚡ 本地Embedding模型启用fp16推理: {model_name}")
+            self._local_models[model_name] = model
             logger.info(f"✅ 本地Embedding模型加载完成: {model_name}")
         return self._local_models[model_name]
     
+    def get_loaded_local_model(self, model_name: str) -> Optional[SentenceTransformer]:
+        """获取已加载的本地模型（未加载时返回None，不触发加载）"""
+        return self._local_models.get(model_name)
+    
     async def embed_texts(
         self,
         texts: List[str],
@@ -52,14 +78,82 @@ class EmbeddingEngine:
         provider_type = config.get("provider_type")
         
         if provider_type == "openai":
-            return await self._embed_openai(texts, config)
+            return await self._embed_batched(self._embed_openai, texts, config)
         elif provider_type == "local":
-            return self._embed_local(texts, config)
+            # 本地模型编码在线程池中执行（torch推理释放GIL），不阻塞事件循环
+            return await asyncio.to_thread(self._embed_local, texts, config)
         elif provider_type == "custom":
-            return await self._embed_custom(texts, config)
+            return await self._embed_batched(self._embed_custom, texts, config)
         else:
             raise ValueError(f"不支持的提供商类型: {provider_type}")
     
+    async def _embed_batched(self, embed_fn, texts: List[str], config: Dict[str, Any]) -> List[List[float]]:
+        """
+        将文本按 EMBEDDING_BATCH_SIZE 切分为多个请求并发调用云端API（受 EMBEDDING_CONCURRENCY 限制）
+        
+        单次请求不超过提供商的输入条数上限（OpenAI为2048），大批量上传时多个请求同时进行
+        """
+        batch_size = settings.EMBEDDING_BATCH_SIZE
+        if len(texts) <= batch_size:
+            return await embed_fn(texts, config)
+        
+        semaphore = asyncio.Semaphore(settings.EMBEDDING_CONCURRENCY)
+        
+        async def embed_batch(batch: List[str]) -> List[List[float]]:
+            async with semaphore:
+                return await embed_fn(batch, config)
+        
+        results = await asyncio.gather(*[
+            embed_batch(texts[start:start + batch_size])
+            for start in range(0, len(texts), batch_size)
+        ])
+        return [vector for batch_vectors in results for vector in batch_vectors]
+    
+    async def embed_texts_cached(
+        self,
+        texts: List[str],
+        provider_config: Optional[Dict[str, Any]] = None
+    ) -> List[List[float]]:
+        """
+        向量化文本列表（先按内容去重，再经持久化缓存，只对未缓存过的文本调用提供商）
+        
+        Args:
+            texts: 文本列表
+            provider_config: 提供商配置，如果为None则使用默认提供商
+        
+        Returns:
+            与 texts 一一对应的向量列表
+        """
+        config = provider_config or self._default_provider
+        
+        if not config or not texts:
+            return await self.embed_texts(texts, config)
+        
+        if not settings.EMBEDDING_CACHE_ENABLED:
+            unique_texts = list(dict.fromkeys(texts))
+            if len(unique_texts) == len(texts):
+                return await self.embed_texts(texts, config)
+            by_text = dict(zip(unique_texts, await self.embed_texts(unique_texts, config)))
+            return [by_text[text] for text in texts]
+        
+        provider_key = (config.get("provider_type"), config.get("model_name"), config.get("base_url"))
+        keys = [embedding_cache.make_key(provider_key, text) for text in texts]
+        unique = dict(zip(keys, texts))
+        
+        vectors: Dict[bytes, Any] = await asyncio.to_thread(embedding_cache.get_many, list(unique))
+        missing = [key for key in unique if key not in vectors]
+        if missing:
+            embedded = await self.embed_texts([unique[key] for key in missing], config)
+            await asyncio.to_thread(embedding_cache.put_many, list(zip(missing, embedded)))
+            vectors.update(zip(missing, embedded))
+        if len(missing) < len(unique):
+            logger.info(f"🎯 Embedding缓存命中: {len(unique) - len(missing)}/{len(unique)}")
+        
+        return [
+            vector.tolist() if isinstance(vector, np.ndarray) else vector
+            for vector in (vectors[key] for key in keys)
+        ]
+    
     async def embed_text(
         self,
         text: str,
@@ -69,6 +163,47 @@ class EmbeddingEngine:
         vectors = await self.embed_texts([text], provider_config)
         return vectors[0]
     
+    async def embed_queries(
+        self,
+        texts: List[str],
+        provider_config: Optional[Dict[str, Any]] = None
+    ) -> List[List[float]]:
+        """
+        向量化查询文本（带进程内LRU缓存）
+        
+        未命中缓存的文本合并为一次批量请求（并经持久化缓存），重复的热点查询无需再调用提供商
+        """
+        config = provider_config or self._default_provider
+        
+        if not config:
+            raise ValueError("未配置Embedding提供商，请先设置默认提供商或传入provider_config")
+        
+        provider_key = (config.get("provider_type"), config.get("model_name"), config.get("base_url"))
+        keys = [provider_key + (text,) for text in texts]
+        
+        # 本次调用的结果收集在局部字典中：await 期间其他协程可能淘汰共享缓存中的条目
+        found: Dict[tuple, List[float]] = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            vector = self._query_cache.get(key)
+            if vector is None:
+                missing.append(key)
+            else:
+                self._query_cache.move_to_end(key)
+                found[key] = vector
+        
+        if missing:
+            vectors = await self.embed_texts_cached([key[-1] for key in missing], config)
+            for key, vector in zip(missing, vectors):
+                found[key] = vector
+                self._query_cache[key] = vector
+                self._query_cache.move_to_end(key)
+            
+            while len(self._query_cache) > self.QUERY_CACHE_SIZE:
+                self._query_cache.popitem(last=False)
+        
+        return [found[key] for key in keys]
+    
     async def _embed_openai(
         self,
         texts: List[str],
@@ -122,8 +257,14 @@ class EmbeddingEngine:
         
         try:
             # sentence-transformers返回numpy数组
-            embeddings = model.encode(texts, convert_to_numpy=True)
-            # 转换为列表格式
+            embeddings = model.encode(
+                texts,
+                batch_size=self.LOCAL_BATCH_SIZE,
+                show_progress_bar=False,
+                convert_to_numpy=True
+            )
+            # 转换为列表格式：向量库接口约定 List[List[float]]（chromadb 0.4.x 的校验只接受list，
+            # Qdrant的PointStruct同样需要list），ndarray.tolist() 在C层一次完成转换
             embeddings_list = embeddings.tolist()
             logger.info(f"✅ 本地Embedding完成: {len(texts)}个文本")
             return embeddings_list
@@ -186,23 +327,54 @@ class EmbeddingEngine:
     
     def compute_similarity(
         self,
-        vec1: List[float],
-        vec2: List[float]
+        vec1: Union[List[float], np.ndarray],
+        vec2: Union[List[float], np.ndarray]
     ) -> float:
         """计算余弦相似度"""
-        vec1_np = np.array(vec1)
-        vec2_np = np.array(vec2)
+        # asarray 避免对已是 float32 ndarray 的输入再做拷贝
+        vec1_np = np.asarray(vec1, dtype=np.float32)
+        vec2_np = np.asarray(vec2, dtype=np.float32)
         
-        # 余弦相似度
-        dot_product = np.dot(vec1_np, vec2_np)
-        norm1 = np.linalg.norm(vec1_np)
-        norm2 = np.linalg.norm(vec2_np)
+        # 余弦相似度：einsum 单次遍历求点积/平方和，不产生临时数组
+        dot_product = float(np.einsum('i,i->', vec1_np, vec2_np))
+        norm1 = math.sqrt(float(np.einsum('i,i->', vec1_np, vec1_np)))
+        norm2 = math.sqrt(float(np.einsum('i,i->', vec2_np, vec2_np)))
         
         if norm1 == 0 or norm2 == 0:
             return 0.0
         
-        similarity = dot_product / (norm1 * norm2)
-        return float(similarity)
+        return dot_product / (norm1 * norm2)
+    
+    def compute_similarity_matrix(
+        self,
+        query_vec: Union[List[float], np.ndarray],
+        matrix: Union[List[List[float]], np.ndarray]
+    ) -> np.ndarray:
+        """
+        批量计算查询向量与矩阵中每一行的余弦相似度（单次 BLAS 矩阵乘法）
+        
+        Args:
+            query_vec: 查询向量 (D,)
+            matrix: 候选向量矩阵 (N, D)
+        
+        Returns:
+            相似度数组 (N,)，零向量对应的相似度为0
+        """
+        query_np = np.asarray(query_vec, dtype=np.float32)
+        matrix_np = np.asarray(matrix, dtype=np.float32)
+        if matrix_np.size == 0:
+            return np.zeros(0, dtype=np.float32)
+        
+        query_norm = math.sqrt(float(np.einsum('i,i->', query_np, query_np)))
+        if query_norm == 0:
+            return np.zeros(matrix_np.shape[0], dtype=np.float32)
+        
+        row_norms = np.sqrt(np.einsum('ij,ij->i', matrix_np, matrix_np))
+        dots = matrix_np @ query_np
+        with np.errstate(divide='ignore', invalid='ignore'):
+            similarities = dots / (row_norms * query_norm)
+        similarities[row_norms == 0] = 0.0
+        return similarities
     
     def get_dimension(self, provider_config: Dict[str, Any]) -> int:
         """获取向量维度"""
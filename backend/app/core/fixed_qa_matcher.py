@@ -3,51 +3,435 @@
 用于精确匹配和相似问题推荐
 """
 
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Any, Tuple
+from collections import OrderedDict
 from loguru import logger
 from sqlalchemy.orm import Session
 import asyncio
+import hashlib
+import os
+import threading
+import numpy as np
+
+from app.core.embedding_engine import embedding_engine
+
+try:
+    import faiss  # 可选依赖：Q&A数量较大时使用HNSW近似检索
+except ImportError:
+    faiss = None
+
+try:
+    import simsimd  # 可选依赖：SIMD余弦相似度内核（AVX-512/NEON）
+except ImportError:
+    simsimd = None
+
+
+# 超过该数量的Q&A才构建HNSW索引，小规模时精确矩阵乘法更快
+HNSW_MIN_SIZE = 1000
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+
+# 超大规模Q&A使用IVF+PQ压缩索引，近似召回后用原始向量精确重排
+IVFPQ_MIN_SIZE = 5000
+IVFPQ_FACTORY = "IVF256,PQ16"
+IVFPQ_NPROBE = 8
+IVFPQ_RERANK_K = 50
+
+# 精确检索时超过该数量且有SimSIMD时，先用int8向量粗排再用float32重排
+INT8_MIN_SIZE = 1000
+INT8_RERANK_K = 50
+
+# 进程内按应用复用的匹配器数量上限（LRU）
+MATCHER_CACHE_SIZE = 512
+
+
+def _cosine_scores(matrix: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """计算查询与矩阵每行的余弦相似度（两者均已归一化）"""
+    if simsimd is not None:
+        return 1.0 - np.asarray(simsimd.cdist(query[None, :], matrix, metric="cosine"), dtype=np.float32)[0]
+    return matrix @ query
+
+
+def _quantize_int8(vectors: np.ndarray) -> np.ndarray:
+    """将归一化向量量化为int8（每维乘127后取整）"""
+    return np.ascontiguousarray(np.clip(np.rint(vectors * 127), -127, 127), dtype=np.int8)
+
+
+def _content_signature(rows) -> str:
+    """Q&A内容摘要（ID、问题文本与更新时间），问题被修改或向量重新生成后缓存文件名随之变化
+
+    重新生成向量时ORM会刷新 updated_at，无需读取向量列即可发现变化（缓存路径只查询文本列）。
+    """
+    digest = hashlib.blake2b(digest_size=8)
+    for row in rows:
+        digest.update(f"{row.id}\x00{row.question}\x00{row.updated_at}\x00".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _matrix_cache_paths(app_id: int, signature: str):
+    """归一化向量矩阵与对应Q&A ID的.npy缓存路径（文件名包含内容摘要）"""
+    from app.core.config import settings
+    return (
+        settings.QA_INDEX_DIR / f"{app_id}.{signature}.vectors.npy",
+        settings.QA_INDEX_DIR / f"{app_id}.{signature}.ids.npy"
+    )
+
+
+def _remove_matrix_cache(app_id: int, keep_signature: Optional[str] = None):
+    """删除应用的向量缓存文件（可保留指定摘要的文件）"""
+    from app.core.config import settings
+    if not settings.QA_INDEX_DIR.exists():
+        return
+    for path in settings.QA_INDEX_DIR.glob(f"{app_id}.*.npy"):
+        if keep_signature is None or not path.name.startswith(f"{app_id}.{keep_signature}."):
+            path.unlink(missing_ok=True)
+
+
+def _remove_ivfpq_index(app_id: int):
+    """删除应用持久化的IVF+PQ索引文件"""
+    from app.core.config import settings
+    if not settings.QA_INDEX_DIR.exists():
+        return
+    for path in settings.QA_INDEX_DIR.glob(f"{app_id}_*.ivfpq.index"):
+        path.unlink(missing_ok=True)
 
 
 class FixedQAMatcher:
     """固定Q&A匹配器"""
     
-    def __init__(self, app_id: int, db: Session = None):
+    def __init__(
+        self,
+        app_id: int,
+        db: Session = None,
+        embedding_provider_config: Optional[Dict[str, Any]] = None
+    ):
         """初始化匹配器
         
         Args:
             app_id: 应用ID
             db: 数据库会话（可选）
+            embedding_provider_config: Embedding提供商配置（可选，默认读取数据库中的默认提供商）
         """
         self.app_id = app_id
         self.db = db
+        self.embedding_provider_config = embedding_provider_config
+        
+        # 索引（延迟构建）
+        self._loaded = False
+        self._records: List[Dict[str, Any]] = []
+        self._matrix: Optional[np.ndarray] = None  # (N, D) 归一化float32矩阵
+        self._matrix_i8: Optional[np.ndarray] = None  # (N, D) int8量化矩阵（粗排用，可选）
+        self._index = None  # faiss HNSW / IVF+PQ 索引（可选）
+        self._rerank = False  # 索引为有损压缩时需精确重排
+        self._load_lock: Optional[asyncio.Lock] = None  # 首次在事件循环中使用时创建
+        self._build_lock = threading.Lock()  # 串行化线程池中并发的构建
+    
+    def _load_qa_pairs(self, db: Session) -> List[Any]:
+        """读取应用下所有已激活且有向量的Q&A"""
+        from app.models.database import FixedQAPair
+        return db.query(FixedQAPair).filter(
+            FixedQAPair.application_id == self.app_id,
+            FixedQAPair.is_active == True,
+            FixedQAPair.embedding_vector.isnot(None)
+        ).all()
+    
+    def _load_cached_matrix(self, db: Session) -> Optional[Tuple[List[Any], np.ndarray]]:
+        """以内存映射方式读取缓存的向量矩阵，数据库只查询文本列
+        
+        缓存文件名包含当前Q&A内容摘要，问题或向量被修改、ID集合不一致时返回None（需要重建）。
+        """
+        from app.models.database import FixedQAPair
+        
+        rows = db.query(
+            FixedQAPair.id,
+            FixedQAPair.question,
+            FixedQAPair.answer,
+            FixedQAPair.category,
+            FixedQAPair.priority,
+            FixedQAPair.updated_at
+        ).filter(
+            FixedQAPair.application_id == self.app_id,
+            FixedQAPair.is_active == True,
+            FixedQAPair.embedding_vector.isnot(None)
+        ).all()
+        
+        vectors_path, ids_path = _matrix_cache_paths(self.app_id, _content_signature(rows))
+        if not (vectors_path.exists() and ids_path.exists()):
+            return None
+        try:
+            ids = np.load(ids_path)
+            matrix = np.load(vectors_path, mmap_mode="r")
+        except Exception as e:
+            logger.warning(f"⚠️  固定Q&A向量缓存读取失败，重新构建: {e}")
+            return None
+        
+        rows_by_id = {row.id: row for row in rows}
+        if len(rows) != len(ids) or matrix.shape[0] != len(ids) or not all(int(i) in rows_by_id for i in ids):
+            return None
+        return [rows_by_id[int(i)] for i in ids], matrix
+    
+    def _save_cached_matrix(self, qa_pairs: List[Any], matrix: np.ndarray):
+        """持久化归一化向量矩阵（先写临时文件再原子替换，多进程安全）"""
+        signature = _content_signature(qa_pairs)
+        qa_ids = [qa.id for qa in qa_pairs]
+        vectors_path, ids_path = _matrix_cache_paths(self.app_id, signature)
+        try:
+            vectors_path.parent.mkdir(parents=True, exist_ok=True)
+            _remove_matrix_cache(self.app_id, keep_signature=signature)
+            for path, array in ((ids_path, np.asarray(qa_ids, dtype=np.int64)), (vectors_path, matrix)):
+                tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+                with open(tmp_path, "wb") as f:
+                    np.save(f, array)
+                os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"⚠️  固定Q&A向量缓存写入失败: {e}")
+    
+    def _load_default_provider_config(self, db: Session) -> Optional[Dict[str, Any]]:
+        """读取默认Embedding提供商配置"""
+        from app.models.database import EmbeddingProvider
+        provider = db.query(EmbeddingProvider).filter(
+            EmbeddingProvider.is_default == True
+        ).first()
+        if not provider:
+            return None
+        return {
+            "provider_type": provider.provider_type,
+            "model_name": provider.model_name,
+            "api_key": provider.api_key,
+            "base_url": provider.base_url
+        }
+    
+    def _build_index(self):
+        """从数据库加载Q&A并构建向量索引（加锁，已构建时直接返回）"""
+        with self._build_lock:
+            if not self._loaded:
+                self._build_index_locked()
+    
+    def _build_index_locked(self):
+        """构建索引：先在局部变量中完成，全部赋值后最后设置 _loaded，并发读取方不会看到半成品"""
+        from app.models.database import SessionLocal
+        
+        db = self.db or SessionLocal()
+        try:
+            cached = self._load_cached_matrix(db)
+            qa_pairs = cached[0] if cached else self._load_qa_pairs(db)
+            if self.embedding_provider_config is None:
+                self.embedding_provider_config = self._load_default_provider_config(db)
+        finally:
+            if self.db is None:
+                db.close()
+        
+        records = [
+            {
+                "id": qa.id,
+                "question": qa.question,
+                "answer": qa.answer,
+                "category": qa.category,
+                "priority": qa.priority or 0
+            }
+            for qa in qa_pairs
+        ]
+        
+        matrix = None
+        matrix_i8 = None
+        index = None
+        rerank = False
+        if cached:
+            matrix = cached[1]
+        elif qa_pairs:
+            raw = np.asarray([qa.embedding_vector for qa in qa_pairs], dtype=np.float32)
+            norms = np.linalg.norm(raw, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            # 预先归一化并保证float32 C连续，SIMD内核可直接使用
+            matrix = np.ascontiguousarray(raw / norms, dtype=np.float32)
+            self._save_cached_matrix(qa_pairs, matrix)
+        
+        if matrix is not None:
+            dim = matrix.shape[1]
+            if faiss is not None and len(records) >= IVFPQ_MIN_SIZE and dim % 16 == 0:
+                index = self._load_or_build_ivfpq_index([qa.id for qa in qa_pairs], matrix)
+                rerank = True
+            elif faiss is not None and len(records) >= HNSW_MIN_SIZE:
+                index = faiss.IndexHNSWFlat(dim, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+                index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+                index.hnsw.efSearch = HNSW_EF_SEARCH
+                index.add(matrix)
+                logger.info(f"🧭 固定Q&A HNSW索引构建完成: 应用{self.app_id}, {len(records)}条")
+            elif simsimd is not None and len(records) >= INT8_MIN_SIZE:
+                # int8点积只有SimSIMD内核才快（numpy整数矩阵乘法不走BLAS）
+                matrix_i8 = _quantize_int8(matrix)
+        
+        self._records = records
+        self._matrix = matrix
+        self._matrix_i8 = matrix_i8
+        self._index = index
+        self._rerank = rerank
+        self._loaded = True
+    
+    def _load_or_build_ivfpq_index(self, qa_ids: List[int], matrix: np.ndarray):
+        """加载或训练IVF+PQ索引
+        
+        索引文件名包含Q&A ID与向量内容的摘要，向量变化后自动重建；
+        以内存映射方式加载，多个worker进程可共享同一份索引内存。
+        """
+        from app.core.config import settings
+        
+        digest = hashlib.md5(np.asarray(qa_ids, dtype=np.int64).tobytes())
+        digest.update(matrix.tobytes())
+        index_dir = settings.QA_INDEX_DIR
+        path = index_dir / f"{self.app_id}_{digest.hexdigest()[:16]}.ivfpq.index"
+        
+        if path.exists():
+            try:
+                index = faiss.read_index(str(path), faiss.IO_FLAG_MMAP)
+                index.nprobe = IVFPQ_NPROBE
+                return index
+            except Exception as e:
+                logger.warning(f"⚠️  固定Q&A IVF+PQ索引加载失败，重新构建: {e}")
+        
+        index = faiss.index_factory(matrix.shape[1], IVFPQ_FACTORY, faiss.METRIC_INNER_PRODUCT)
+        index.train(matrix)
+        index.add(matrix)
+        index.nprobe = IVFPQ_NPROBE
+        logger.info(f"🧭 固定Q&A IVF+PQ索引构建完成: 应用{self.app_id}, {len(qa_ids)}条")
+        
+        try:
+            index_dir.mkdir(parents=True, exist_ok=True)
+            _remove_ivfpq_index(self.app_id)
+            faiss.write_index(index, str(path))
+        except Exception as e:
+            logger.warning(f"⚠️  固定Q&A IVF+PQ索引持久化失败: {e}")
+        return index
+    
+    async def ensure_loaded(self):
+        """在线程池中构建索引，避免数据库读取与索引训练阻塞事件循环"""
+        if self._loaded:
+            return
+        if self._load_lock is None:
+            self._load_lock = asyncio.Lock()
+        async with self._load_lock:
+            if not self._loaded:
+                await asyncio.to_thread(self._build_index)
+    
+    async def embed_query(self, query: str) -> Optional[np.ndarray]:
+        """向量化并归一化查询，可在多次检索与语义缓存之间复用"""
+        await self.ensure_loaded()
+        
+        if not self.embedding_provider_config:
+            return None
+        
+        # 走查询向量缓存：同一提供商下混合检索引擎对同一查询的向量化可直接命中
+        query_vector = (await embedding_engine.embed_queries([query], self.embedding_provider_config))[0]
+        query_np = np.asarray(query_vector, dtype=np.float32)
+        query_norm = np.linalg.norm(query_np)
+        if query_norm == 0:
+            return None
+        return query_np / query_norm
+    
+    async def _search(
+        self,
+        query: str,
+        top_k: int,
+        query_vector: Optional[np.ndarray] = None
+    ) -> List[Tuple[int, float]]:
+        """向量检索，返回 [(记录下标, 余弦相似度)]，按相似度降序"""
+        await self.ensure_loaded()
+        
+        if self._matrix is None:
+            return []
+        
+        query_np = query_vector if query_vector is not None else await self.embed_query(query)
+        if query_np is None:
+            return []
+        
+        top_k = min(top_k, len(self._records))
+        
+        if self._index is not None and self._rerank:
+            # IVF+PQ 近似召回，再用归一化原始向量精确打分重排
+            _, indices = self._index.search(query_np[None, :], max(top_k, IVFPQ_RERANK_K))
+            candidates = indices[0][indices[0] >= 0]
+            scores = self._matrix[candidates] @ query_np
+            order = np.argsort(-scores)[:top_k]
+            return [(int(candidates[i]), float(scores[i])) for i in order]
+        
+        if self._index is not None:
+            scores, indices = self._index.search(query_np[None, :], top_k)
+            return [
+                (int(i), float(s))
+                for i, s in zip(indices[0], scores[0])
+                if i >= 0
+            ]
+        
+        query_np = np.ascontiguousarray(query_np, dtype=np.float32)
         
+        if self._matrix_i8 is not None:
+            # int8粗排取候选，再用float32精确重排
+            coarse = 1.0 - np.asarray(
+                simsimd.cdist(_quantize_int8(query_np)[None, :], self._matrix_i8, metric="cosine"),
+                dtype=np.float32
+            )[0]
+            k = min(max(top_k, INT8_RERANK_K), len(coarse))
+            candidates = np.argpartition(-coarse, k - 1)[:k] if k < len(coarse) else np.arange(len(coarse))
+            scores = self._matrix[candidates] @ query_np
+            order = np.argsort(-scores)[:top_k]
+            return [(int(candidates[i]), float(scores[i])) for i in order]
+        
+        # 精确检索：一次余弦打分 + argpartition 取top-k
+        scores = _cosine_scores(self._matrix, query_np)
+        if top_k < len(scores):
+            candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+        else:
+            candidates = np.arange(len(scores))
+        candidates = candidates[np.argsort(-scores[candidates])]
+        return [(int(i), float(scores[i])) for i in candidates]
+    
+    def _to_match(self, idx: int, score: float) -> Dict:
+        """构建匹配结果字典"""
+        match = dict(self._records[idx])
+        match["confidence"] = score
+        return match
+    
+    async def search_all(
+        self,
+        query: str,
+        top_k: int = 8,
+        query_vector: Optional[np.ndarray] = None
+    ) -> List[Dict]:
+        """一次检索返回top-k个Q&A（按相似度降序，不做阈值过滤）
+        
+        同一查询需要多种阈值/数量的视图时，检索一次后在本地切片过滤即可。
+        """
+        hits = await self._search(query, top_k=top_k, query_vector=query_vector)
+        return [self._to_match(idx, score) for idx, score in hits]
+    
     async def find_exact_match(
         self,
         query: str,
-        threshold: float = 0.85
+        threshold: float = 0.85,
+        query_vector: Optional[np.ndarray] = None
     ) -> Optional[Dict]:
         """查找精确匹配的Q&A
         
         Args:
             query: 查询文本
             threshold: 匹配阈值
-            
+            query_vector: 已归一化的查询向量（可选，避免重复向量化）
+        
         Returns:
             匹配的Q&A字典，如果没有匹配则返回None
         """
-        # TODO: 实现精确匹配逻辑
-        # 1. 使用embedding向量计算相似度
-        # 2. 或使用关键词匹配
-        # 3. 返回置信度最高且超过阈值的结果
-        
+        hits = await self._search(query, top_k=1, query_vector=query_vector)
+        if hits and hits[0][1] >= threshold:
+            return self._to_match(*hits[0])
         return None
     
     async def find_similar_questions(
         self,
         query: str,
         top_k: int = 5,
-        threshold: float = 0.65
+        threshold: float = 0.65,
+        query_vector: Optional[np.ndarray] = None
     ) -> List[Dict]:
         """查找相似问题
         
@@ -55,14 +439,34 @@ class FixedQAMatcher:
             query: 查询文本
             top_k: 返回top-k个结果
             threshold: 最低相似度阈值
-            
+            query_vector: 已归一化的查询向量（可选，避免重复向量化）
+        
         Returns:
             相似问题列表
         """
-        # TODO: 实现相似问题推荐逻辑
-        # 1. 计算所有Q&A的相似度
-        # 2. 按相似度排序
-        # 3. 返回top-k个且超过阈值的结果
-        
-        return []
+        hits = await self._search(query, top_k=top_k, query_vector=query_vector)
+        return [self._to_match(idx, score) for idx, score in hits if score >= threshold]
+
+
+_matchers: "OrderedDict[int, FixedQAMatcher]" = OrderedDict()
+
+
+def get_matcher(app_id: int) -> FixedQAMatcher:
+    """获取应用的共享匹配器（跨请求复用已构建的索引）"""
+    matcher = _matchers.get(app_id)
+    if matcher is None:
+        matcher = FixedQAMatcher(app_id)
+        _matchers[app_id] = matcher
+        if len(_matchers) > MATCHER_CACHE_SIZE:
+            _matchers.popitem(last=False)
+    else:
+        _matchers.move_to_end(app_id)
+    return matcher
+
+
+def invalidate_matcher(app_id: int):
+    """Q&A变更后丢弃应用的匹配器、向量缓存与IVF+PQ索引文件，下次请求重新构建索引"""
+    _matchers.pop(app_id, None)
+    _remove_matrix_cache(app_id)
+    _remove_ivfpq_index(app_id)
 
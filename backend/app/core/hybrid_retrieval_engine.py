@@ -3,15 +3,177 @@
 支持固定Q&A、向量检索、实时搜索的多源融合
 """
 
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, TYPE_CHECKING
 from loguru import logger
-from datetime import datetime
+from datetime import datetime, date
+from collections import defaultdict, OrderedDict
+from functools import lru_cache
+from bisect import bisect_right
+from itertools import islice
+from operator import itemgetter
+import asyncio
+import heapq
+import re
 import time
+import numpy as np
 
 from app.core.embedding_engine import embedding_engine
-from app.core.rag_engine import rag_engine
+from app.core.rag_engine import rag_engine, RAGEngine
 from app.core.accurate_priority_strategy import accurate_priority_strategy
 
+if TYPE_CHECKING:
+    from app.core.tavily_search import TavilySearch
+
+
+# 查询预处理使用的预编译匹配器（单次扫描，替代逐词子串查找）
+_CJK_RE = re.compile(r'[\u4e00-\u9fff]')
+_QUESTION_INTENT_RE = re.compile("|".join(map(re.escape, ["how", "什么", "如何", "怎么"])))
+_HELP_INTENT_RE = re.compile("|".join(map(re.escape, ["help", "帮助", "问题"])))
+
+
+# 联网搜索类结果来源
+_WEB_SOURCES = frozenset({"web", "tavily_answer", "tavily_web"})
+
+# 策略说明中的来源名称
+_SOURCE_NAME_MAP = {
+    "fixed_qa": "固定Q&A",
+    "kb": "知识库",
+    "web": "联网搜索",
+    "tavily_answer": "联网搜索",
+    "tavily_web": "联网搜索"
+}
+
+# 引用列表中的来源显示名称
+_SOURCE_DISPLAY_MAP = {
+    "fixed_qa": "固定Q&A",
+    "kb": "知识库",
+    "web": "联网搜索",
+    "llm": "AI推理",
+    "fallback": "回退机制"
+}
+
+# 知识库优先策略日志中的来源显示名称
+_KB_PRIORITY_SOURCE_DISPLAY = {
+    "fixed_qa": "固定Q&A",
+    "kb": "知识库",
+    "tavily_answer": "Cbit AI搜索",
+    "tavily_web": "Cbit AI搜索",
+    "web": "联网搜索"
+}
+
+# 置信度分档：bisect_right(阈值, 相似度) 即档位下标（相似度 >= 阈值时进入该档）
+_CONFIDENCE_THRESHOLDS = (0.60, 0.70, 0.80, 0.90)
+_CONFIDENCE_LABELS = ("低", "较低", "中等", "高", "极高")
+_TIER_THRESHOLDS = (0.70, 0.85)
+_TIER_LEVELS = (("low", "C"), ("moderate", "B"), ("high", "A"))
+
+# 融合/引用阶段的排序键：检索阶段已为每个结果写入 similarity 与 weighted_score，
+# 直接 itemgetter 取值，省去每次比较时的 dict.get 默认值处理
+_BY_SIMILARITY = itemgetter("similarity")
+_BY_WEIGHTED_SCORE = itemgetter("weighted_score")
+
+
+@lru_cache(maxsize=128)
+def _compile_word_matcher(words: Tuple[str, ...]) -> "re.Pattern":
+    """将词表编译为单个正则交替式（按词表缓存），对小写化后的文本做一次扫描"""
+    return re.compile("|".join(re.escape(word.lower()) for word in words))
+
+
+def _has_content(result: Dict[str, Any]) -> bool:
+    """结果是否带有可引用的文本（text/answer/content 任一非空）"""
+    return bool(result.get("text") or result.get("answer") or result.get("content"))
+
+
+def _build_kb_citation(idx: int, result: Dict[str, Any]) -> Dict[str, Any]:
+    """知识库来源的引用"""
+    text = result.get("text", "")
+    doc_title = text[:30] + "..." if len(text) > 30 else text
+    
+    return {
+        "id": idx,
+        "type": "kb",
+        "label": "KB",
+        "title": doc_title,
+        "source_name": result.get("kb_name", "知识库"),
+        "date": None,
+        "snippet": text,
+        "url": result.get("url"),
+        "_internal_score": result.get("similarity", 0)
+    }
+
+
+def _build_qa_citation(idx: int, result: Dict[str, Any]) -> Dict[str, Any]:
+    """固定Q&A来源的引用"""
+    return {
+        "id": idx,
+        "type": "qa",
+        "label": "KB",
+        "title": result.get("question", "")[:30],
+        "source_name": "固定Q&A",
+        "date": None,
+        "snippet": result.get("answer", ""),
+        "url": None,
+        "_internal_score": result.get("similarity", 0)
+    }
+
+
+def _build_tavily_answer_citation(idx: int, result: Dict[str, Any]) -> Dict[str, Any]:
+    """Tavily AI综合答案的引用"""
+    return {
+        "id": idx,
+        "type": "web",
+        "label": "Web",
+        "title": "AI综合答案",
+        "source_name": "网络搜索",
+        "date": None,
+        "snippet": result.get("answer", result.get("content", "")),
+        "url": None,
+        "_internal_score": result.get("relevance", result.get("similarity", 0))
+    }
+
+
+def _build_web_citation(idx: int, result: Dict[str, Any]) -> Dict[str, Any]:
+    """网页搜索结果的引用"""
+    url = result.get("url", "")
+    # rpartition/partition 不构造中间列表，结果与 split("//")[-1].split("/")[0] 相同
+    domain = url.rpartition("//")[2].partition("/")[0] if url else "网页"
+    return {
+        "id": idx,
+        "type": "web",
+        "label": "Web",
+        "title": result.get("title", "网页")[:40],
+        "source_name": domain,
+        "date": None,
+        "snippet": result.get("content", ""),
+        "url": url,
+        "_internal_score": result.get("relevance", result.get("similarity", 0))
+    }
+
+
+def _build_other_citation(idx: int, result: Dict[str, Any]) -> Dict[str, Any]:
+    """其他来源的引用"""
+    return {
+        "id": idx,
+        "type": "other",
+        "label": "来源",
+        "title": "其他来源",
+        "source_name": result.get("source", ""),
+        "date": None,
+        "snippet": result.get("text", result.get("content", "")),
+        "url": None,
+        "_internal_score": result.get("similarity", 0)
+    }
+
+
+# 引用构建函数分派表：来源类型 -> 构建函数（未知来源使用 _build_other_citation）
+_CITATION_BUILDERS = {
+    "kb": _build_kb_citation,
+    "fixed_qa": _build_qa_citation,
+    "tavily_answer": _build_tavily_answer_citation,
+    "web": _build_web_citation,
+    "tavily_web": _build_web_citation
+}
+
 
 class HybridRetrievalEngine:
     """
@@ -19,8 +181,154 @@ class HybridRetrievalEngine:
     实现优先级路由、双阈值策略、权重融合等高级检索功能
     """
     
+    # 默认向量数据库配置缓存时间（秒）
+    VECTOR_DB_CONFIG_TTL = 60
+    
+    # 复用的RAG引擎实例上限（按LRU淘汰）
+    RAG_ENGINE_CACHE_SIZE = 16
+    # 复用的Tavily客户端上限（按LRU淘汰）
+    TAVILY_CLIENT_CACHE_SIZE = 32
+    
+    # 搜索提供商使用量批量写库：累计次数达到阈值或距上次写库超过间隔（秒）时提交
+    SEARCH_USAGE_FLUSH_THRESHOLD = 20
+    SEARCH_USAGE_FLUSH_INTERVAL = 5.0
+    
     def __init__(self):
-        pass
+        # 固定Q&A向量矩阵缓存: app_id -> (Q&A ID元组, 行归一化的float32矩阵, 小写问题列表)
+        self._fixed_qa_matrix_cache: Dict[Any, Tuple[Tuple[int, ...], np.ndarray, List[str]]] = {}
+        # 默认向量数据库配置缓存
+        self._vector_db_config: Optional[Dict[str, Any]] = None
+        self._vector_db_config_expires_at = 0.0
+        # RAG引擎实例缓存: (Embedding配置, 向量数据库配置) -> RAGEngine
+        self._rag_engines: "OrderedDict[Tuple, RAGEngine]" = OrderedDict()
+        # 融合策略分派表: fusion_strategy -> 最终结果选择方法
+        self._final_selectors = {
+            "kb_priority": self._kb_priority_strategy,
+            "priority": self._select_by_priority,
+            "weighted_avg": self._select_by_weighted_score,
+            "max_score": self._select_by_max_score,
+            "voting": self._select_by_votes
+        }
+        # Tavily客户端缓存: api_key -> TavilySearch（复用HTTP连接池）
+        self._tavily_clients: "OrderedDict[str, TavilySearch]" = OrderedDict()
+        # 待写库的搜索提供商使用量: provider_id -> 次数
+        self._search_usage_pending: Dict[int, int] = defaultdict(int)
+        self._search_usage_pending_total = 0
+        self._search_usage_flushed_at = time.monotonic()
+    
+    async def _get_default_vector_db_config(self) -> Optional[Dict[str, Any]]:
+        """获取默认向量数据库配置（TTL缓存，未命中时在线程池中查询数据库，不阻塞事件循环）"""
+        now = time.time()
+        if now < self._vector_db_config_expires_at:
+            return self._vector_db_config
+        
+        vector_db_config = await asyncio.to_thread(self._load_default_vector_db_config)
+        
+        self._vector_db_config = vector_db_config
+        self._vector_db_config_expires_at = now + self.VECTOR_DB_CONFIG_TTL
+        return vector_db_config
+    
+    def _load_default_vector_db_config(self) -> Optional[Dict[str, Any]]:
+        """从数据库读取默认向量数据库配置（同步，独立会话）"""
+        from app.models.database import SessionLocal, VectorDBProvider
+        
+        db = SessionLocal()
+        try:
+            vector_db_provider = db.query(VectorDBProvider).filter(
+                VectorDBProvider.is_default == True
+            ).first()
+            
+            vector_db_config = None
+            if vector_db_provider:
+                vector_db_config = {
+                    "name": vector_db_provider.name,
+                    "provider_type": vector_db_provider.provider_type,
+                    "host": vector_db_provider.host,
+                    "port": vector_db_provider.port
+                }
+                
+                # 添加 API key（如果有）
+                if vector_db_provider.api_key:
+                    vector_db_config["api_key"] = vector_db_provider.api_key
+                
+                # 判断是否使用 HTTPS
+                if vector_db_provider.provider_type == "qdrant" and ('qdrant.io' in (vector_db_provider.host or '') or vector_db_provider.port in [443, 6334]):
+                    vector_db_config["https"] = True
+        finally:
+            db.close()
+        
+        return vector_db_config
+    
+    def _get_rag_engine(
+        self,
+        embedding_provider_config: Optional[Dict[str, Any]],
+        vector_db_config: Dict[str, Any]
+    ) -> RAGEngine:
+        """按 (Embedding配置, 向量数据库配置) 复用RAG引擎实例，跨请求复用连接池（LRU，最多 RAG_ENGINE_CACHE_SIZE 个）"""
+        key = (
+            tuple(sorted(embedding_provider_config.items())) if embedding_provider_config else None,
+            tuple(sorted(vector_db_config.items()))
+        )
+        rag = self._rag_engines.get(key)
+        if rag is None:
+            rag = RAGEngine(
+                embedding_provider_config=embedding_provider_config,
+                vector_db_provider_config=vector_db_config
+            )
+            self._rag_engines[key] = rag
+            if len(self._rag_engines) > self.RAG_ENGINE_CACHE_SIZE:
+                self._rag_engines.popitem(last=False)
+        else:
+            self._rag_engines.move_to_end(key)
+        return rag
+    
+    def invalidate_vector_db_cache(self):
+        """向量数据库提供商配置变更后清除配置与RAG引擎缓存"""
+        self._vector_db_config = None
+        self._vector_db_config_expires_at = 0.0
+        self._rag_engines.clear()
+    
+    def invalidate_fixed_qa_cache(self, app_id: Optional[int] = None):
+        """Q&A的embedding被修改后清除缓存的向量矩阵（app_id为None时清除全部）"""
+        if app_id is None:
+            self._fixed_qa_matrix_cache.clear()
+        else:
+            self._fixed_qa_matrix_cache.pop(app_id, None)
+    
+    def get_fixed_qa_matrix(
+        self,
+        app_id: Any,
+        fixed_qa_pairs: List[Dict[str, Any]]
+    ) -> Tuple[List[Dict[str, Any]], Optional[np.ndarray], List[str]]:
+        """获取可参与匹配的Q&A、归一化向量矩阵 (N, D) 及小写问题列表，Q&A集合不变时复用缓存"""
+        candidates = [
+            qa for qa in fixed_qa_pairs
+            if qa.get("embedding_vector") and qa.get("is_active", True)
+        ]
+        if not candidates:
+            # 释放已无Q&A的应用所占用的矩阵
+            self._fixed_qa_matrix_cache.pop(app_id, None)
+            return [], None, []
+        
+        key = tuple(qa["id"] for qa in candidates)
+        cached = self._fixed_qa_matrix_cache.get(app_id)
+        if cached and cached[0] == key:
+            return candidates, cached[1], cached[2]
+        
+        # 单块C连续float32矩阵：查询时一次SGEMM顺序扫描，内存远小于Python浮点列表
+        matrix = np.ascontiguousarray(
+            [qa["embedding_vector"] for qa in candidates],
+            dtype=np.float32
+        )
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        matrix /= norms
+        
+        # 关键词加成使用的小写问题，随矩阵一起缓存，避免每次查询逐条 lower()
+        questions_lower = [qa["question"].lower() for qa in candidates]
+        
+        self._fixed_qa_matrix_cache[app_id] = (key, matrix, questions_lower)
+        return candidates, matrix, questions_lower
     
     async def retrieve(
         self,
@@ -43,62 +351,128 @@ class HybridRetrievalEngine:
         Returns:
             检索结果，包含匹配来源、内容、相似度等信息
         """
-        start_time = time.time()
+        # 各阶段耗时（纳秒，单调时钟），返回时统一换算为毫秒
+        start_ns = time.perf_counter_ns()
+        timings: Dict[str, int] = {}
         
         # 预处理
-        preprocessing_start = time.time()
         preprocessing_info = await self._preprocess_query(query, app_config)
-        preprocessing_time = (time.time() - preprocessing_start) * 1000
+        timings["preprocessing"] = time.perf_counter_ns() - start_ns
         
         # 检索路径追踪
         retrieval_path = []
         all_results = []
         
-        # 1. 固定Q&A检索（第一优先级）
-        if app_config.get("enable_fixed_qa", False) and fixed_qa_pairs:
-            retrieval_start = time.time()
-            fixed_qa_results = await self._search_fixed_qa(
+        # 追加结果时顺带维护最高置信度和各来源最佳结果，避免后续重复扫描
+        max_confidence = 0.0
+        best_by_source: Dict[str, Dict[str, Any]] = {}
+        
+        search_fixed_qa = bool(app_config.get("enable_fixed_qa", False) and fixed_qa_pairs)
+        search_kb = bool(app_config.get("enable_vector_kb", False) and knowledge_bases)
+        
+        # 知识库是否也按扩展问法检索（可选，默认仅用原始查询）
+        kb_expand = search_kb and bool(
+            ((app_config.get("fusion_config") or {}).get("vector_retrieval") or {}).get("query_expansion", False)
+        )
+        
+        # 查询只向量化一次（含扩展问法），供固定Q&A与知识库检索共用
+        query_vectors = None
+        if embedding_provider_config and (search_fixed_qa or search_kb):
+            try:
+                query_vectors = await self._embed_query_variants(
+                    query,
+                    embedding_provider_config,
+                    expand=search_fixed_qa or kb_expand
+                )
+            except Exception as e:
+                logger.error(f"查询向量化失败: {e}")
+        
+        # 本地提供商时 RAGEngine 使用自身的本地模型向量化，不能复用
+        kb_query_vector = None
+        kb_query_vectors = None
+        if query_vectors and embedding_provider_config.get("provider_type") != "local":
+            kb_query_vector = query_vectors[0]
+            if kb_expand and len(query_vectors) > 1:
+                kb_query_vectors = query_vectors
+        
+        # 级联提前退出：固定Q&A命中足够高时，跳过知识库与（非强制的）联网搜索
+        strategy_config = (app_config.get("fusion_config") or {}).get("strategy", {})
+        enable_early_exit = strategy_config.get(
+            "enable_cascade_early_exit",
+            app_config.get("enable_cascade_early_exit", True)
+        )
+        early_exit_threshold = strategy_config.get("early_exit_threshold", 0.95)
+        early_exit = False
+        
+        # 1. 固定Q&A检索（第一优先级） 与 2. 向量知识库检索 互不依赖，并发执行
+        stage_tasks = {}
+        if search_fixed_qa:
+            stage_tasks["fixed_qa"] = asyncio.create_task(self._run_timed(self._search_fixed_qa(
                 query,
                 fixed_qa_pairs,
                 app_config,
-                embedding_provider_config
-            )
-            retrieval_time = (time.time() - retrieval_start) * 1000
-            
-            if fixed_qa_results:
-                retrieval_path.append({
-                    "source": "fixed_qa",
-                    "time_ms": retrieval_time,
-                    "results_count": len(fixed_qa_results)
-                })
-                
-                for result in fixed_qa_results:
-                    result["source"] = "fixed_qa"
-                    result["weighted_score"] = result["similarity"] * app_config.get("fixed_qa_weight", 1.0)
-                    all_results.append(result)
-        
-        # 2. 向量知识库检索
-        if app_config.get("enable_vector_kb", False) and knowledge_bases:
-            retrieval_start = time.time()
-            kb_results = await self._search_knowledge_bases(
+                embedding_provider_config,
+                query_vectors=query_vectors
+            )))
+        if search_kb:
+            stage_tasks["vector_kb"] = asyncio.create_task(self._run_timed(self._search_knowledge_bases(
                 query,
                 knowledge_bases,
                 app_config,
-                embedding_provider_config
-            )
-            retrieval_time = (time.time() - retrieval_start) * 1000
+                embedding_provider_config,
+                query_vector=kb_query_vector,
+                query_vectors=kb_query_vectors
+            )))
+        
+        # 按优先级依次等待（固定Q&A在前），固定Q&A直接命中时取消仍在进行的知识库检索
+        stage_outcomes = {}
+        for stage, task in stage_tasks.items():
+            if early_exit:
+                task.cancel()
+                continue
+            
+            try:
+                stage_outcomes[stage] = await task
+            except Exception as e:
+                # 单个来源失败不影响整体请求
+                logger.error(f"{stage} 检索失败: {e}")
+                stage_outcomes[stage] = ([], 0.0)
+            
+            if stage == "fixed_qa" and enable_early_exit:
+                fixed_qa_results = stage_outcomes[stage][0]
+                if fixed_qa_results and max(r["similarity"] for r in fixed_qa_results) >= early_exit_threshold:
+                    early_exit = True
+                    logger.info(f"⚡ 固定Q&A命中 ≥ {early_exit_threshold:.0%}，提前结束后续检索")
+        
+        if "fixed_qa" in stage_outcomes:
+            fixed_qa_results, retrieval_time = stage_outcomes["fixed_qa"]
+            
+            if fixed_qa_results:
+                retrieval_path.append(self._path_entry("fixed_qa", retrieval_time, len(fixed_qa_results)))
+                
+                max_confidence = max(max_confidence, self._tag_and_weight(
+                    fixed_qa_results,
+                    "fixed_qa",
+                    app_config.get("fixed_qa_weight", 1.0),
+                    all_results,
+                    best_by_source
+                ))
+        
+        if search_kb and "vector_kb" not in stage_outcomes:
+            retrieval_path.append(self._path_entry("vector_kb", 0.0, 0, status="skipped_early_exit"))
+        elif "vector_kb" in stage_outcomes:
+            kb_results, retrieval_time = stage_outcomes["vector_kb"]
             
             if kb_results:
-                retrieval_path.append({
-                    "source": "vector_kb",
-                    "time_ms": retrieval_time,
-                    "results_count": len(kb_results)
-                })
+                retrieval_path.append(self._path_entry("vector_kb", retrieval_time, len(kb_results)))
                 
-                for result in kb_results:
-                    result["source"] = "kb"
-                    result["weighted_score"] = result["similarity"] * app_config.get("vector_kb_weight", 1.0)
-                    all_results.append(result)
+                max_confidence = max(max_confidence, self._tag_and_weight(
+                    kb_results,
+                    "kb",
+                    app_config.get("vector_kb_weight", 1.0),
+                    all_results,
+                    best_by_source
+                ))
         
         # 3. 智能联网搜索（根据策略模式和阈值触发）
         should_trigger_web_search = False
@@ -115,11 +489,13 @@ class HybridRetrievalEngine:
             if web_search_trigger_threshold == 0.0:
                 should_trigger_web_search = True
                 logger.info(f"🌐 用户明确授权强制联网搜索（阈值=0.0）")
+            elif early_exit:
+                # ⚡ 固定Q&A已直接命中，融合策略必然采用该答案，无需联网
+                retrieval_path.append(self._path_entry("web_search", 0.0, 0, status="skipped_early_exit"))
+                logger.info(f"⚡ 固定Q&A已直接命中，跳过联网搜索")
             else:
                 # 检查现有结果的最高置信度
-                max_confidence = 0.0
                 if all_results:
-                    max_confidence = max(result.get("similarity", 0) for result in all_results)
                     logger.info(f"📊 当前最高置信度: {max_confidence:.2f}, 策略模式: {strategy_mode}")
                 
                 # 🛡️ 安全优先模式：不自动触发联网，留给 app_inference 提示用户授权
@@ -145,19 +521,14 @@ class HybridRetrievalEngine:
                         logger.info(f"✋ 跳过联网搜索 (最高置信度 {max_confidence:.2f} >= 阈值 {web_search_trigger_threshold})")
         
         if should_trigger_web_search:
-            retrieval_start = time.time()
-            web_results = await self._search_web(
+            web_results, retrieval_time = await self._run_timed(self._search_web(
                 query,
                 app_config
-            )
-            retrieval_time = (time.time() - retrieval_start) * 1000
+            ))
             
             if web_results:
-                retrieval_path.append({
-                    "source": "web_search",
-                    "time_ms": retrieval_time,
-                    "results_count": len(web_results)
-                })
+                web_search_weight = app_config.get("web_search_weight", 0.6)
+                retrieval_path.append(self._path_entry("web_search", retrieval_time, len(web_results)))
                 
                 for result in web_results:
                     # 保留原始的source（tavily_answer/tavily_web），但添加web标记用于分类
@@ -171,45 +542,53 @@ class HybridRetrievalEngine:
                     elif "similarity" not in result:
                         result["similarity"] = 0.5  # 默认中等相似度
                     
-                    result["weighted_score"] = result.get("similarity", 0) * app_config.get("web_search_weight", 0.6)
+                    result["weighted_score"] = result.get("similarity", 0) * web_search_weight
                     all_results.append(result)
+                    if result["source"] in _WEB_SOURCES:
+                        self._track_best(best_by_source, "web", result)
             else:
-                retrieval_path.append({
-                    "source": "web_search",
-                    "time_ms": retrieval_time,
-                    "results_count": 0,
-                    "status": "未配置或暂不可用"
-                })
+                retrieval_path.append(self._path_entry("web_search", retrieval_time, 0, status="未配置或暂不可用"))
                 logger.warning("⚠️ 联网搜索已启用但未返回结果（可能未配置搜索引擎）")
         
         # 计算总检索时间
-        retrieval_time_total = (time.time() - start_time) * 1000
+        retrieval_end_ns = time.perf_counter_ns()
+        timings["retrieval"] = retrieval_end_ns - start_ns
+        
+        # 按来源分组只做一次，供引用来源选择与引用信息提取共用
+        results_by_source = self._group_results_by_source(all_results)
         
         # 应用融合策略
-        fusion_start = time.time()
         final_result = await self._apply_fusion_strategy(
             all_results,
-            app_config
+            app_config,
+            best_by_source,
+            results_by_source
         )
-        fusion_time = (time.time() - fusion_start) * 1000
         
         # 总时间
-        total_time = (time.time() - start_time) * 1000
+        end_ns = time.perf_counter_ns()
+        timings["fusion"] = end_ns - retrieval_end_ns
+        timings["total"] = end_ns - start_ns
+        
+        # 最终结果字段只解析一次（无结果时使用空字典）
+        final = final_result or {}
+        similarity = final.get("similarity", 0.0)
         
-        # 提取策略信息（如果存在）
-        strategy_info = final_result.get("_strategy_info") if final_result else None
+        # 引用与建议各只计算一次
+        references = self._extract_references(all_results, app_config, results_by_source)
+        suggestions = self._generate_suggestions(all_results, app_config)
         
         return {
             "query": query,
-            "matched_source": final_result.get("source") if final_result else None,
-            "confidence_score": final_result.get("similarity") if final_result else 0.0,  # 使用原始相似度，不是加权分数
-            "weighted_score": final_result.get("weighted_score") if final_result else 0.0,  # 保留加权分数供内部使用
-            "raw_score": final_result.get("similarity") if final_result else 0.0,
-            "_strategy_info": strategy_info,  # 传递策略信息到上层
-            "answer": final_result.get("answer") if final_result else None,
-            "references": self._extract_references(all_results, app_config),
-            "suggestions": self._generate_suggestions(all_results, app_config),
-            "has_suggestions": len(self._generate_suggestions(all_results, app_config)) > 0,
+            "matched_source": final.get("source"),
+            "confidence_score": similarity,  # 使用原始相似度，不是加权分数
+            "weighted_score": final.get("weighted_score", 0.0),  # 保留加权分数供内部使用
+            "raw_score": similarity,
+            "_strategy_info": final.get("_strategy_info"),  # 传递策略信息到上层
+            "answer": final.get("answer"),
+            "references": references,
+            "suggestions": suggestions,
+            "has_suggestions": bool(suggestions),
             "retrieval_path": retrieval_path,
             "preprocessing_info": preprocessing_info,
             "fusion_details": {
@@ -218,13 +597,111 @@ class HybridRetrievalEngine:
                 "selected": final_result is not None
             },
             "timing": {
-                "preprocessing_ms": round(preprocessing_time, 2),
-                "retrieval_ms": round(retrieval_time_total, 2),
-                "fusion_ms": round(fusion_time, 2),
-                "total_ms": round(total_time, 2)
+                f"{stage}_ms": round(elapsed_ns / 1e6, 2)
+                for stage, elapsed_ns in timings.items()
             }
         }
     
+    @staticmethod
+    def _track_best(
+        best_by_source: Dict[str, Dict[str, Any]],
+        group: str,
+        result: Dict[str, Any]
+    ):
+        """更新某来源的最佳结果（相似度相同时保留先出现的）"""
+        best = best_by_source.get(group)
+        if best is None or result.get("similarity", 0) > best.get("similarity", 0):
+            best_by_source[group] = result
+    
+    def _tag_and_weight(
+        self,
+        results: List[Dict[str, Any]],
+        source: str,
+        weight: float,
+        all_results: List[Dict[str, Any]],
+        best_by_source: Dict[str, Dict[str, Any]]
+    ) -> float:
+        """标注来源与加权分数、更新来源最佳结果并追加到 all_results，返回该来源的最高相似度"""
+        max_similarity = 0.0
+        for result in results:
+            similarity = result["similarity"]
+            result["source"] = source
+            result["weighted_score"] = similarity * weight
+            if similarity > max_similarity:
+                max_similarity = similarity
+            self._track_best(best_by_source, source, result)
+        all_results.extend(results)
+        return max_similarity
+    
+    @staticmethod
+    def _group_results_by_source(
+        results: List[Dict[str, Any]]
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """按来源类型分组（fixed_qa/kb/web，web 包括 tavily_answer、tavily_web），组内保持原顺序"""
+        results_by_source = {
+            "fixed_qa": [],
+            "kb": [],
+            "web": []
+        }
+        for result in results:
+            source_type = result.get("source")
+            bucket = results_by_source.get("web" if source_type in _WEB_SOURCES else source_type)
+            if bucket is not None:
+                bucket.append(result)
+        return results_by_source
+    
+    @staticmethod
+    def _path_entry(
+        source: str,
+        time_ms: float,
+        results_count: int,
+        status: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """构建检索路径条目（可直接JSON序列化并写入检索日志）"""
+        entry = {
+            "source": source,
+            "time_ms": round(time_ms, 2),
+            "results_count": results_count
+        }
+        if status is not None:
+            entry["status"] = status
+        return entry
+    
+    async def _run_timed(self, coro) -> Tuple[Any, float]:
+        """执行检索协程并返回 (结果, 耗时毫秒)，在协程内部计时以便并发时各自统计"""
+        start_ns = time.perf_counter_ns()
+        result = await coro
+        return result, (time.perf_counter_ns() - start_ns) / 1e6
+    
+    async def _embed_query_variants(
+        self,
+        query: str,
+        embedding_provider_config: Dict[str, Any],
+        expand: bool = True
+    ) -> List[List[float]]:
+        """向量化原始查询及其扩展问法（第一个向量始终对应原始查询）"""
+        queries = [query]
+        if expand:
+            # 🚀 问题扩展：生成多个同义问法以提高匹配率
+            from app.core.qa_expansion import qa_expansion
+            queries.extend(q for q in qa_expansion.expand_question(query) if q != query)
+            
+            if len(queries) > 1:
+                logger.info(f"📝 问题扩展: '{query}' -> {queries}")
+        
+        # 批量向量化（带查询向量缓存）
+        vectors = await embedding_engine.embed_queries(queries, embedding_provider_config)
+        
+        # 去掉与已保留问法几乎相同的扩展问法，减少后续重复的匹配与知识库查询
+        if len(vectors) > 1:
+            from app.core.qa_expansion import qa_expansion
+            keep = qa_expansion.near_duplicate_mask(vectors)
+            if not all(keep):
+                logger.info("📝 去除 {} 个近似重复的扩展问法", keep.count(False))
+                vectors = [vector for vector, kept in zip(vectors, keep) if kept]
+        
+        return vectors
+    
     async def _preprocess_query(
         self,
         query: str,
@@ -242,10 +719,12 @@ class HybridRetrievalEngine:
         if not app_config.get("enable_preprocessing", True):
             return info
         
+        query_lower = query.lower()
+        
         # 语言检测
         if app_config.get("enable_language_detection", True):
             # 简单的语言检测（可以替换为更复杂的实现）
-            if any('\u4e00' <= char <= '\u9fff' for char in query):
+            if _CJK_RE.search(query):
                 info["detected_language"] = "zh"
             else:
                 info["detected_language"] = "en"
@@ -253,9 +732,9 @@ class HybridRetrievalEngine:
         # 意图识别
         if app_config.get("enable_intent_recognition", True):
             # 简单的意图识别（可以替换为ML模型）
-            if any(word in query.lower() for word in ["how", "什么", "如何", "怎么"]):
+            if _QUESTION_INTENT_RE.search(query_lower):
                 info["detected_intent"] = "question"
-            elif any(word in query.lower() for word in ["help", "帮助", "问题"]):
+            elif _HELP_INTENT_RE.search(query_lower):
                 info["detected_intent"] = "help"
             else:
                 info["detected_intent"] = "general"
@@ -263,10 +742,8 @@ class HybridRetrievalEngine:
         # 敏感词过滤
         if app_config.get("enable_sensitive_filter", False):
             sensitive_words = app_config.get("sensitive_words", [])
-            for word in sensitive_words:
-                if word.lower() in query.lower():
-                    info["is_filtered"] = True
-                    break
+            if sensitive_words and _compile_word_matcher(tuple(sensitive_words)).search(query_lower):
+                info["is_filtered"] = True
         
         return info
     
@@ -275,9 +752,13 @@ class HybridRetrievalEngine:
         query: str,
         fixed_qa_pairs: List[Dict[str, Any]],
         app_config: Dict[str, Any],
-        embedding_provider_config: Optional[Dict[str, Any]] = None
+        embedding_provider_config: Optional[Dict[str, Any]] = None,
+        query_vectors: Optional[List[List[float]]] = None
     ) -> List[Dict[str, Any]]:
-        """搜索固定Q&A对（支持智能匹配模式）"""
+        """搜索固定Q&A对（支持智能匹配模式）
+        
+        query_vectors: 已生成的原始查询及扩展问法向量，为None时在此生成
+        """
         if not fixed_qa_pairs or not embedding_provider_config:
             return []
         
@@ -295,67 +776,73 @@ class HybridRetrievalEngine:
             
             logger.info(f"🔍 固定Q&A配置 - 模式: {mode}, 直接阈值: {direct_threshold}, 建议阈值: {suggest_threshold}, 最低阈值: {qa_min_threshold}")
             
-            # 🚀 问题扩展：生成多个同义问法以提高匹配率
             from app.core.qa_expansion import qa_expansion
-            expanded_queries = qa_expansion.expand_question(query)
             
-            if len(expanded_queries) > 1:
-                logger.info(f"📝 问题扩展: '{query}' -> {expanded_queries}")
+            if query_vectors is None:
+                query_vectors = await self._embed_query_variants(query, embedding_provider_config)
             
-            # 为所有扩展问题生成向量（批量处理）
-            if len(expanded_queries) == 1:
-                query_vectors = [await embedding_engine.embed_text(query, embedding_provider_config)]
+            # 一次矩阵乘法计算所有扩展问题与所有Q&A的余弦相似度 (E, N)，取每个Q&A的最高分
+            qa_candidates, qa_matrix, qa_questions_lower = self.get_fixed_qa_matrix(app_config.get("id"), fixed_qa_pairs)
+            if qa_matrix is None:
+                return []
+            
+            query_matrix = np.asarray(query_vectors, dtype=np.float32)
+            query_norms = np.linalg.norm(query_matrix, axis=1, keepdims=True)
+            query_norms[query_norms == 0] = 1.0
+            max_similarities = np.maximum((query_matrix / query_norms) @ qa_matrix.T, 0.0).max(axis=0)
+            
+            # 提取查询关键词（只小写化一次）
+            keywords_lower = {kw.lower() for kw in qa_expansion.extract_keywords(query)}
+            
+            # 各模式最终只返回不低于该分数的匹配（smart取直接/建议阈值中较低者）
+            if mode == "strict":
+                result_floor = direct_threshold
+            elif mode == "suggest":
+                result_floor = suggest_threshold
             else:
-                query_vectors = await embedding_engine.embed_texts(expanded_queries, embedding_provider_config)
+                result_floor = min(direct_threshold, suggest_threshold)
+            score_floor = max(qa_min_threshold, result_floor)
             
-            # 使用原始问题的向量作为主向量
-            primary_query_vector = query_vectors[0]
+            # 关键词加成上限由关键词数量决定（最多0.15），加成后仍达不到下限的Q&A直接跳过，
+            # 只对少量幸存者做关键词加成与结果构建
+            max_keyword_boost = min(0.05 * len(keywords_lower), 0.15)
+            candidate_indices = np.nonzero(max_similarities + max_keyword_boost >= score_floor)[0]
             
-            # 计算所有Q&A对的相似度（使用多个查询向量取最高分）
             all_matches = []
-            for qa in fixed_qa_pairs:
-                if qa.get("embedding_vector") and qa.get("is_active", True):
-                    # 计算与所有扩展问题的相似度，取最高值
-                    max_similarity = 0.0
-                    for query_vec in query_vectors:
-                        similarity = embedding_engine.compute_similarity(
-                            query_vec,
-                            qa["embedding_vector"]
-                        )
-                        max_similarity = max(max_similarity, similarity)
-                    
-                    # 🎯 关键词加成：如果问题包含关键词，给予小幅加成
-                    keyword_boost = 0.0
-                    qa_question_lower = qa["question"].lower()
-                    
-                    # 提取查询关键词
-                    keywords = qa_expansion.extract_keywords(query)
-                    matching_keywords = sum(1 for kw in keywords if kw.lower() in qa_question_lower)
-                    
-                    if matching_keywords > 0:
-                        keyword_boost = min(0.05 * matching_keywords, 0.15)  # 最多加15%
-                        logger.debug(f"🔑 关键词匹配: {matching_keywords}个 -> +{keyword_boost:.2%} 加成")
-                    
-                    final_similarity = min(max_similarity + keyword_boost, 1.0)  # 不超过1.0
-                    
-                    # ✅ 应用最低阈值过滤
-                    if final_similarity >= qa_min_threshold:
-                        all_matches.append({
-                            "id": qa["id"],
-                            "question": qa["question"],
-                            "answer": qa["answer"],
-                            "category": qa.get("category"),
-                            "similarity": final_similarity,
-                            "priority": qa.get("priority", 0),
-                            "_raw_similarity": max_similarity,  # 保存原始相似度用于调试
-                            "_keyword_boost": keyword_boost
-                        })
-                        logger.debug(f"✅ Q&A通过最低阈值: '{qa['question'][:30]}...' 相似度={final_similarity:.2f} >= {qa_min_threshold:.2f}")
-                    else:
-                        logger.debug(f"❌ Q&A被最低阈值过滤: '{qa['question'][:30]}...' 相似度={final_similarity:.2f} < {qa_min_threshold:.2f}")
+            for idx in candidate_indices:
+                qa = qa_candidates[idx]
+                max_similarity = float(max_similarities[idx])
+                
+                # 🎯 关键词加成：如果问题包含关键词，给予小幅加成
+                keyword_boost = 0.0
+                qa_question_lower = qa_questions_lower[idx]
+                
+                matching_keywords = sum(1 for kw in keywords_lower if kw in qa_question_lower)
+                
+                if matching_keywords > 0:
+                    keyword_boost = min(0.05 * matching_keywords, 0.15)  # 最多加15%
+                    logger.debug(f"🔑 关键词匹配: {matching_keywords}个 -> +{keyword_boost:.2%} 加成")
+                
+                final_similarity = min(max_similarity + keyword_boost, 1.0)  # 不超过1.0
+                
+                # ✅ 应用最低阈值过滤
+                if final_similarity >= qa_min_threshold:
+                    all_matches.append({
+                        "id": qa["id"],
+                        "question": qa["question"],
+                        "answer": qa["answer"],
+                        "category": qa.get("category"),
+                        "similarity": final_similarity,
+                        "priority": qa.get("priority", 0),
+                        "_raw_similarity": max_similarity,  # 保存原始相似度用于调试
+                        "_keyword_boost": keyword_boost
+                    })
+                    logger.debug(f"✅ Q&A通过最低阈值: '{qa['question'][:30]}...' 相似度={final_similarity:.2f} >= {qa_min_threshold:.2f}")
+                else:
+                    logger.debug(f"❌ Q&A被最低阈值过滤: '{qa['question'][:30]}...' 相似度={final_similarity:.2f} < {qa_min_threshold:.2f}")
             
             # 按相似度和优先级排序
-            all_matches.sort(key=lambda x: (x["similarity"], x["priority"]), reverse=True)
+            all_matches.sort(key=itemgetter("similarity", "priority"), reverse=True)
             
             # 根据模式返回结果
             results = []
@@ -403,129 +890,168 @@ class HybridRetrievalEngine:
         query: str,
         knowledge_bases: List[Dict[str, Any]],
         app_config: Dict[str, Any],
-        embedding_provider_config: Optional[Dict[str, Any]] = None
+        embedding_provider_config: Optional[Dict[str, Any]] = None,
+        query_vector: Optional[List[float]] = None,
+        query_vectors: Optional[List[List[float]]] = None
     ) -> List[Dict[str, Any]]:
-        """搜索向量知识库"""
+        """搜索向量知识库
+        
+        query_vector: 已生成的查询向量，提供时直接按向量检索，避免重复向量化
+        query_vectors: 原始查询及扩展问法的向量，提供时每个知识库一次批量检索并合并
+        """
         if not knowledge_bases:
             return []
         
         all_results = []
         
-        # 需要获取向量数据库配置
-        from app.models.database import SessionLocal, VectorDBProvider
-        from app.core.rag_engine import RAGEngine
+        # 获取默认向量数据库配置（带TTL缓存，避免每次检索都查询数据库）
+        vector_db_config = await self._get_default_vector_db_config()
+        if not vector_db_config:
+            logger.warning("未找到默认向量数据库提供商配置")
+            return []
         
-        db = SessionLocal()
-        try:
-            # 获取默认的向量数据库提供商配置
-            vector_db_provider = db.query(VectorDBProvider).filter(
-                VectorDBProvider.is_default == True
-            ).first()
-            
-            if not vector_db_provider:
-                logger.warning("未找到默认向量数据库提供商配置")
-                return []
-            
-            vector_db_config = {
-                "name": vector_db_provider.name,
-                "provider_type": vector_db_provider.provider_type,
-                "host": vector_db_provider.host,
-                "port": vector_db_provider.port
-            }
-            
-            # 添加 API key（如果有）
-            if vector_db_provider.api_key:
-                vector_db_config["api_key"] = vector_db_provider.api_key
-            
-            # 判断是否使用 HTTPS
-            if vector_db_provider.provider_type == "qdrant" and ('qdrant.io' in (vector_db_provider.host or '') or vector_db_provider.port in [443, 6334]):
-                vector_db_config["https"] = True
-            
-            # 创建带配置的RAG引擎实例
-            rag = RAGEngine(
-                embedding_provider_config=embedding_provider_config,
-                vector_db_provider_config=vector_db_config
-            )
-            
-            # 从fusion_config中获取向量检索配置
-            fusion_config = app_config.get("fusion_config", {})
-            vector_retrieval_config = fusion_config.get("vector_retrieval", {})
-            
-            # 获取检索参数，优先使用fusion_config中的配置
-            # 🎯 优先级：vector_kb_threshold > fusion_config.min_similarity_score > similarity_threshold_low
-            min_similarity_score = app_config.get("vector_kb_threshold",
-                                                  vector_retrieval_config.get("min_similarity_score", 
-                                                                             app_config.get("similarity_threshold_low", 0.75)))
-            max_results = vector_retrieval_config.get("max_results", 
-                                                      app_config.get("top_k", 5))
-            rerank_enabled = vector_retrieval_config.get("rerank_enabled", False)
-            hybrid_search_enabled = vector_retrieval_config.get("hybrid_search_enabled", False)
-            
-            logger.info(f"🔍 向量检索配置 - 最小相似度: {min_similarity_score:.2%}, 最大结果数: {max_results}, "
-                       f"重排序: {rerank_enabled}, 混合搜索: {hybrid_search_enabled}")
+        # 复用带配置的RAG引擎实例（及其向量数据库连接）
+        rag = self._get_rag_engine(embedding_provider_config, vector_db_config)
+        
+        # 从fusion_config中获取向量检索配置
+        fusion_config = app_config.get("fusion_config", {})
+        vector_retrieval_config = fusion_config.get("vector_retrieval", {})
+        
+        # 获取检索参数，优先使用fusion_config中的配置
+        # 🎯 优先级：vector_kb_threshold > fusion_config.min_similarity_score > similarity_threshold_low
+        min_similarity_score = app_config.get("vector_kb_threshold",
+                                              vector_retrieval_config.get("min_similarity_score", 
+                                                                         app_config.get("similarity_threshold_low", 0.75)))
+        max_results = vector_retrieval_config.get("max_results", 
+                                                  app_config.get("top_k", 5))
+        rerank_enabled = vector_retrieval_config.get("rerank_enabled", False)
+        hybrid_search_enabled = vector_retrieval_config.get("hybrid_search_enabled", False)
+        
+        # 阈值过滤 - 优先使用新的融合策略配置
+        kb_min_threshold = fusion_config.get("strategy", {}).get("kb_min_threshold", min_similarity_score)
+        
+        logger.info(f"🔍 向量检索配置 - 最小相似度: {min_similarity_score:.2%}, 最大结果数: {max_results}, "
+                   f"重排序: {rerank_enabled}, 混合搜索: {hybrid_search_enabled}, 阈值: {kb_min_threshold:.4f}")
+        
+        # 各知识库集合相互独立，并发查询
+        if query_vectors:
+            kb_queries = [
+                self._query_kb_variants(rag, kb["collection_name"], query_vectors, max_results)
+                for kb in knowledge_bases
+            ]
+        elif query_vector is not None:
+            kb_queries = [
+                rag.query_by_vector(
+                    collection_name=kb["collection_name"],
+                    query_embedding=query_vector,
+                    n_results=max_results
+                )
+                for kb in knowledge_bases
+            ]
+        else:
+            kb_queries = [
+                rag.query(
+                    collection_name=kb["collection_name"],
+                    query_text=query,
+                    n_results=max_results
+                )
+                for kb in knowledge_bases
+            ]
+        
+        results_list = await asyncio.gather(*kb_queries, return_exceptions=True)
+        
+        for kb, results in zip(knowledge_bases, results_list):
+            if isinstance(results, Exception):
+                logger.error(f"搜索知识库 {kb.get('name')} 失败: {results}")
+                # 完整堆栈仅在DEBUG级别输出（未启用时loguru不会格式化）
+                logger.opt(exception=results).debug("知识库检索异常堆栈")
+                continue
             
-            for kb in knowledge_bases:
-                try:
-                    # 使用RAG引擎查询
-                    results = await rag.query(
-                        collection_name=kb["collection_name"],
-                        query_text=query,
-                        n_results=max_results
-                    )
-                    
-                    if results and results.get("documents"):
-                        for i, doc in enumerate(results["documents"]):
-                            # 计算加权分数
-                            # 向量数据库返回的distance需要转换为similarity
-                            distance = results["distances"][i] if results.get("distances") else 0
-                            similarity = 1.0 / (1.0 + distance)  # 简单的距离转相似度
-                            
-                            # 应用知识库权重
-                            kb_weight = kb.get("weight", 1.0)
-                            boost_factor = kb.get("boost_factor", 1.0)
-                            
-                            weighted_similarity = similarity * kb_weight * boost_factor
-                            
-                            # 应用阈值过滤 - 优先使用新的融合策略配置
-                            fusion_config = app_config.get("fusion_config", {})
-                            strategy_config = fusion_config.get("strategy", {})
-                            kb_min_threshold = strategy_config.get("kb_min_threshold", min_similarity_score)
-                            
-                            # 详细日志：显示阈值应用过程
-                            logger.info(f"🎯 知识库 [{kb['name']}] 文档相似度: {similarity:.4f}, 阈值: {kb_min_threshold:.4f}")
-                            
-                            if similarity >= kb_min_threshold:
-                                all_results.append({
-                                    "kb_id": kb["id"],
-                                    "kb_name": kb["name"],
-                                    "text": doc,
-                                    "metadata": results["metadatas"][i] if results.get("metadatas") else {},
-                                    "similarity": similarity,
-                                    "weighted_similarity": weighted_similarity,
-                                    "kb_weight": kb_weight,
-                                    "answer": doc  # 对于知识库，文本内容即为答案
-                                })
-                                logger.info(f"✅ 知识库 [{kb['name']}] 文档通过阈值检查，相似度: {similarity:.4f} >= {kb_min_threshold:.4f}")
-                            else:
-                                logger.info(f"❌ 知识库 [{kb['name']}] 文档被阈值过滤，相似度 {similarity:.4f} < {kb_min_threshold:.4f}")
+            if results and results.get("documents"):
+                # 优先使用向量数据库原生的余弦相似度，使阈值配置具有真实的余弦语义
+                scores = results.get("scores") if results.get("score_type") == "cosine" else None
+                kb_weight = kb.get("weight", 1.0)
+                boost_factor = kb.get("boost_factor", 1.0)
                 
-                except Exception as e:
-                    logger.error(f"搜索知识库 {kb.get('name')} 失败: {e}", exc_info=True)
-                    continue
-            
-            # 按加权相似度排序
-            all_results.sort(key=lambda x: x["weighted_similarity"], reverse=True)
-            
-            # 限制返回数量
-            return all_results[:max_results]
-            
-        finally:
-            db.close()
+                for i, doc in enumerate(results["documents"]):
+                    # 计算加权分数
+                    if scores is not None:
+                        similarity = scores[i]
+                    else:
+                        # 兼容仅返回距离的旧集合：距离转相似度
+                        distance = results["distances"][i] if results.get("distances") else 0
+                        similarity = 1.0 / (1.0 + distance)
+                    
+                    # 应用知识库权重
+                    weighted_similarity = similarity * kb_weight * boost_factor
+                    
+                    if similarity >= kb_min_threshold:
+                        all_results.append({
+                            "kb_id": kb["id"],
+                            "kb_name": kb["name"],
+                            "text": doc,
+                            "metadata": results["metadatas"][i] if results.get("metadatas") else {},
+                            "similarity": similarity,
+                            "weighted_similarity": weighted_similarity,
+                            "kb_weight": kb_weight,
+                            "answer": doc  # 对于知识库，文本内容即为答案
+                        })
+                        # 逐文档日志使用loguru参数格式化，DEBUG未启用时不产生格式化开销
+                        logger.debug("✅ 知识库 [{}] 文档通过阈值检查，相似度: {:.4f} >= {:.4f}", kb["name"], similarity, kb_min_threshold)
+                    else:
+                        logger.debug("❌ 知识库 [{}] 文档被阈值过滤，相似度 {:.4f} < {:.4f}", kb["name"], similarity, kb_min_threshold)
+        
+        logger.info(f"✅ 向量知识库匹配结果: {len(all_results)}个通过阈值 {kb_min_threshold:.4f}")
+        
+        # 按加权相似度取前 max_results 个（堆选择，无需全量排序）
+        return heapq.nlargest(max_results, all_results, key=itemgetter("weighted_similarity"))
     
-    async def _kb_priority_strategy(
+    async def _query_kb_variants(
+        self,
+        rag,
+        collection_name: str,
+        query_vectors: List[List[float]],
+        n_results: int
+    ) -> Dict[str, Any]:
+        """用多个查询向量批量检索同一知识库，并合并为单个结果"""
+        results_list = await rag.query_by_vectors(
+            collection_name=collection_name,
+            query_embeddings=query_vectors,
+            n_results=n_results
+        )
+        return self._merge_variant_results(results_list, n_results)
+    
+    @staticmethod
+    def _merge_variant_results(results_list: List[Dict[str, Any]], n_results: int) -> Dict[str, Any]:
+        """合并多个查询向量的检索结果：同一文档取最高分，保持余弦语义以便阈值过滤"""
+        is_cosine = bool(results_list) and all(r.get("score_type") == "cosine" for r in results_list)
+        
+        best = {}  # 文档 -> (分数, 距离, 元数据)
+        for results in results_list:
+            documents = results.get("documents") or []
+            distances = results.get("distances") or [0] * len(documents)
+            metadatas = results.get("metadatas") or [{}] * len(documents)
+            scores = results["scores"] if is_cosine else [-d for d in distances]
+            for doc, score, distance, metadata in zip(documents, scores, distances, metadatas):
+                if doc not in best or score > best[doc][0]:
+                    best[doc] = (score, distance, metadata)
+        
+        top = heapq.nlargest(n_results, best.items(), key=lambda item: item[1][0])
+        merged = {
+            "documents": [doc for doc, _ in top],
+            "distances": [entry[1] for _, entry in top],
+            "metadatas": [entry[2] for _, entry in top]
+        }
+        if is_cosine:
+            merged["scores"] = [entry[0] for _, entry in top]
+            merged["score_type"] = "cosine"
+        return merged
+    
+    def _kb_priority_strategy(
         self,
         results: List[Dict[str, Any]],
-        app_config: Dict[str, Any]
+        app_config: Dict[str, Any],
+        best_by_source: Optional[Dict[str, Dict[str, Any]]] = None
     ) -> Optional[Dict[str, Any]]:
         """
         知识库优先策略（推荐预设）
@@ -544,31 +1070,36 @@ class HybridRetrievalEngine:
         kb_priority_threshold = strategy_config.get("kb_priority_threshold", 0.70)
         kb_priority_bonus = strategy_config.get("kb_priority_bonus", 0.15)
         
-        # 分离不同来源的结果
-        fixed_qa_results = [r for r in results if r.get("source") == "fixed_qa"]
-        kb_results = [r for r in results if r.get("source") == "kb"]
-        web_results = [r for r in results if r.get("source") in ["web", "tavily_answer", "tavily_web"]]
+        # 获取各来源的最佳结果（检索阶段未提供时单次遍历统计）
+        if best_by_source is None:
+            best_by_source = {}
+            for result in results:
+                source = result.get("source")
+                if source in ("fixed_qa", "kb"):
+                    self._track_best(best_by_source, source, result)
+                elif source in _WEB_SOURCES:
+                    self._track_best(best_by_source, "web", result)
+        
+        best_fixed_qa = best_by_source.get("fixed_qa")
+        best_kb = best_by_source.get("kb")
+        best_web = best_by_source.get("web")
         
-        # 获取各来源的最佳结果
-        best_fixed_qa = max(fixed_qa_results, key=lambda x: x.get("similarity", 0)) if fixed_qa_results else None
-        best_kb = max(kb_results, key=lambda x: x.get("similarity", 0)) if kb_results else None
-        best_web = max(web_results, key=lambda x: x.get("similarity", 0)) if web_results else None
+        # 各来源最佳相似度只读取一次
+        fixed_qa_score = best_fixed_qa.get("similarity", 0) if best_fixed_qa else 0
+        kb_score = best_kb.get("similarity", 0) if best_kb else 0
         
         # 策略0: 固定Q&A优先（如果存在高质量匹配）
-        if best_fixed_qa and best_fixed_qa.get("similarity", 0) >= 0.90:
-            logger.info(f"💎 固定Q&A高匹配 {best_fixed_qa.get('similarity', 0):.1%}，直接采用")
+        if best_fixed_qa and fixed_qa_score >= 0.90:
+            logger.info(f"💎 固定Q&A高匹配 {fixed_qa_score:.1%}，直接采用")
             return best_fixed_qa
         
         # 策略1: 知识库高置信度（≥85%）→ 直接使用知识库
-        if best_kb and best_kb.get("similarity", 0) >= kb_absolute_priority_threshold:
-            kb_score = best_kb.get("similarity", 0)
+        if best_kb and kb_score >= kb_absolute_priority_threshold:
             logger.info(f"✅ 知识库高置信度 {kb_score:.1%}（≥{kb_absolute_priority_threshold:.0%}），直接采用")
             return best_kb
         
         # 策略2: 知识库中等置信度（70-85%）→ 知识库优先，但给联网机会
-        if best_kb and best_kb.get("similarity", 0) >= kb_priority_threshold:
-            kb_score = best_kb.get("similarity", 0)
-            
+        if best_kb and kb_score >= kb_priority_threshold:
             if best_web:
                 web_score = best_web.get("similarity", 0)
                 # 联网搜索需要明显更好（超过知识库 + bonus）
@@ -591,23 +1122,17 @@ class HybridRetrievalEngine:
                 return best_kb
         
         # 策略3: 知识库低置信度（<70%）→ 公平竞争
-        kb_info = f"{best_kb.get('similarity', 0):.1%}" if best_kb else "无"
+        kb_info = f"{kb_score:.1%}" if best_kb else "无"
         logger.info(
             f"⚖️ 知识库置信度较低 (KB: {kb_info}), 按加权分数公平竞争"
         )
         
-        # 按加权分数排序，选择最佳结果
-        results_sorted = sorted(results, key=lambda x: x.get("weighted_score", 0), reverse=True)
-        best_result = results_sorted[0] if results_sorted else None
+        # 选择加权分数最高的结果（分数相同时保留先出现的）
+        best_result = max(results, key=_BY_WEIGHTED_SCORE)
         
         if best_result:
-            source_display = {
-                "fixed_qa": "固定Q&A",
-                "kb": "知识库",
-                "tavily_answer": "Cbit AI搜索",
-                "tavily_web": "Cbit AI搜索",
-                "web": "联网搜索"
-            }.get(best_result.get("source"), best_result.get("source"))
+            source = best_result.get("source")
+            source_display = _KB_PRIORITY_SOURCE_DISPLAY.get(source, source)
             
             logger.info(
                 f"🏆 公平竞争结果: {source_display} "
@@ -620,14 +1145,19 @@ class HybridRetrievalEngine:
     async def _apply_fusion_strategy(
         self,
         results: List[Dict[str, Any]],
-        app_config: Dict[str, Any]
+        app_config: Dict[str, Any],
+        best_by_source: Optional[Dict[str, Dict[str, Any]]] = None,
+        results_by_source: Optional[Dict[str, List[Dict[str, Any]]]] = None
     ) -> Optional[Dict[str, Any]]:
-        """应用融合策略"""
+        """应用融合策略
+        
+        best_by_source: 检索阶段已统计的各来源最佳结果（fixed_qa/kb/web），可选
+        results_by_source: 按来源分组的结果（见 _group_results_by_source），可选
+        """
         if not results:
             return None
         
         fusion_strategy = app_config.get("fusion_strategy", "weighted_avg")
-        threshold_high = app_config.get("similarity_threshold_high", 0.90)
         threshold_low = app_config.get("similarity_threshold_low", 0.75)
         
         # 准确优先策略（最严格）
@@ -665,142 +1195,166 @@ class HybridRetrievalEngine:
                 "_strategy_info": strategy_info_for_response
             }
         
-        # 知识库优先策略（推荐预设）
-        if fusion_strategy == "kb_priority":
-            final = await self._kb_priority_strategy(results, app_config)
-            # 为所有策略添加统一的citations
-            if final:
-                final["_strategy_info"] = self._generate_unified_strategy_info(final, results, app_config)
-            return final
-        
-        # 优先级路由策略
-        if fusion_strategy == "priority":
-            # 按来源优先级：fixed_qa > kb > web > llm
-            for source_type in ["fixed_qa", "kb", "web"]:
-                for result in results:
-                    if result.get("source") == source_type:
-                        # 检查是否达到高阈值
-                        if result.get("similarity", 0) >= threshold_high:
-                            result["_strategy_info"] = self._generate_unified_strategy_info(result, results, app_config)
-                            return result
+        # 多源融合（不附加统一策略信息）
+        if fusion_strategy == "multi_source_fusion":
+            # 综合所有高质量来源：相似度与加权分数提取为连续数组，阈值过滤与取最大值均向量化
+            similarities = np.fromiter(
+                (r["similarity"] for r in results),
+                dtype=np.float64,
+                count=len(results)
+            )
+            high_quality_indices = np.flatnonzero(similarities >= threshold_low)
             
-            # 如果没有达到高阈值，返回最高分的
-            final = results[0] if results else None
-            if final:
-                final["_strategy_info"] = self._generate_unified_strategy_info(final, results, app_config)
-            return final
-        
-        # 加权平均策略
-        elif fusion_strategy == "weighted_avg":
-            # 按加权分数排序
-            results_sorted = sorted(results, key=lambda x: x.get("weighted_score", 0), reverse=True)
-            final = results_sorted[0] if results_sorted else None
-            if final:
-                final["_strategy_info"] = self._generate_unified_strategy_info(final, results, app_config)
-            return final
-        
-        # 最大值优先策略
-        elif fusion_strategy == "max_score":
-            # 返回原始相似度最高的
-            results_sorted = sorted(results, key=lambda x: x.get("similarity", 0), reverse=True)
-            final = results_sorted[0] if results_sorted else None
-            if final:
-                final["_strategy_info"] = self._generate_unified_strategy_info(final, results, app_config)
-            return final
-        
-        # 投票机制
-        elif fusion_strategy == "voting":
-            # 统计每个答案的票数（基于权重）
-            answer_votes: Dict[str, float] = {}
-            answer_results: Dict[str, Dict] = {}
+            if high_quality_indices.size == 0:
+                return results[0]
             
-            for result in results:
-                answer = result.get("answer", "")
-                weight = result.get("weighted_score", 0)
-                
-                if answer in answer_votes:
-                    answer_votes[answer] += weight
-                else:
-                    answer_votes[answer] = weight
-                    answer_results[answer] = result
-            
-            # 返回票数最高的
-            if answer_votes:
-                winning_answer = max(answer_votes, key=answer_votes.get)
-                final = answer_results[winning_answer]
-                if final:
-                    final["_strategy_info"] = self._generate_unified_strategy_info(final, results, app_config)
-                return final
-            return None
+            # 返回加权分数最高的（分数相同时保留先出现的）
+            weighted_scores = np.fromiter(
+                (results[i]["weighted_score"] for i in high_quality_indices),
+                dtype=np.float64,
+                count=high_quality_indices.size
+            )
+            return results[high_quality_indices[int(np.argmax(weighted_scores))]]
         
-        # 多源融合
-        elif fusion_strategy == "multi_source_fusion":
-            # 综合所有高质量来源
-            high_quality_results = [
-                r for r in results 
-                if r.get("similarity", 0) >= threshold_low
-            ]
-            
-            if not high_quality_results:
-                return results[0] if results else None
-            
-            # 返回加权分数最高的
-            return max(high_quality_results, key=lambda x: x.get("weighted_score", 0))
+        final = self._select_final_result(
+            results,
+            app_config,
+            fusion_strategy,
+            best_by_source
+        )
         
-        # 默认返回第一个
-        final = results[0] if results else None
+        # 为所有策略添加统一的citations（每次检索只生成一次）
         if final:
-            final["_strategy_info"] = self._generate_unified_strategy_info(final, results, app_config)
+            final["_strategy_info"] = self._generate_unified_strategy_info(
+                final,
+                results,
+                app_config,
+                results_by_source
+            )
         return final
     
+    def _select_final_result(
+        self,
+        results: List[Dict[str, Any]],
+        app_config: Dict[str, Any],
+        fusion_strategy: str,
+        best_by_source: Optional[Dict[str, Dict[str, Any]]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """按融合策略从候选结果中选出最终结果（不生成策略信息）
+        
+        通过策略分派表一次查找选出对应的选择方法，未知策略默认返回第一个结果
+        """
+        selector = self._final_selectors.get(fusion_strategy, self._select_first)
+        return selector(results, app_config, best_by_source)
+    
+    def _select_by_priority(
+        self,
+        results: List[Dict[str, Any]],
+        app_config: Dict[str, Any],
+        best_by_source: Optional[Dict[str, Dict[str, Any]]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """优先级路由策略"""
+        threshold_high = app_config.get("similarity_threshold_high", 0.90)
+        
+        # 按来源优先级：fixed_qa > kb > web > llm
+        for source_type in ["fixed_qa", "kb", "web"]:
+            for result in results:
+                if result.get("source") == source_type:
+                    # 检查是否达到高阈值
+                    if result.get("similarity", 0) >= threshold_high:
+                        return result
+        
+        # 如果没有达到高阈值，返回最高分的
+        return results[0] if results else None
+    
+    def _select_by_weighted_score(
+        self,
+        results: List[Dict[str, Any]],
+        app_config: Dict[str, Any],
+        best_by_source: Optional[Dict[str, Dict[str, Any]]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """加权平均策略：取加权分数最高的（单次遍历，分数相同时保留先出现的）"""
+        return max(results, key=_BY_WEIGHTED_SCORE, default=None)
+    
+    def _select_by_max_score(
+        self,
+        results: List[Dict[str, Any]],
+        app_config: Dict[str, Any],
+        best_by_source: Optional[Dict[str, Dict[str, Any]]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """最大值优先策略：返回原始相似度最高的"""
+        return max(results, key=_BY_SIMILARITY, default=None)
+    
+    def _select_by_votes(
+        self,
+        results: List[Dict[str, Any]],
+        app_config: Dict[str, Any],
+        best_by_source: Optional[Dict[str, Dict[str, Any]]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """投票机制"""
+        # 统计每个答案的票数（基于权重）
+        answer_votes: Dict[str, float] = {}
+        answer_results: Dict[str, Dict] = {}
+        
+        for result in results:
+            answer = result.get("answer", "")
+            answer_votes[answer] = answer_votes.get(answer, 0.0) + result["weighted_score"]
+            # 每个答案保留第一个给出它的结果
+            answer_results.setdefault(answer, result)
+        
+        # 返回票数最高的
+        if answer_votes:
+            winning_answer = max(answer_votes, key=answer_votes.get)
+            return answer_results[winning_answer]
+        return None
+    
+    def _select_first(
+        self,
+        results: List[Dict[str, Any]],
+        app_config: Dict[str, Any],
+        best_by_source: Optional[Dict[str, Dict[str, Any]]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """默认返回第一个"""
+        return results[0] if results else None
+    
     def _generate_unified_strategy_info(
         self,
         final_result: Dict[str, Any],
         all_results: List[Dict[str, Any]],
-        app_config: Dict[str, Any]
+        app_config: Dict[str, Any],
+        results_by_source: Optional[Dict[str, List[Dict[str, Any]]]] = None
     ) -> Dict[str, Any]:
         """
         为所有融合策略生成统一的策略信息和citations（仿OpenAI格式）
         确保所有预设都使用一致的引用来源显示样式
         """
         # 生成citations：以final_result为主，补充其他高相关结果
-        relevant_results = self._get_relevant_results_for_citations(final_result, all_results)
+        relevant_results = self._get_relevant_results_for_citations(
+            final_result,
+            all_results,
+            results_by_source
+        )
         citations = self._generate_unified_citations(relevant_results)
         
         # 根据相似度判断置信度等级
         similarity = final_result.get("similarity", 0)
-        if similarity >= 0.85:
-            confidence_level = "high"
-            tier = "A"
-        elif similarity >= 0.70:
-            confidence_level = "moderate"
-            tier = "B"
-        else:
-            confidence_level = "low"
-            tier = "C"
+        confidence_level, tier = _TIER_LEVELS[bisect_right(_TIER_THRESHOLDS, similarity)]
         
         # 生成简单的解释
         source_type = final_result.get("source", "")
-        source_name_map = {
-            "fixed_qa": "固定Q&A",
-            "kb": "知识库",
-            "web": "联网搜索",
-            "tavily_answer": "联网搜索",
-            "tavily_web": "联网搜索"
-        }
-        source_display = source_name_map.get(source_type, "知识源")
+        source_display = _SOURCE_NAME_MAP.get(source_type, "知识源")
         
         # 🔑 根据来源类型使用不同的度量词
         # 联网搜索使用"相关度"，知识库/Q&A使用"相似度"
-        if source_type in ["web", "tavily_answer", "tavily_web"]:
+        if source_type in _WEB_SOURCES:
             # 联网搜索：只显示来源链接，不显示相关度百分比
             explanation = f"基于{source_display}检索结果"
             
-            # 尝试获取第一个引用的链接作为主要来源
-            if citations and len(citations) > 0:
+            # 尝试获取第一个引用的链接作为主要来源（引用均由 _generate_unified_citations 构建，字段齐全）
+            if citations:
                 first_citation = citations[0]
-                url = first_citation.get("url")
-                source_name = first_citation.get("source_name", "")
+                url = first_citation["url"]
+                source_name = first_citation["source_name"]
                 if url:
                     explanation += f" | 主要来源: {source_name} | 链接: {url}"
                 elif source_name:
@@ -822,7 +1376,8 @@ class HybridRetrievalEngine:
     def _get_relevant_results_for_citations(
         self,
         final_result: Dict[str, Any],
-        all_results: List[Dict[str, Any]]
+        all_results: List[Dict[str, Any]],
+        results_by_source: Optional[Dict[str, List[Dict[str, Any]]]] = None
     ) -> List[Dict[str, Any]]:
         """
         智能选择与最终回答相关的结果作为引用来源
@@ -837,106 +1392,95 @@ class HybridRetrievalEngine:
         final_source = final_result.get("source", "")
         
         # 🔑 关键：如果最终回答来自联网搜索，只选择联网搜索的引用
-        if final_source in ["web", "tavily_answer", "tavily_web"]:
+        if final_source in _WEB_SOURCES:
             logger.info(f"🌐 回答来自联网搜索，只选择联网搜索的引用来源")
             
             # 收集所有联网搜索结果
-            web_results = [
-                r for r in all_results 
-                if r.get("source") in ["web", "tavily_answer", "tavily_web"]
-            ]
+            if results_by_source is None:
+                results_by_source = self._group_results_by_source(all_results)
+            web_results = results_by_source["web"]
             
-            # 按相关度排序（tavily使用relevance，web使用similarity）
-            web_results_sorted = sorted(
+            # 按相关度取前3个联网结果（tavily使用relevance，web使用similarity）
+            relevant_results = heapq.nlargest(
+                3,
                 web_results,
-                key=lambda x: x.get("relevance", x.get("similarity", 0)),
-                reverse=True
+                key=lambda x: x.get("relevance", x.get("similarity", 0))
             )
             
-            # 最多返回3个联网结果
-            relevant_results = web_results_sorted[:3]
-            
-            logger.info(f"📚 选择了 {len(relevant_results)} 个联网搜索引用")
-            for idx, res in enumerate(relevant_results, 1):
-                relevance = res.get("relevance", res.get("similarity", 0))
-                title = res.get("title", "")[:50]
-                url = res.get("url", "")
-                logger.info(f"  [{idx}] {res.get('source')} - 相关度: {relevance:.2%} - {title}")
-                if url:
-                    logger.info(f"       链接: {url}")
+            # 汇总为一条日志，INFO未启用时（lazy）不构建明细
+            logger.opt(lazy=True).info(
+                "📚 选择了 {} 个联网搜索引用{}",
+                lambda: len(relevant_results),
+                lambda: "".join(
+                    f"\n  [{idx}] {res.get('source')} - 相关度: {res.get('relevance', res.get('similarity', 0)):.2%} - {res.get('title', '')[:50]}"
+                    + (f"\n       链接: {res['url']}" if res.get("url") else "")
+                    for idx, res in enumerate(relevant_results, 1)
+                )
+            )
             
             return relevant_results
         
         # 如果不是联网搜索，使用原有逻辑（知识库、Q&A等）
         # 1. 首先添加 final_result（如果它有实际内容且不是 "no_result"）
-        if final_result.get("source") != "no_result":
+        if final_source != "no_result":
             # 确保 final_result 有文本内容
-            has_content = (
-                final_result.get("text") or 
-                final_result.get("answer") or 
-                final_result.get("content")
-            )
-            if has_content:
+            if _has_content(final_result):
                 relevant_results.append(final_result)
         
         # 2. 从 all_results 中选择其他高相关结果（同源类型优先）
-        final_source_type = final_result.get("source", "")
-        
         # 优先选择同源类型的结果
         same_source_results = []
         other_results = []
         
+        # 剩余引用名额：同源结果凑满名额后即可停止扫描，异源结果也最多只需收集名额数
+        slots = 3 - len(relevant_results)
+        
+        # 过滤顺序：身份判断 → 来源集合 → 数值阈值 → 内容检查（最便宜且最有选择性的在前）
         for result in all_results:
-            # 跳过 final_result（已添加）
+            # 跳过 final_result（已添加；身份比较即可，无需在结果上做标记）
             if result is final_result:
                 continue
             
             # 跳过联网搜索结果（如果主结果不是联网的）
-            if result.get("source") in ["web", "tavily_answer", "tavily_web"]:
+            source = result.get("source")
+            if source in _WEB_SOURCES:
                 continue
             
             # 跳过低相似度结果
-            similarity = result.get("similarity", 0)
-            if similarity < 0.6:  # 提高阈值到60%
+            if result.get("similarity", 0) < 0.6:  # 提高阈值到60%
                 continue
             
             # 跳过没有内容的结果
-            has_content = (
-                result.get("text") or 
-                result.get("answer") or 
-                result.get("content")
-            )
-            if not has_content:
+            if not _has_content(result):
                 continue
             
             # 区分同源和异源
-            if result.get("source") == final_source_type:
+            if source == final_source:
                 same_source_results.append(result)
-            else:
+                if len(same_source_results) >= slots:
+                    break
+            elif len(other_results) < slots:
                 other_results.append(result)
         
-        # 优先添加同源结果，再添加异源结果
-        for result in same_source_results:
-            relevant_results.append(result)
-            if len(relevant_results) >= 3:
-                break
-        
-        if len(relevant_results) < 3:
-            for result in other_results:
-                relevant_results.append(result)
-                if len(relevant_results) >= 3:
-                    break
+        # 优先添加同源结果，再添加异源结果，总数不超过3个
+        relevant_results.extend(same_source_results)
+        relevant_results.extend(islice(other_results, 3 - len(relevant_results)))
         
-        # 3. 按相似度排序（保证最相关的在前面）
-        relevant_results = sorted(
-            relevant_results, 
-            key=lambda x: x.get("similarity", 0), 
-            reverse=True
-        )[:3]
+        # 3. 按相似度取前3个（保证最相关的在前面）
+        relevant_results = heapq.nlargest(
+            3,
+            relevant_results,
+            key=_BY_SIMILARITY
+        )
         
-        logger.info(f"📚 为回答选择了 {len(relevant_results)} 个引用来源")
-        for idx, res in enumerate(relevant_results, 1):
-            logger.info(f"  [{idx}] {res.get('source')} - 相似度: {res.get('similarity', 0):.2%}")
+        logger.opt(lazy=True).info(
+            "📚 为回答选择了 {} 个引用来源{}",
+            lambda: len(relevant_results),
+            lambda: "".join(
+                f"\n  [{idx}] {res.get('source')} - 相似度: {res.get('similarity', 0):.2%}"
+                for idx, res in enumerate(relevant_results, 1)
+            )
+        )
         
         return relevant_results
     
@@ -948,90 +1492,17 @@ class HybridRetrievalEngine:
         生成统一格式的citations（仿OpenAI格式）
         与accurate_priority策略使用相同的格式
         """
-        citations = []
-        
-        for idx, result in enumerate(results, 1):  # 使用传入的results，不再限制[:3]
-            source_type = result.get("source", "")
-            
-            if source_type == "kb":
-                # 知识库来源
-                text = result.get("text", "")
-                doc_title = text[:30] + "..." if len(text) > 30 else text
-                
-                citation = {
-                    "id": idx,
-                    "type": "kb",
-                    "label": "KB",
-                    "title": doc_title,
-                    "source_name": result.get("kb_name", "知识库"),
-                    "date": None,
-                    "snippet": text,
-                    "url": result.get("url"),
-                    "_internal_score": result.get("similarity", 0)
-                }
-            elif source_type == "fixed_qa":
-                # 固定Q&A来源
-                citation = {
-                    "id": idx,
-                    "type": "qa",
-                    "label": "KB",
-                    "title": result.get("question", "")[:30],
-                    "source_name": "固定Q&A",
-                    "date": None,
-                    "snippet": result.get("answer", ""),
-                    "url": None,
-                    "_internal_score": result.get("similarity", 0)
-                }
-            elif source_type in ["web", "tavily_answer", "tavily_web"]:
-                # 联网搜索来源
-                if source_type == "tavily_answer":
-                    citation = {
-                        "id": idx,
-                        "type": "web",
-                        "label": "Web",
-                        "title": "AI综合答案",
-                        "source_name": "网络搜索",
-                        "date": None,
-                        "snippet": result.get("answer", result.get("content", "")),
-                        "url": None,
-                        "_internal_score": result.get("relevance", result.get("similarity", 0))
-                    }
-                else:
-                    url = result.get("url", "")
-                    domain = url.split("//")[-1].split("/")[0] if url else "网页"
-                    citation = {
-                        "id": idx,
-                        "type": "web",
-                        "label": "Web",
-                        "title": result.get("title", "网页")[:40],
-                        "source_name": domain,
-                        "date": None,
-                        "snippet": result.get("content", ""),
-                        "url": url,
-                        "_internal_score": result.get("relevance", result.get("similarity", 0))
-                    }
-            else:
-                # 其他来源
-                citation = {
-                    "id": idx,
-                    "type": "other",
-                    "label": "来源",
-                    "title": "其他来源",
-                    "source_name": source_type,
-                    "date": None,
-                    "snippet": result.get("text", result.get("content", "")),
-                    "url": None,
-                    "_internal_score": result.get("similarity", 0)
-                }
-            
-            citations.append(citation)
-        
-        return citations
+        # 按来源类型分派到对应的构建函数（使用传入的results，不再限制[:3]）
+        return [
+            _CITATION_BUILDERS.get(result.get("source", ""), _build_other_citation)(idx, result)
+            for idx, result in enumerate(results, 1)
+        ]
     
     def _extract_references(
         self,
         results: List[Dict[str, Any]],
-        app_config: Dict[str, Any]
+        app_config: Dict[str, Any],
+        results_by_source: Optional[Dict[str, List[Dict[str, Any]]]] = None
     ) -> List[Dict[str, Any]]:
         """提取引用信息，提供清晰的来源标注"""
         if not app_config.get("enable_citation", True):
@@ -1040,45 +1511,21 @@ class HybridRetrievalEngine:
         references = []
         
         # 按来源类型分组，确保每种类型都有代表
-        sources_by_type = {
-            "fixed_qa": [],
-            "kb": [],
-            "web": []  # 包括 tavily_answer, tavily_web, web
-        }
-        
-        for result in results:
-            source_type = result.get("source")
-            if source_type == "fixed_qa":
-                sources_by_type["fixed_qa"].append(result)
-            elif source_type == "kb":
-                sources_by_type["kb"].append(result)
-            elif source_type in ["web", "tavily_answer", "tavily_web"]:
-                sources_by_type["web"].append(result)
+        if results_by_source is None:
+            results_by_source = self._group_results_by_source(results)
         
-        # 从每种类型中取前2个，确保联网搜索结果也被包含
+        # 从每种类型中按相似度取前2个，确保联网搜索结果也被包含
         selected_results = []
-        for source_type in ["fixed_qa", "kb", "web"]:
-            sources = sources_by_type[source_type]
-            # 按相似度排序
-            sources.sort(key=lambda x: x.get("similarity", 0), reverse=True)
-            selected_results.extend(sources[:2])  # 每种类型最多2个
+        for sources in results_by_source.values():
+            selected_results.extend(heapq.nlargest(2, sources, key=_BY_SIMILARITY))
         
         # 处理选中的结果
         for result in selected_results:
             source_type = result.get("source")
             
-            # 标准化来源类型显示名称
-            source_display_map = {
-                "fixed_qa": "固定Q&A",
-                "kb": "知识库",
-                "web": "联网搜索",
-                "llm": "AI推理",
-                "fallback": "回退机制"
-            }
-            
             ref = {
                 "source_type": source_type,
-                "source_display": source_display_map.get(source_type, source_type),
+                "source_display": _SOURCE_DISPLAY_MAP.get(source_type, source_type),  # 标准化来源类型显示名称
                 "similarity": round(result.get("similarity", 0), 4),
                 "weighted_score": round(result.get("weighted_score", 0), 4),
                 "confidence_level": self._get_confidence_level(result.get("similarity", 0))
@@ -1104,7 +1551,7 @@ class HybridRetrievalEngine:
                     "source": "kb",
                     "source_detail": f"知识库「{kb_name}」"
                 })
-            elif source_type == "web" or source_type == "tavily_answer" or source_type == "tavily_web":
+            elif source_type in _WEB_SOURCES:
                 # 处理联网搜索结果（包括Tavily）
                 ref.update({
                     "url": result.get("url", ""),
@@ -1120,16 +1567,7 @@ class HybridRetrievalEngine:
     
     def _get_confidence_level(self, similarity: float) -> str:
         """根据相似度返回置信度等级"""
-        if similarity >= 0.90:
-            return "极高"
-        elif similarity >= 0.80:
-            return "高"
-        elif similarity >= 0.70:
-            return "中等"
-        elif similarity >= 0.60:
-            return "较低"
-        else:
-            return "低"
+        return _CONFIDENCE_LABELS[bisect_right(_CONFIDENCE_THRESHOLDS, similarity)]
     
     def _generate_suggestions(
         self,
@@ -1188,41 +1626,59 @@ class HybridRetrievalEngine:
             
             logger.info(f"🌐 联网搜索已配置渠道: {search_channels}")
             
-            # 从数据库加载搜索提供商配置
-            from app.models.database import get_db, SearchProvider
-            db = next(get_db())
-            
-            # 尝试使用配置的搜索提供商
-            results = []
-            for channel in search_channels:
-                # 查找对应的搜索提供商
-                provider = db.query(SearchProvider).filter(
-                    SearchProvider.provider_type == channel,
-                    SearchProvider.status == "active"
-                ).first()
-                
-                if not provider:
-                    logger.warning(f"⚠️ 未找到激活的 {channel} 搜索提供商")
-                    continue
-                
-                # 根据提供商类型调用相应的搜索
-                if channel == "tavily":
-                    results = await self._search_with_tavily(query, provider, app_config)
-                    if results:
-                        logger.info(f"✅ Tavily搜索返回 {len(results)} 条结果")
-                        break  # 成功获取结果，退出循环
-                
-                elif channel == "serper":
-                    logger.info("⚠️ Serper搜索集成开发中...")
-                    # TODO: 实现Serper搜索
-                
-                elif channel == "google":
-                    logger.info("⚠️ Google搜索集成开发中...")
-                    # TODO: 实现Google搜索
+            # 从数据库加载搜索提供商配置（整个联网搜索过程共用一个会话）
+            from app.models.database import SessionLocal, SearchProvider
+            db = SessionLocal()
+            try:
+                # 为每个已配置的渠道启动搜索任务，各渠道并发请求（按渠道去重，保持配置顺序）
+                channel_tasks: Dict[str, asyncio.Task] = {}
+                for channel in search_channels:
+                    if channel in channel_tasks:
+                        continue
+                    
+                    # 查找对应的搜索提供商
+                    provider = db.query(SearchProvider).filter(
+                        SearchProvider.provider_type == channel,
+                        SearchProvider.status == "active"
+                    ).first()
+                    
+                    if not provider:
+                        logger.warning(f"⚠️ 未找到激活的 {channel} 搜索提供商")
+                        continue
+                    
+                    # 根据提供商类型调用相应的搜索
+                    if channel == "tavily":
+                        channel_tasks[channel] = asyncio.create_task(
+                            self._search_with_tavily(query, provider, app_config)
+                        )
+                    
+                    elif channel == "serper":
+                        logger.info("⚠️ Serper搜索集成开发中...")
+                        # TODO: 实现Serper搜索
+                    
+                    elif channel == "google":
+                        logger.info("⚠️ Google搜索集成开发中...")
+                        # TODO: 实现Google搜索
+                    
+                    elif channel == "serpapi":
+                        logger.info("⚠️ SerpAPI搜索集成开发中...")
+                        # TODO: 实现SerpAPI搜索
                 
-                elif channel == "serpapi":
-                    logger.info("⚠️ SerpAPI搜索集成开发中...")
-                    # TODO: 实现SerpAPI搜索
+                # 按配置顺序取第一个有结果的渠道，其余仍在进行的搜索直接取消
+                results = []
+                pending = list(channel_tasks.items())
+                try:
+                    while pending:
+                        channel, task = pending.pop(0)
+                        results = await task
+                        if results:
+                            logger.info(f"✅ {channel} 搜索返回 {len(results)} 条结果")
+                            break  # 成功获取结果，退出循环
+                finally:
+                    for _, task in pending:
+                        task.cancel()
+            finally:
+                db.close()
             
             if not results:
                 logger.warning("⚠️ 所有搜索渠道均未返回结果")
@@ -1240,6 +1696,75 @@ class HybridRetrievalEngine:
                 "content": f"联网搜索失败: {str(e)}"
             }]
     
+    async def _record_search_usage(self, provider_id: int):
+        """累计一次搜索提供商使用量，达到阈值或间隔时批量写库"""
+        self._search_usage_pending[provider_id] += 1
+        self._search_usage_pending_total += 1
+        
+        if (
+            self._search_usage_pending_total >= self.SEARCH_USAGE_FLUSH_THRESHOLD
+            or time.monotonic() - self._search_usage_flushed_at >= self.SEARCH_USAGE_FLUSH_INTERVAL
+        ):
+            await self.flush_search_usage()
+    
+    async def flush_search_usage(self):
+        """将累计的搜索提供商使用量写入数据库（应用关闭时也应调用）"""
+        self._search_usage_flushed_at = time.monotonic()
+        if not self._search_usage_pending:
+            return
+        
+        pending = self._search_usage_pending
+        self._search_usage_pending = defaultdict(int)
+        self._search_usage_pending_total = 0
+        
+        try:
+            await asyncio.to_thread(self._write_search_usage, pending)
+        except Exception as e:
+            logger.error(f"搜索提供商使用量写库失败: {e}")
+    
+    async def run_search_usage_flusher(self):
+        """后台定期写入累计的使用量（搜索稀疏时不必等到下一次搜索或应用关闭），由应用生命周期启动并取消"""
+        while True:
+            await asyncio.sleep(self.SEARCH_USAGE_FLUSH_INTERVAL)
+            if self._search_usage_pending:
+                await self.flush_search_usage()
+    
+    def _write_search_usage(self, pending: Dict[int, int]):
+        """在独立会话中一次提交多个提供商的使用量增量（跨天时先重置）"""
+        from app.models.database import SessionLocal, SearchProvider
+        
+        today = date.today()
+        db = SessionLocal()
+        try:
+            providers = db.query(SearchProvider).filter(
+                SearchProvider.id.in_(list(pending))
+            ).all()
+            for provider in providers:
+                last_reset_date = provider.last_reset_date
+                if isinstance(last_reset_date, datetime):
+                    last_reset_date = last_reset_date.date()
+                if last_reset_date != today:
+                    provider.current_usage = 0
+                    provider.last_reset_date = today
+                
+                provider.current_usage = (provider.current_usage or 0) + pending[provider.id]
+            db.commit()
+        finally:
+            db.close()
+    
+    def _get_tavily_client(self, api_key: str) -> "TavilySearch":
+        """按API密钥复用Tavily客户端（LRU，最多 TAVILY_CLIENT_CACHE_SIZE 个；HTTP连接池由所有客户端共享）"""
+        tavily = self._tavily_clients.get(api_key)
+        if tavily is None:
+            from app.core.tavily_search import TavilySearch
+            tavily = TavilySearch(api_key)
+            self._tavily_clients[api_key] = tavily
+            if len(self._tavily_clients) > self.TAVILY_CLIENT_CACHE_SIZE:
+                self._tavily_clients.popitem(last=False)
+        else:
+            self._tavily_clients.move_to_end(api_key)
+        return tavily
+    
     async def _search_with_tavily(
         self,
         query: str,
@@ -1248,16 +1773,14 @@ class HybridRetrievalEngine:
     ) -> List[Dict[str, Any]]:
         """使用Tavily执行搜索"""
         try:
-            from app.core.tavily_search import TavilySearch
-            
             # 🎯 优化搜索配置，获取更多结果
             max_results = max(app_config.get("top_k", 5), 8)  # 至少8条结果
             search_depth = provider.config.get("search_depth", "basic") if provider.config else "basic"
             
             logger.info(f"🔍 Tavily搜索参数: query='{query}', max_results={max_results}, depth={search_depth}")
             
-            # 创建Tavily客户端
-            tavily = TavilySearch(provider.api_key)
+            # 复用Tavily客户端
+            tavily = self._get_tavily_client(provider.api_key)
             
             # 执行搜索
             search_results = await tavily.search(
@@ -1272,27 +1795,22 @@ class HybridRetrievalEngine:
             formatted_results = tavily.format_results_for_rag(search_results)
             
             if formatted_results:
-                logger.info(f"✅ Tavily成功返回 {len(formatted_results)} 条格式化结果")
-                # 记录所有结果的标题、来源和相关度
-                for idx, result in enumerate(formatted_results, 1):
-                    source_type = result.get('source', 'unknown')
-                    title = result.get('title', 'N/A')[:60]
-                    relevance = result.get('relevance', result.get('similarity', 0))
-                    logger.info(f"  [{idx}] ({source_type}) {title} (相关度: {relevance:.2%})")
+                # 记录所有结果的标题、来源和相关度（汇总为一条日志）
+                logger.opt(lazy=True).info(
+                    "✅ Tavily成功返回 {} 条格式化结果{}",
+                    lambda: len(formatted_results),
+                    lambda: "".join(
+                        f"\n  [{idx}] ({result.get('source', 'unknown')}) {result.get('title', 'N/A')[:60]} "
+                        f"(相关度: {result.get('relevance', result.get('similarity', 0)):.2%})"
+                        for idx, result in enumerate(formatted_results, 1)
+                    )
+                )
             else:
                 logger.warning("⚠️ Tavily搜索未返回任何格式化结果")
             
-            # 更新使用量
-            from datetime import date
-            if provider.last_reset_date != date.today():
-                provider.current_usage = 0
-                provider.last_reset_date = date.today()
-            
-            provider.current_usage += 1
-            
-            from app.models.database import get_db
-            db = next(get_db())
-            db.commit()
+            # 更新使用量（内存累计，批量写库；缓存命中未调用API，不计入）
+            if not search_results.get("cached"):
+                await self._record_search_usage(provider.id)
             
             return formatted_results
             
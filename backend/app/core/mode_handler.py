@@ -5,8 +5,10 @@
 
 from typing import Dict, List, Tuple, Optional, Any, TYPE_CHECKING
 from loguru import logger
-from app.core.mode_presets import get_mode_config, MODE_PRESETS
-import asyncio
+from app.core.mode_presets import get_mode_config, get_mode_description, ModeConfigView, MODE_PRESETS
+from app.core.semantic_cache import SemanticAnswerCache, exact_answer_cache, normalize_query
+from app.core.fixed_qa_matcher import FixedQAMatcher, get_matcher
+from app.core.hybrid_retrieval_engine import hybrid_retrieval_engine
 
 if TYPE_CHECKING:
     from app.models.database import Application
@@ -24,8 +26,73 @@ class ModeHandler:
         self.app = application
         self.mode = application.mode
         self.config = application.get_mode_config_with_defaults()
+        self.cfg = ModeConfigView.from_config(self.config)
+        self.cache = SemanticAnswerCache.for_app(self.app.id, self.mode, self.config)
+        self._matcher_factory = get_matcher
+        
+        # 模式在处理器生命周期内不变，构造时一次性确定处理方法
+        # （与 MODE_PRESETS 的键一致；模式在创建/更新应用时已校验）
+        mode_processors = {
+            "safe": self._process_safe_mode,
+            "standard": self._process_standard_mode,
+            "enhanced": self._process_enhanced_mode
+        }
+        self._processor = mode_processors.get(self.mode)
+        if self._processor is None:
+            logger.warning("⚠️  未知模式: {}，使用标准模式", self.mode)
+            self._processor = self._process_standard_mode
         
-        logger.info(f"🎯 初始化模式处理器: {self.app.name} ({self.mode}模式)")
+        logger.info("🎯 初始化模式处理器: {} ({}模式)", self.app.name, self.mode)
+    
+    def _get_matcher(self) -> FixedQAMatcher:
+        """获取固定Q&A匹配器（按应用跨请求复用，避免重复构建索引）"""
+        return self._matcher_factory(self.app.id)
+    
+    @staticmethod
+    def _response(
+        answer: str,
+        source: str,
+        confidence: float,
+        mode: str,
+        match_type: str,
+        note: str,
+        references: Optional[List[Dict]] = None,
+        recommendations: Optional[List[Dict]] = None
+    ) -> Dict[str, Any]:
+        """构建统一结构的处理结果"""
+        return {
+            "answer": answer,
+            "source": source,
+            "confidence": confidence,
+            "references": references if references is not None else [],
+            "recommendations": recommendations if recommendations is not None else [],
+            "metadata": {
+                "mode": mode,
+                "match_type": match_type,
+                "note": note
+            }
+        }
+    
+    @staticmethod
+    def _fixed_qa_reference(match: Dict, **metadata) -> List[Dict]:
+        """固定Q&A的引用来源（单条）"""
+        return [{
+            "type": "fixed_qa",
+            "content": match['answer'],
+            "metadata": {"qa_id": match['id'], **metadata}
+        }]
+    
+    @staticmethod
+    def _filter_matches(matches: List[Dict], top_k: int, threshold: float) -> List[Dict]:
+        """从降序的检索结果中取前top_k个且不低于阈值的Q&A"""
+        return [m for m in matches[:top_k] if m['confidence'] >= threshold]
+    
+    @staticmethod
+    def _top_match(matches: List[Dict], threshold: float) -> Optional[Dict]:
+        """检索结果中的最佳Q&A（达到阈值时）"""
+        if matches and matches[0]['confidence'] >= threshold:
+            return matches[0]
+        return None
     
     async def process_query(
         self,
@@ -50,23 +117,41 @@ class ModeHandler:
                 "metadata": Dict           # 元数据
             }
         """
-        logger.info(f"📝 处理查询: {query[:50]}... (模式: {self.mode})")
-        
-        # 根据模式选择处理策略
-        if self.mode == "safe":
-            return await self._process_safe_mode(query, context_messages, **kwargs)
-        elif self.mode == "standard":
-            return await self._process_standard_mode(query, context_messages, **kwargs)
-        elif self.mode == "enhanced":
-            return await self._process_enhanced_mode(query, context_messages, **kwargs)
-        else:
-            logger.warning(f"⚠️  未知模式: {self.mode}，使用标准模式")
-            return await self._process_standard_mode(query, context_messages, **kwargs)
+        # 截断查询延迟到日志真正输出时才执行
+        logger.opt(lazy=True).info("📝 处理查询: {}... (模式: {})", lambda: query[:50], lambda: self.mode)
+        
+        # 有上下文时答案依赖对话历史，不走缓存
+        exact_key = None
+        if not context_messages:
+            exact_key = (self.app.id, self.mode, self.cache.config_hash, normalize_query(query))
+            cached = exact_answer_cache.get(exact_key)
+            if cached is not None:
+                return cached
+        
+        # 查询只向量化一次，语义缓存与固定Q&A匹配共用
+        query_vector = await self._get_matcher().embed_query(query)
+        
+        use_cache = query_vector is not None and not context_messages
+        if use_cache:
+            cached = self.cache.get(query_vector)
+            if cached is not None:
+                exact_answer_cache.put(exact_key, cached)
+                return cached
+        
+        # 按构造时确定的模式处理方法执行
+        result = await self._processor(query, context_messages, query_vector=query_vector, **kwargs)
+        
+        if use_cache:
+            self.cache.put(query_vector, result)
+        if exact_key is not None:
+            exact_answer_cache.put(exact_key, result)
+        return result
     
     async def _process_safe_mode(
         self,
         query: str,
         context_messages: List[Dict] = None,
+        query_vector=None,
         **kwargs
     ) -> Dict[str, Any]:
         """安全模式处理逻辑
@@ -78,81 +163,56 @@ class ModeHandler:
         """
         logger.info("🔒 使用安全模式处理")
         
-        from app.core.fixed_qa_matcher import FixedQAMatcher
-        
-        # 1. 精确匹配固定Q&A
-        matcher = FixedQAMatcher(self.app.id)
-        exact_match = await matcher.find_exact_match(
+        # 精确匹配与相似推荐共用一次检索
+        recommend_count = self.cfg.recommend_count
+        matches = await self._get_matcher().search_all(
             query,
-            threshold=self.config.get('fixed_qa_threshold', 0.85)
+            top_k=max(1, recommend_count),
+            query_vector=query_vector
         )
         
+        # 1. 精确匹配固定Q&A
+        exact_match = self._top_match(matches, self.cfg.fixed_qa_threshold)
+        
         if exact_match:
-            logger.info(f"✅ 找到精确匹配 (置信度: {exact_match['confidence']:.2%})")
-            return {
-                "answer": exact_match['answer'],
-                "source": "fixed_qa_exact",
-                "confidence": exact_match['confidence'],
-                "references": [{
-                    "type": "fixed_qa",
-                    "content": exact_match['answer'],
-                    "metadata": {
-                        "qa_id": exact_match['id'],
-                        "question": exact_match['question'],
-                        "category": exact_match.get('category')
-                    }
-                }],
-                "recommendations": [],
-                "metadata": {
-                    "mode": "safe",
-                    "match_type": "exact",
-                    "note": "【官方答案】"
-                }
-            }
+            logger.info("✅ 找到精确匹配 (置信度: {:.2%})", exact_match['confidence'])
+            return self._response(
+                exact_match['answer'], "fixed_qa_exact", exact_match['confidence'],
+                "safe", "exact", "【官方答案】",
+                references=self._fixed_qa_reference(
+                    exact_match,
+                    question=exact_match['question'],
+                    category=exact_match.get('category')
+                )
+            )
         
         # 2. 查找相似问题
-        similar_questions = await matcher.find_similar_questions(
-            query,
-            top_k=self.config.get('recommend_count', 5),
-            threshold=self.config.get('recommend_threshold', 0.65)
+        similar_questions = self._filter_matches(
+            matches,
+            recommend_count,
+            self.cfg.recommend_threshold
         )
         
         if similar_questions:
-            logger.info(f"💡 找到 {len(similar_questions)} 个相似问题")
-            fallback_msg = self.config.get('fallback_message', '抱歉，未找到准确答案。以下是相关问题推荐：')
-            
-            return {
-                "answer": fallback_msg,
-                "source": "fixed_qa_recommend",
-                "confidence": 0.0,
-                "references": [],
-                "recommendations": similar_questions,
-                "metadata": {
-                    "mode": "safe",
-                    "match_type": "recommend",
-                    "note": "【相似问题推荐】"
-                }
-            }
+            logger.info("💡 找到 {} 个相似问题", len(similar_questions))
+            return self._response(
+                self.cfg.fallback_message, "fixed_qa_recommend", 0.0,
+                "safe", "recommend", "【相似问题推荐】",
+                recommendations=similar_questions
+            )
         
         # 3. 完全没有匹配
         logger.warning("❌ 未找到任何匹配")
-        return {
-            "answer": "抱歉，未找到相关答案。请尝试换个方式提问或联系人工客服。",
-            "source": "none",
-            "confidence": 0.0,
-            "references": [],
-            "recommendations": [],
-            "metadata": {
-                "mode": "safe",
-                "match_type": "none",
-                "note": "【无匹配结果】"
-            }
-        }
+        return self._response(
+            "抱歉，未找到相关答案。请尝试换个方式提问或联系人工客服。", "none", 0.0,
+            "safe", "none", "【无匹配结果】"
+        )
     
     async def _process_standard_mode(
         self,
         query: str,
         context_messages: List[Dict] = None,
+        query_vector=None,
         **kwargs
     ) -> Dict[str, Any]:
         """标准模式处理逻辑
@@ -165,84 +225,57 @@ class ModeHandler:
         """
         logger.info("⚡ 使用标准模式处理")
         
-        from app.core.fixed_qa_matcher import FixedQAMatcher
-        from app.core.hybrid_retrieval_engine import HybridRetrievalEngine
-        
-        # 1. 精确匹配固定Q&A
-        matcher = FixedQAMatcher(self.app.id)
-        exact_match = await matcher.find_exact_match(
+        # 1~2. 精确匹配、高置信度相似问题与推荐问题共用一次检索，本地按阈值切片
+        recommend_count = self.cfg.recommend_count
+        matches = await self._get_matcher().search_all(
             query,
-            threshold=self.config.get('fixed_qa_threshold', 0.90)
+            top_k=max(5, recommend_count),
+            query_vector=query_vector
+        )
+        exact_match = self._top_match(matches, self.cfg.fixed_qa_threshold)
+        similar_questions = self._filter_matches(
+            matches,
+            1,
+            self.cfg.fixed_qa_recommend_threshold
         )
+        more_similar = self._filter_matches(matches, len(matches), 0.60)
         
         if exact_match:
-            logger.info(f"✅ 固定Q&A精确匹配 (置信度: {exact_match['confidence']:.2%})")
+            logger.info("✅ 固定Q&A精确匹配 (置信度: {:.2%})", exact_match['confidence'])
             
-            # 同时获取相似问题推荐
-            similar_questions = await matcher.find_similar_questions(
-                query,
-                top_k=self.config.get('recommend_count', 3),
-                threshold=0.65
-            )
+            # 相似问题推荐（按相似度降序，先截取再按阈值过滤）
+            similar_for_exact = [
+                q for q in more_similar[:recommend_count]
+                if q['confidence'] >= 0.65
+            ]
             
-            return {
-                "answer": exact_match['answer'],
-                "source": "fixed_qa_exact",
-                "confidence": exact_match['confidence'],
-                "references": [{
-                    "type": "fixed_qa",
-                    "content": exact_match['answer'],
-                    "metadata": {
-                        "qa_id": exact_match['id'],
-                        "question": exact_match['question']
-                    }
-                }],
-                "recommendations": similar_questions[:3],  # 最多3个推荐
-                "metadata": {
-                    "mode": "standard",
-                    "match_type": "exact",
-                    "note": "【官方答案】"
-                }
-            }
-        
-        # 2. 查找相似问题（高置信度）
-        similar_questions = await matcher.find_similar_questions(
-            query,
-            top_k=1,
-            threshold=self.config.get('fixed_qa_recommend_threshold', 0.70)
-        )
+            return self._response(
+                exact_match['answer'], "fixed_qa_exact", exact_match['confidence'],
+                "standard", "exact", "【官方答案】",
+                references=self._fixed_qa_reference(exact_match, question=exact_match['question']),
+                recommendations=similar_for_exact[:3]  # 最多3个推荐
+            )
         
+        # 2. 高置信度相似问题
         if similar_questions and similar_questions[0]['confidence'] > 0.70:
-            logger.info(f"💡 找到高置信度相似问题 (置信度: {similar_questions[0]['confidence']:.2%})")
-            
-            # 获取更多推荐
-            more_similar = await matcher.find_similar_questions(query, top_k=5, threshold=0.60)
+            logger.info("💡 找到高置信度相似问题 (置信度: {:.2%})", similar_questions[0]['confidence'])
             
-            return {
-                "answer": similar_questions[0]['answer'],
-                "source": "fixed_qa_similar",
-                "confidence": similar_questions[0]['confidence'],
-                "references": [{
-                    "type": "fixed_qa",
-                    "content": similar_questions[0]['answer'],
-                    "metadata": {
-                        "qa_id": similar_questions[0]['id'],
-                        "question": similar_questions[0]['question'],
-                        "original_question": query
-                    }
-                }],
-                "recommendations": more_similar[1:4],  # 显示其他相关问题
-                "metadata": {
-                    "mode": "standard",
-                    "match_type": "similar",
-                    "note": "【相似问题匹配】"
-                }
-            }
+            best = similar_questions[0]
+            return self._response(
+                best['answer'], "fixed_qa_similar", best['confidence'],
+                "standard", "similar", "【相似问题匹配】",
+                references=self._fixed_qa_reference(
+                    best,
+                    question=best['question'],
+                    original_question=query
+                ),
+                recommendations=more_similar[1:4]  # 显示其他相关问题
+            )
         
         # 3. 使用知识库 + AI生成答案
         logger.info("🤖 使用知识库检索 + AI生成")
         
-        retrieval_engine = HybridRetrievalEngine(db=kwargs.get('db'))
+        retrieval_engine = hybrid_retrieval_engine
         
         result = await retrieval_engine.retrieve_and_generate(
             app_id=self.app.id,
@@ -253,12 +286,11 @@ class ModeHandler:
         
         # 添加模式信息
         result['metadata']['mode'] = 'standard'
-        if result['confidence'] < self.config.get('vector_kb_threshold', 0.75):
-            result['metadata']['note'] = self.config.get('ai_generation_note', '【AI生成-建议核实】')
+        if result['confidence'] < self.cfg.vector_kb_threshold:
+            result['metadata']['note'] = self.cfg.ai_generation_note
         
-        # 添加相似问题推荐
-        all_similar = await matcher.find_similar_questions(query, top_k=3, threshold=0.60)
-        result['recommendations'] = all_similar
+        # 添加相似问题推荐（复用上面的检索结果）
+        result['recommendations'] = more_similar[:3]
         
         return result
     
@@ -266,6 +298,7 @@ class ModeHandler:
         self,
         query: str,
         context_messages: List[Dict] = None,
+        query_vector=None,
         **kwargs
     ) -> Dict[str, Any]:
         """增强模式处理逻辑
@@ -278,65 +311,52 @@ class ModeHandler:
         """
         logger.info("🌐 使用增强模式处理")
         
-        from app.core.fixed_qa_matcher import FixedQAMatcher
-        from app.core.hybrid_retrieval_engine import HybridRetrievalEngine
-        
         # 1. 精确匹配固定Q&A（阈值更高）
-        matcher = FixedQAMatcher(self.app.id)
+        matcher = self._get_matcher()
         exact_match = await matcher.find_exact_match(
             query,
-            threshold=self.config.get('fixed_qa_threshold', 0.95)
+            threshold=self.cfg.fixed_qa_threshold,
+            query_vector=query_vector
         )
         
         if exact_match:
-            logger.info(f"✅ 固定Q&A精确匹配 (置信度: {exact_match['confidence']:.2%})")
-            return {
-                "answer": exact_match['answer'],
-                "source": "fixed_qa_exact",
-                "confidence": exact_match['confidence'],
-                "references": [{
-                    "type": "fixed_qa",
-                    "content": exact_match['answer'],
-                    "metadata": {"qa_id": exact_match['id']}
-                }],
-                "recommendations": [],
-                "metadata": {
-                    "mode": "enhanced",
-                    "match_type": "exact",
-                    "note": "【官方答案】"
-                }
-            }
+            logger.info("✅ 固定Q&A精确匹配 (置信度: {:.2%})", exact_match['confidence'])
+            return self._response(
+                exact_match['answer'], "fixed_qa_exact", exact_match['confidence'],
+                "enhanced", "exact", "【官方答案】",
+                references=self._fixed_qa_reference(exact_match)
+            )
         
         # 2. 知识库检索 + 可能的联网搜索
-        retrieval_engine = HybridRetrievalEngine(db=kwargs.get('db'))
+        retrieval_engine = hybrid_retrieval_engine
         
         # 先尝试知识库检索
         kb_result = await retrieval_engine.retrieve_from_kb(
             app_id=self.app.id,
             query=query,
-            top_k=self.config.get('top_k', 8)
+            top_k=self.cfg.top_k
         )
         
         # 判断是否需要联网搜索
         need_web_search = False
-        if kb_result and kb_result.get('confidence', 0) < self.config.get('web_search_auto_threshold', 0.50):
+        if kb_result and kb_result.get('confidence', 0) < self.cfg.web_search_auto_threshold:
             need_web_search = True
-            logger.info(f"⚠️  知识库置信度低 ({kb_result['confidence']:.2%})，启动联网搜索")
+            logger.info("⚠️  知识库置信度低 ({:.2%})，启动联网搜索", kb_result['confidence'])
         elif not kb_result:
             need_web_search = True
             logger.info("⚠️  知识库无结果，启动联网搜索")
         
         # 3. 联网搜索（如果需要）
         web_results = []
-        if need_web_search and self.config.get('allow_web_search', True):
+        if need_web_search and self.cfg.allow_web_search:
             try:
                 web_results = await retrieval_engine.web_search(
                     query=query,
                     config=self.config
                 )
-                logger.info(f"🌐 联网搜索找到 {len(web_results)} 条结果")
+                logger.info("🌐 联网搜索找到 {} 条结果", len(web_results))
             except Exception as e:
-                logger.error(f"❌ 联网搜索失败: {e}")
+                logger.error("❌ 联网搜索失败: {}", e)
         
         # 4. AI综合生成答案
         result = await retrieval_engine.generate_answer(
@@ -352,18 +372,17 @@ class ModeHandler:
         result['metadata']['web_search_used'] = len(web_results) > 0
         
         if web_results:
-            result['metadata']['note'] = self.config.get('web_search_note', '【含联网信息】')
+            result['metadata']['note'] = self.cfg.web_search_note
         else:
-            result['metadata']['note'] = self.config.get('ai_generation_note', '【AI综合-建议核实】')
+            result['metadata']['note'] = self.cfg.ai_generation_note
         
         return result
     
     def get_mode_info(self) -> Dict[str, Any]:
         """获取当前模式信息"""
-        from app.core.mode_presets import get_mode_description
         return {
             "mode": self.mode,
-            "config": self.config,
+            "config": dict(self.config),
             "description": get_mode_description(self.mode)
         }
 
@@ -3,6 +3,11 @@
 定义三种工作模式的默认配置
 """
 
+from collections import ChainMap
+from dataclasses import dataclass, fields
+from types import MappingProxyType
+from typing import Mapping
+
 # 🔒 安全模式配置
 SAFE_MODE = {
     "priority_order": ["fixed_qa_exact", "fixed_qa_similar"],
@@ -72,6 +77,9 @@ MODE_PRESETS = {
     "enhanced": ENHANCED_MODE
 }
 
+# 只读预设视图（导入时构建一次，防止请求路径意外修改预设）
+_FROZEN_PRESETS = {mode: MappingProxyType(preset) for mode, preset in MODE_PRESETS.items()}
+
 # 模式描述（用于前端显示）
 MODE_DESCRIPTIONS = {
     "safe": {
@@ -119,7 +127,7 @@ MODE_DESCRIPTIONS = {
 }
 
 
-def get_mode_config(mode: str, custom_config: dict = None) -> dict:
+def get_mode_config(mode: str, custom_config: dict = None) -> ChainMap:
     """获取模式配置
     
     Args:
@@ -127,16 +135,35 @@ def get_mode_config(mode: str, custom_config: dict = None) -> dict:
         custom_config: 自定义配置（会覆盖预设）
         
     Returns:
-        完整的模式配置字典
+        完整的模式配置映射（自定义配置在前，只读预设在后，不复制预设；
+        写入只会落在自定义配置层，需要普通dict时用 dict(...) 转换）
     """
-    # 获取预设配置
-    preset = MODE_PRESETS.get(mode, MODE_PRESETS["standard"]).copy()
+    preset = _FROZEN_PRESETS.get(mode, _FROZEN_PRESETS["standard"])
+    return ChainMap(dict(custom_config or {}), preset)
+
+
+@dataclass(frozen=True)
+class ModeConfigView:
+    """模式处理器热路径使用的配置项（请求开始时物化一次，之后按属性读取）
     
-    # 如果有自定义配置，合并
-    if custom_config:
-        preset.update(custom_config)
+    默认值仅在预设与自定义配置都缺少该项时生效，各模式预设已覆盖自身用到的项。
+    """
+    fixed_qa_threshold: float = 0.90
+    fixed_qa_recommend_threshold: float = 0.70
+    recommend_count: int = 3
+    recommend_threshold: float = 0.65
+    vector_kb_threshold: float = 0.75
+    web_search_auto_threshold: float = 0.50
+    allow_web_search: bool = True
+    top_k: int = 8
+    fallback_message: str = "抱歉，未找到准确答案。以下是相关问题推荐："
+    ai_generation_note: str = "【AI生成-建议核实】"
+    web_search_note: str = "【含联网信息】"
     
-    return preset
+    @classmethod
+    def from_config(cls, config: Mapping) -> "ModeConfigView":
+        """从完整模式配置中提取字段"""
+        return cls(**{f.name: config[f.name] for f in fields(cls) if f.name in config})
 
 
 def validate_mode(mode: str) -> bool:
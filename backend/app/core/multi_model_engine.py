@@ -2,11 +2,29 @@
 多模型推理引擎 - 支持多个API提供商
 """
 
-from typing import Optional, Dict, Any, List, Iterator, Union
+from typing import Optional, Dict, Any, List, AsyncIterator, Tuple, Union
 from loguru import logger
+import hashlib
 import httpx
-import json
+import re
+import time
 from app.core.config import settings
+from app.core.semantic_cache import llm_response_cache
+from app.utils import json_codec
+from app.utils.http2 import HTTP2_AVAILABLE
+
+# 支持HTTP/2的提供商（其余提供商或自定义地址保持HTTP/1.1 keep-alive）
+HTTP2_PROVIDERS = {"openai", "anthropic"}
+
+# 连接池上限：HTTP/2下少量连接即可多路复用所有并发请求，HTTP/1.1每个并发请求需要独立连接
+HTTP2_LIMITS = httpx.Limits(max_connections=10, max_keepalive_connections=10, keepalive_expiry=30.0)
+HTTP1_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=30.0)
+
+# OpenAI兼容SSE数据行中的增量文本字段（完整的JSON字符串字面量或null）
+_DELTA_CONTENT_RE = re.compile(r'"content":\s*("(?:[^"\\]|\\.)*"|null)')
+
+# API密钥验证结果（含模型列表）缓存时间（秒）
+MODEL_LIST_CACHE_TTL = 3600
 
 
 class MultiModelEngine:
@@ -61,25 +79,98 @@ class MultiModelEngine:
         self.api_keys: Dict[str, str] = {}
         self.custom_configs: Dict[str, Dict[str, Any]] = {}
         self.available_models: Dict[str, List[str]] = {}  # 存储每个提供商的可用模型
+        self._clients: Dict[str, httpx.AsyncClient] = {}  # 每个提供商一个持久连接池
+        # 验证结果缓存: (provider, api_key哈希, base_url) -> (过期时间, 验证结果)
+        self._model_cache: Dict[Tuple[str, str, str], Tuple[float, Dict[str, Any]]] = {}
+        self._providers_cache: Optional[List[Dict[str, Any]]] = None  # list_providers() 结果
+    
+    def _get_client(self, provider: str) -> httpx.AsyncClient:
+        """获取提供商的持久HTTP客户端（惰性创建，复用keep-alive连接）"""
+        client = self._clients.get(provider)
+        if client is None or client.is_closed:
+            http2 = HTTP2_AVAILABLE and provider in HTTP2_PROVIDERS
+            client = httpx.AsyncClient(
+                timeout=httpx.Timeout(60.0, connect=10.0),
+                limits=HTTP2_LIMITS if http2 else HTTP1_LIMITS,
+                http2=http2,
+                follow_redirects=True
+            )
+            self._clients[provider] = client
+        return client
+    
+    async def aclose(self):
+        """关闭所有持久HTTP客户端（应用关闭时调用）"""
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            await client.aclose()
     
     def set_api_key(self, provider: str, api_key: str):
         """设置API密钥"""
+        if provider not in self.api_keys:
+            self._providers_cache = None  # 配置状态变化，提供商列表需重建
         self.api_keys[provider] = api_key
         logger.info(f"已设置 {provider} API密钥")
     
+    def remove_api_key(self, provider: str) -> bool:
+        """删除API密钥，返回是否存在"""
+        if self.api_keys.pop(provider, None) is None:
+            return False
+        self._providers_cache = None
+        return True
+    
     def set_custom_config(self, provider: str, config: Dict[str, Any]):
         """设置自定义配置"""
         self.custom_configs[provider] = config
+        self._providers_cache = None
         logger.info(f"已设置 {provider} 自定义配置")
     
     def set_available_models(self, provider: str, models: List[str]):
         """设置提供商的可用模型列表"""
         self.available_models[provider] = models
+        self._providers_cache = None
         logger.info(f"已设置 {provider} 可用模型: {len(models)} 个")
     
-    async def verify_api_key(self, provider: str, api_key: str, base_url: Optional[str] = None) -> Dict[str, Any]:
+    async def verify_api_key(
+        self,
+        provider: str,
+        api_key: str,
+        base_url: Optional[str] = None,
+        force_refresh: bool = False
+    ) -> Dict[str, Any]:
         """
-        验证API密钥是否有效
+        验证API密钥是否有效（成功结果按 提供商+密钥+地址 缓存1小时，避免重复请求 /models）
+        
+        Args:
+            force_refresh: 忽略缓存，重新请求提供商
+        
+        Returns:
+            与 _verify_api_key() 相同
+        """
+        base_url = base_url or self.PROVIDERS.get(provider, {}).get("base_url", "")
+        key = (provider, hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:16], base_url)
+        
+        entry = self._model_cache.get(key)
+        if entry is not None and not force_refresh and entry[0] > time.monotonic():
+            logger.info(f"🎯 使用缓存的 {provider} 验证结果 ({len(entry[1]['models'])} 个模型)")
+            return {**entry[1], "models": list(entry[1]["models"])}
+        
+        result = await self._verify_api_key(provider, api_key, base_url)
+        if result["valid"]:
+            self._model_cache[key] = (time.monotonic() + MODEL_LIST_CACHE_TTL, result)
+            result = {**result, "models": list(result["models"])}
+        else:
+            self._model_cache.pop(key, None)
+        return result
+    
+    @staticmethod
+    def _body_preview(response: httpx.Response, limit: int) -> str:
+        """响应体前 limit 字节的文本预览（只解码需要的部分，避免对大错误页整体解码）"""
+        return response.content[:limit].decode("utf-8", errors="replace")
+    
+    async def _verify_api_key(self, provider: str, api_key: str, base_url: Optional[str] = None) -> Dict[str, Any]:
+        """
+        验证API密钥是否有效（实际请求提供商）
         
         Returns:
             {
@@ -91,9 +182,12 @@ class MultiModelEngine:
         provider_info = self.PROVIDERS.get(provider, {})
         test_base_url = base_url or provider_info.get("base_url", "")
         
-        logger.info(f"🔍 开始验证 {provider} API密钥...")
-        logger.info(f"   Base URL: {test_base_url}")
-        logger.info(f"   API Key前缀: {api_key[:10]}..." if api_key else "   API Key: 未提供")
+        logger.info("🔍 开始验证 {} API密钥...", provider)
+        logger.info("   Base URL: {}", test_base_url)
+        if api_key:
+            logger.info("   API Key前缀: {}...", api_key[:10])
+        else:
+            logger.info("   API Key: 未提供")
         
         try:
             # 尝试获取模型列表
@@ -102,92 +196,93 @@ class MultiModelEngine:
                 "Content-Type": "application/json"
             }
             
-            # 增加超时时间，支持代理
-            async with httpx.AsyncClient(timeout=60.0, follow_redirects=True) as client:
-                # 对于OpenAI兼容的API，尝试获取模型列表
-                if provider in ["openai", "openrouter", "deepseek", "qwen", "local"]:
-                    try:
-                        logger.info(f"   尝试获取模型列表: {test_base_url}/models")
-                        response = await client.get(
-                            f"{test_base_url}/models",
-                            headers=headers
-                        )
-                        logger.info(f"   响应状态码: {response.status_code}")
-                        
-                        if response.status_code == 200:
-                            data = response.json()
-                            models = [m.get("id") or m.get("name") for m in data.get("data", [])]
-                            logger.info(f"   ✅ 成功获取 {len(models)} 个模型")
-                            return {
-                                "valid": True,
-                                "message": "API密钥验证成功",
-                                "models": models if models else []
-                            }
-                        else:
-                            logger.warning(f"   获取模型列表失败: {response.status_code} - {response.text[:200]}")
-                    except Exception as e:
-                        logger.warning(f"   获取模型列表异常: {str(e)}")
-                
-                # 如果获取模型列表失败，尝试简单的聊天请求
-                logger.info(f"   尝试备用验证方式: 发送测试请求")
+            # 复用提供商的持久连接（超时60秒，跟随重定向）
+            client = self._get_client(provider)
+            
+            # 对于OpenAI兼容的API，尝试获取模型列表
+            if provider in ["openai", "openrouter", "deepseek", "qwen", "local"]:
+                try:
+                    logger.info("   尝试获取模型列表: {}/models", test_base_url)
+                    response = await client.get(
+                        f"{test_base_url}/models",
+                        headers=headers
+                    )
+                    logger.info("   响应状态码: {}", response.status_code)
+                    
+                    if response.status_code == 200:
+                        data = json_codec.loads(response.content)
+                        models = [m.get("id") or m.get("name") for m in data.get("data", [])]
+                        logger.info("   ✅ 成功获取 {} 个模型", len(models))
+                        return {
+                            "valid": True,
+                            "message": "API密钥验证成功",
+                            "models": models if models else []
+                        }
+                    else:
+                        logger.warning("   获取模型列表失败: {} - {}", response.status_code, self._body_preview(response, 200))
+                except Exception as e:
+                    logger.warning("   获取模型列表异常: {}", e)
+            
+            # 如果获取模型列表失败，尝试简单的聊天请求
+            logger.info("   尝试备用验证方式: 发送测试请求")
+            test_payload = {
+                "model": provider_info.get("default_model", "gpt-3.5-turbo"),
+                "messages": [{"role": "user", "content": "hi"}],
+                "max_tokens": 5
+            }
+            
+            if provider == "gemini":
+                # Gemini特殊处理
+                url = f"{test_base_url}/models/gemini-pro:generateContent?key={api_key}"
+                test_payload = {
+                    "contents": [{"role": "user", "parts": [{"text": "hi"}]}]
+                }
+                logger.info("   Gemini请求URL: {}/models/gemini-pro:generateContent", test_base_url)
+                response = await client.post(url, content=json_codec.dumps(test_payload), headers={"Content-Type": "application/json"})
+            elif provider == "anthropic":
+                # Claude特殊处理
+                headers["x-api-key"] = api_key
+                headers["anthropic-version"] = "2023-06-01"
+                del headers["Authorization"]
                 test_payload = {
-                    "model": provider_info.get("default_model", "gpt-3.5-turbo"),
+                    "model": "claude-3-haiku-20240307",
                     "messages": [{"role": "user", "content": "hi"}],
                     "max_tokens": 5
                 }
+                logger.info("   Claude请求URL: {}/messages", test_base_url)
+                response = await client.post(
+                    f"{test_base_url}/messages",
+                    headers=headers,
+                    content=json_codec.dumps(test_payload)
+                )
+            else:
+                # OpenAI兼容格式
+                url = f"{test_base_url}/chat/completions"
+                logger.info("   请求URL: {}", url)
+                response = await client.post(
+                    url,
+                    headers=headers,
+                    content=json_codec.dumps(test_payload)
+                )
+            
+            logger.info("   测试请求响应状态码: {}", response.status_code)
+            
+            if response.status_code in [200, 201]:
+                logger.info("   ✅ 测试请求成功")
+                return {
+                    "valid": True,
+                    "message": "API密钥验证成功（通过测试请求）",
+                    "models": []  # 模型列表获取失败，但API有效
+                }
+            else:
+                error_msg = f"HTTP {response.status_code}: {self._body_preview(response, 300)}"
+                logger.error("   ❌ 验证失败: {}", error_msg)
+                return {
+                    "valid": False,
+                    "message": f"API验证失败 - {error_msg}",
+                    "models": []
+                }
                 
-                if provider == "gemini":
-                    # Gemini特殊处理
-                    url = f"{test_base_url}/models/gemini-pro:generateContent?key={api_key}"
-                    test_payload = {
-                        "contents": [{"role": "user", "parts": [{"text": "hi"}]}]
-                    }
-                    logger.info(f"   Gemini请求URL: {url}")
-                    response = await client.post(url, json=test_payload)
-                elif provider == "anthropic":
-                    # Claude特殊处理
-                    headers["x-api-key"] = api_key
-                    headers["anthropic-version"] = "2023-06-01"
-                    del headers["Authorization"]
-                    test_payload = {
-                        "model": "claude-3-haiku-20240307",
-                        "messages": [{"role": "user", "content": "hi"}],
-                        "max_tokens": 5
-                    }
-                    logger.info(f"   Claude请求URL: {test_base_url}/messages")
-                    response = await client.post(
-                        f"{test_base_url}/messages",
-                        headers=headers,
-                        json=test_payload
-                    )
-                else:
-                    # OpenAI兼容格式
-                    url = f"{test_base_url}/chat/completions"
-                    logger.info(f"   请求URL: {url}")
-                    response = await client.post(
-                        url,
-                        headers=headers,
-                        json=test_payload
-                    )
-                
-                logger.info(f"   测试请求响应状态码: {response.status_code}")
-                
-                if response.status_code in [200, 201]:
-                    logger.info(f"   ✅ 测试请求成功")
-                    return {
-                        "valid": True,
-                        "message": "API密钥验证成功（通过测试请求）",
-                        "models": []  # 模型列表获取失败，但API有效
-                    }
-                else:
-                    error_msg = f"HTTP {response.status_code}: {response.text[:300]}"
-                    logger.error(f"   ❌ 验证失败: {error_msg}")
-                    return {
-                        "valid": False,
-                        "message": f"API验证失败 - {error_msg}",
-                        "models": []
-                    }
-                    
         except httpx.TimeoutException as e:
             error_msg = f"请求超时 - 可能需要配置代理或检查网络连接"
             logger.error(f"   ❌ {error_msg}: {str(e)}")
@@ -218,7 +313,13 @@ class MultiModelEngine:
         return self.PROVIDERS.get(provider, {})
     
     def list_providers(self) -> List[Dict[str, Any]]:
-        """列出所有支持的提供商"""
+        """列出所有支持的提供商（结果缓存，密钥或模型列表变化时重建）"""
+        if self._providers_cache is None:
+            self._providers_cache = self._build_provider_list()
+        return self._providers_cache
+    
+    def _build_provider_list(self) -> List[Dict[str, Any]]:
+        """构建提供商列表"""
         return [
             {
                 "id": provider_id,
@@ -239,8 +340,9 @@ class MultiModelEngine:
         stream: bool = False,
         temperature: float = 0.7,
         max_tokens: int = 2000,
+        use_cache: bool = False,
         **kwargs
-    ) -> Union[Dict[str, Any], Iterator[str]]:
+    ) -> Union[Dict[str, Any], AsyncIterator[str]]:
         """
         统一的聊天补全接口
         
@@ -248,9 +350,10 @@ class MultiModelEngine:
             provider: 提供商ID
             model: 模型名称
             messages: 消息列表
-            stream: 是否流式输出
+            stream: 是否流式输出（为True时返回逐段产出增量文本的异步迭代器）
             temperature: 温度参数
             max_tokens: 最大token数
+            use_cache: 是否使用LLM响应缓存（仅非流式请求；默认关闭，只供输入确定、可接受复用结果的内部调用开启）
         """
         if provider not in self.PROVIDERS:
             raise ValueError(f"不支持的提供商: {provider}")
@@ -260,28 +363,74 @@ class MultiModelEngine:
         base_url = self.custom_configs.get(provider, {}).get("base_url", provider_info["base_url"])
         api_key = self.api_keys.get(provider, "")
         
+        # 流式输出：边生成边返回增量文本，不经过响应缓存
+        if stream:
+            if provider == "gemini":
+                return self._gemini_stream(model, messages, api_key, temperature, max_tokens)
+            elif provider == "anthropic":
+                return self._anthropic_stream(model, messages, api_key, temperature, max_tokens)
+            return self._openai_compatible_stream(
+                provider, base_url, api_key, model, messages, temperature, max_tokens
+            )
+        
+        # 先查LLM响应缓存（精确 + 语义）
+        cache_key = None
+        if use_cache:
+            cached, cache_key = await llm_response_cache.lookup(provider, model, temperature, messages, max_tokens)
+            if cached is not None:
+                return cached
+        
         # 特殊处理不同提供商
         if provider == "gemini":
-            return await self._gemini_completion(model, messages, api_key, temperature, max_tokens)
+            response = await self._gemini_completion(model, messages, api_key, temperature, max_tokens)
         elif provider == "anthropic":
-            return await self._anthropic_completion(model, messages, api_key, stream, temperature, max_tokens)
+            response = await self._anthropic_completion(model, messages, api_key, temperature, max_tokens)
         else:
             # OpenAI兼容格式
-            return await self._openai_compatible_completion(
-                base_url, api_key, model, messages, stream, temperature, max_tokens
+            response = await self._openai_compatible_completion(
+                provider, base_url, api_key, model, messages, temperature, max_tokens
             )
+        
+        if cache_key is not None:
+            llm_response_cache.store(cache_key, response)
+        return response
     
     async def _openai_compatible_completion(
         self,
+        provider: str,
         base_url: str,
         api_key: str,
         model: str,
         messages: List[Dict[str, str]],
-        stream: bool,
         temperature: float,
         max_tokens: int
     ) -> Dict[str, Any]:
         """OpenAI兼容格式的API调用"""
+        headers, payload = self._openai_request(api_key, model, messages, temperature, max_tokens, stream=False)
+        
+        client = self._get_client(provider)
+        try:
+            response = await client.post(
+                f"{base_url}/chat/completions",
+                headers=headers,
+                content=json_codec.dumps(payload)
+            )
+            response.raise_for_status()
+            return json_codec.loads(response.content)
+        except Exception as e:
+            logger.error(f"API调用失败: {e}")
+            raise
+    
+    @staticmethod
+    def _openai_request(
+        api_key: str,
+        model: str,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        stream: bool
+    ) -> Tuple[Dict[str, str], Dict[str, Any]]:
+        """构造OpenAI兼容格式的请求头与请求体"""
         headers = {
             "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json"
@@ -294,19 +443,56 @@ class MultiModelEngine:
             "max_tokens": max_tokens,
             "stream": stream
         }
+        return headers, payload
+    
+    @staticmethod
+    def _delta_content(data: str) -> Optional[str]:
+        """提取SSE数据行中的增量文本：只解析 content 字符串字面量，其余情况回退到完整JSON解析"""
+        match = _DELTA_CONTENT_RE.search(data)
+        if match:
+            literal = match.group(1)
+            if literal == "null":
+                return None
+            # 无转义字符时直接切片，否则只解码这一个字符串字面量
+            return literal[1:-1] if "\\" not in literal else json_codec.loads(literal)
         
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            try:
-                response = await client.post(
-                    f"{base_url}/chat/completions",
-                    headers=headers,
-                    json=payload
-                )
+        choices = json_codec.loads(data).get("choices") or [{}]
+        return (choices[0].get("delta") or {}).get("content")
+    
+    async def _openai_compatible_stream(
+        self,
+        provider: str,
+        base_url: str,
+        api_key: str,
+        model: str,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int
+    ) -> AsyncIterator[str]:
+        """OpenAI兼容格式的流式API调用（SSE），逐段产出增量文本"""
+        headers, payload = self._openai_request(api_key, model, messages, temperature, max_tokens, stream=True)
+        
+        client = self._get_client(provider)
+        try:
+            async with client.stream(
+                "POST",
+                f"{base_url}/chat/completions",
+                headers=headers,
+                content=json_codec.dumps(payload)
+            ) as response:
                 response.raise_for_status()
-                return response.json()
-            except Exception as e:
-                logger.error(f"API调用失败: {e}")
-                raise
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    content = self._delta_content(data)
+                    if content:
+                        yield content
+        except Exception as e:
+            logger.error(f"流式API调用失败: {e}")
+            raise
     
     async def _gemini_completion(
         self,
@@ -336,42 +522,55 @@ class MultiModelEngine:
             }
         }
         
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            try:
-                response = await client.post(url, json=payload)
-                response.raise_for_status()
-                data = response.json()
-                
-                # 转换为OpenAI格式
-                text = data.get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text", "")
-                return {
-                    "choices": [{
-                        "message": {
-                            "role": "assistant",
-                            "content": text
-                        },
-                        "finish_reason": "stop"
-                    }],
-                    "usage": {
-                        "prompt_tokens": 0,
-                        "completion_tokens": 0,
-                        "total_tokens": 0
-                    }
+        client = self._get_client("gemini")
+        try:
+            response = await client.post(url, content=json_codec.dumps(payload), headers={"Content-Type": "application/json"})
+            response.raise_for_status()
+            data = json_codec.loads(response.content)
+            
+            # 转换为OpenAI格式
+            text = data.get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text", "")
+            return {
+                "choices": [{
+                    "message": {
+                        "role": "assistant",
+                        "content": text
+                    },
+                    "finish_reason": "stop"
+                }],
+                "usage": {
+                    "prompt_tokens": 0,
+                    "completion_tokens": 0,
+                    "total_tokens": 0
                 }
-            except Exception as e:
-                logger.error(f"Gemini API调用失败: {e}")
-                raise
+            }
+        except Exception as e:
+            logger.error(f"Gemini API调用失败: {e}")
+            raise
     
-    async def _anthropic_completion(
+    async def _gemini_stream(
         self,
         model: str,
         messages: List[Dict[str, str]],
         api_key: str,
-        stream: bool,
         temperature: float,
         max_tokens: int
-    ) -> Dict[str, Any]:
-        """Anthropic Claude API调用"""
+    ) -> AsyncIterator[str]:
+        """Gemini流式输出（暂不使用SSE接口，整段产出完整回答）"""
+        response = await self._gemini_completion(model, messages, api_key, temperature, max_tokens)
+        content = response["choices"][0]["message"]["content"]
+        if content:
+            yield content
+    
+    @staticmethod
+    def _anthropic_request(
+        model: str,
+        messages: List[Dict[str, str]],
+        api_key: str,
+        temperature: float,
+        max_tokens: int
+    ) -> Tuple[Dict[str, str], Dict[str, Any]]:
+        """构造Anthropic Claude的请求头与请求体"""
         # 提取system消息
         system = ""
         user_messages = []
@@ -397,38 +596,86 @@ class MultiModelEngine:
         if system:
             payload["system"] = system
         
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            try:
-                response = await client.post(
-                    "https://api.anthropic.com/v1/messages",
-                    headers=headers,
-                    json=payload
-                )
+        return headers, payload
+    
+    async def _anthropic_stream(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        api_key: str,
+        temperature: float,
+        max_tokens: int
+    ) -> AsyncIterator[str]:
+        """Anthropic Claude流式API调用（SSE，content_block_delta 事件），逐段产出增量文本"""
+        headers, payload = self._anthropic_request(model, messages, api_key, temperature, max_tokens)
+        payload["stream"] = True
+        
+        client = self._get_client("anthropic")
+        try:
+            async with client.stream(
+                "POST",
+                "https://api.anthropic.com/v1/messages",
+                headers=headers,
+                content=json_codec.dumps(payload)
+            ) as response:
                 response.raise_for_status()
-                data = response.json()
-                
-                # 转换为OpenAI格式
-                text = data.get("content", [{}])[0].get("text", "")
-                return {
-                    "choices": [{
-                        "message": {
-                            "role": "assistant",
-                            "content": text
-                        },
-                        "finish_reason": data.get("stop_reason", "stop")
-                    }],
-                    "usage": {
-                        "prompt_tokens": data.get("usage", {}).get("input_tokens", 0),
-                        "completion_tokens": data.get("usage", {}).get("output_tokens", 0),
-                        "total_tokens": sum([
-                            data.get("usage", {}).get("input_tokens", 0),
-                            data.get("usage", {}).get("output_tokens", 0)
-                        ])
-                    }
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    event = json_codec.loads(line[5:])
+                    if event.get("type") == "content_block_delta":
+                        text = event.get("delta", {}).get("text")
+                        if text:
+                            yield text
+                    elif event.get("type") == "message_stop":
+                        break
+        except Exception as e:
+            logger.error(f"Claude流式API调用失败: {e}")
+            raise
+    
+    async def _anthropic_completion(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        api_key: str,
+        temperature: float,
+        max_tokens: int
+    ) -> Dict[str, Any]:
+        """Anthropic Claude API调用"""
+        headers, payload = self._anthropic_request(model, messages, api_key, temperature, max_tokens)
+        
+        client = self._get_client("anthropic")
+        try:
+            response = await client.post(
+                "https://api.anthropic.com/v1/messages",
+                headers=headers,
+                content=json_codec.dumps(payload)
+            )
+            response.raise_for_status()
+            data = json_codec.loads(response.content)
+            
+            # 转换为OpenAI格式
+            text = data.get("content", [{}])[0].get("text", "")
+            return {
+                "choices": [{
+                    "message": {
+                        "role": "assistant",
+                        "content": text
+                    },
+                    "finish_reason": data.get("stop_reason", "stop")
+                }],
+                "usage": {
+                    "prompt_tokens": data.get("usage", {}).get("input_tokens", 0),
+                    "completion_tokens": data.get("usage", {}).get("output_tokens", 0),
+                    "total_tokens": sum([
+                        data.get("usage", {}).get("input_tokens", 0),
+                        data.get("usage", {}).get("output_tokens", 0)
+                    ])
                 }
-            except Exception as e:
-                logger.error(f"Claude API调用失败: {e}")
-                raise
+            }
+        except Exception as e:
+            logger.error(f"Claude API调用失败: {e}")
+            raise
 
 
 # 全局实例
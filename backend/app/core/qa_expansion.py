@@ -3,9 +3,39 @@ Q&A 问题扩展模块
 用于提高固定Q&A的语义匹配准确性
 """
 
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Optional, Set, Tuple
+from functools import lru_cache
 from loguru import logger
 import re
+import numpy as np
+
+try:
+    import ahocorasick  # 可选依赖：简称表较大时以单次自动机扫描查找全部简称
+except ImportError:
+    ahocorasick = None
+
+
+def _build_abbr_automaton(abbreviations) -> "Optional[ahocorasick.Automaton]":
+    """构建简称的Aho-Corasick自动机（未安装 pyahocorasick 时返回None）"""
+    if ahocorasick is None:
+        return None
+    automaton = ahocorasick.Automaton()
+    for abbr in abbreviations:
+        automaton.add_word(abbr.lower(), abbr)
+    automaton.make_automaton()
+    return automaton
+
+
+# 扩展问法近似重复判定阈值（余弦相似度）
+NEAR_DUPLICATE_THRESHOLD = 0.97
+
+# 关键词提取：停用词与分词模式
+_STOP_WORDS = frozenset({
+    '的', '了', '是', '在', '有', '和', '与', '及', '或', '等',
+    '什么', '哪些', '如何', '怎么', '为什么', '吗', '呢', '吧',
+    '请问', '可以', '能', '会', '吗', '？', '?', '。', '.'
+})
+_WORD_RE = re.compile(r'[\u4e00-\u9fa5a-zA-Z0-9]+')
 
 
 class QAExpansion:
@@ -29,19 +59,30 @@ class QAExpansion:
         "就业": ["工作", "career", "就业前景"],
     }
     
-    # 问题模板
+    # 简称检测：单次扫描找出问题中出现的全部简称（前瞻匹配，允许简称相互重叠；安装 pyahocorasick 时改用自动机）
+    _ABBR_RE = re.compile(
+        "(?=(" + "|".join(re.escape(abbr) for abbr in sorted(ABBREVIATION_MAP, key=len, reverse=True)) + "))",
+        re.IGNORECASE
+    )
+    _ABBR_AUTOMATON = _build_abbr_automaton(ABBREVIATION_MAP)
+    # 每个简称的替换模式
+    _ABBR_PATTERNS = {abbr: re.compile(re.escape(abbr), re.IGNORECASE) for abbr in ABBREVIATION_MAP}
+    
+    # 问题模板（预编译）
     QUESTION_PATTERNS = [
         # 关于X的问题
-        (r"(.+)有(什么|哪些)(.+)", ["{0}开设{2}", "{0}提供{2}", "{0}的{2}是什么"]),
-        (r"(.+)怎么(.+)", ["{0}如何{1}", "{0}{1}的方法", "如何{1}{0}"]),
-        (r"(.+)是什么", ["{0}的介绍", "什么是{0}", "{0}概况"]),
-        (r"如何(.+)", ["怎么{0}", "{0}的方法", "{0}流程"]),
+        (re.compile(r"(.+)有(什么|哪些)(.+)"), ["{0}开设{2}", "{0}提供{2}", "{0}的{2}是什么"]),
+        (re.compile(r"(.+)怎么(.+)"), ["{0}如何{1}", "{0}{1}的方法", "如何{1}{0}"]),
+        (re.compile(r"(.+)是什么"), ["{0}的介绍", "什么是{0}", "{0}概况"]),
+        (re.compile(r"如何(.+)"), ["怎么{0}", "{0}的方法", "{0}流程"]),
     ]
     
     @classmethod
     def expand_question(cls, question: str) -> List[str]:
         """
-        扩展问题，生成多个同义问法
+        扩展问题，生成多个同义问法（按问题缓存）
+        
+        语义近似重复的问法由调用方在向量化后用 near_duplicate_mask 去除。
         
         Args:
             question: 原始问题
@@ -49,85 +90,104 @@ class QAExpansion:
         Returns:
             问题列表（包含原问题和扩展问题）
         """
+        return list(cls._expand_question_cached(question))
+    
+    @staticmethod
+    def near_duplicate_mask(vectors, threshold: float = NEAR_DUPLICATE_THRESHOLD) -> List[bool]:
+        """
+        标记需要保留的问法：与已保留问法余弦相似度超过阈值的视为近似重复（第一个始终保留）
+        
+        Args:
+            vectors: 与问法一一对应的向量
+        """
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        matrix = matrix / norms
+        sims = matrix @ matrix.T
+        
+        keep = [True] * len(matrix)
+        for i in range(len(matrix)):
+            if keep[i]:
+                for j in np.nonzero(sims[i, i + 1:] > threshold)[0]:
+                    keep[i + 1 + j] = False
+        return keep
+    
+    @classmethod
+    @lru_cache(maxsize=1024)
+    def _expand_question_cached(cls, question: str) -> Tuple[str, ...]:
+        """expand_question 的缓存实现，返回不可变元组避免调用方修改缓存"""
         expanded = [question]  # 始终包含原问题
+        seen = {question}  # 已产出的问法，扩展时即时去重
         
         # 1. 简称替换
-        expanded.extend(cls._expand_abbreviations(question))
+        expanded.extend(cls._expand_abbreviations(question, seen))
         
         # 2. 模式匹配和转换
-        expanded.extend(cls._expand_patterns(question))
-        
-        # 去重
-        expanded = list(set(expanded))
+        expanded.extend(cls._expand_patterns(question, seen))
         
         if len(expanded) > 1:
             logger.info(f"📝 问题扩展: '{question}' -> {len(expanded)}个变体")
         
-        return expanded
+        return tuple(expanded)
     
     @classmethod
-    def _expand_abbreviations(cls, question: str) -> List[str]:
-        """扩展简称"""
-        expansions = []
-        question_lower = question.lower()
-        
-        for abbr, full_forms in cls.ABBREVIATION_MAP.items():
-            if abbr.lower() in question_lower:
-                for full_form in full_forms:
-                    # 替换简称为全称
-                    expanded = re.sub(
-                        abbr, 
-                        full_form, 
-                        question, 
-                        flags=re.IGNORECASE
-                    )
-                    if expanded != question:
-                        expansions.append(expanded)
-        
-        return expansions
+    def _find_abbreviations(cls, question: str) -> set:
+        """单次扫描找出问题中出现的全部简称（优先使用Aho-Corasick自动机，否则回退到正则）"""
+        if cls._ABBR_AUTOMATON is not None:
+            return {abbr for _, abbr in cls._ABBR_AUTOMATON.iter(question.lower())}
+        return {match.group(1).lower() for match in cls._ABBR_RE.finditer(question)}
     
     @classmethod
-    def _expand_patterns(cls, question: str) -> List[str]:
-        """基于模式扩展问题"""
-        expansions = []
-        
+    def _expand_abbreviations(cls, question: str, seen: Set[str]) -> Iterator[str]:
+        """扩展简称（只产出 seen 中没有的新问法，并记入 seen）"""
+        for abbr in cls._find_abbreviations(question):
+            pattern = cls._ABBR_PATTERNS[abbr]
+            for full_form in cls.ABBREVIATION_MAP[abbr]:
+                # 替换简称为全称
+                expanded = pattern.sub(full_form, question)
+                if expanded not in seen:
+                    seen.add(expanded)
+                    yield expanded
+    
+    @classmethod
+    def _expand_patterns(cls, question: str, seen: Set[str]) -> Iterator[str]:
+        """基于模式扩展问题（只产出 seen 中没有的新问法，并记入 seen）"""
         for pattern, templates in cls.QUESTION_PATTERNS:
-            match = re.match(pattern, question)
+            match = pattern.match(question)
             if match:
                 groups = match.groups()
                 for template in templates:
                     try:
                         expanded = template.format(*groups)
-                        if expanded != question:
-                            expansions.append(expanded)
                     except:
                         continue
+                    if expanded not in seen:
+                        seen.add(expanded)
+                        yield expanded
                 break  # 只使用第一个匹配的模式
-        
-        return expansions
     
     @classmethod
     def extract_keywords(cls, question: str) -> List[str]:
         """
-        提取问题中的关键词
+        提取问题中的关键词（按问题缓存）
         
         Returns:
             关键词列表
         """
-        # 停用词
-        stop_words = {
-            '的', '了', '是', '在', '有', '和', '与', '及', '或', '等',
-            '什么', '哪些', '如何', '怎么', '为什么', '吗', '呢', '吧',
-            '请问', '可以', '能', '会', '吗', '？', '?', '。', '.'
-        }
-        
+        return list(cls._extract_keywords_cached(question))
+    
+    @classmethod
+    @lru_cache(maxsize=1024)
+    def _extract_keywords_cached(cls, question: str) -> Tuple[str, ...]:
+        """extract_keywords 的缓存实现"""
         # 简单分词（基于标点和空格）
-        words = re.findall(r'[\u4e00-\u9fa5a-zA-Z0-9]+', question)
+        words = _WORD_RE.findall(question)
         
         # 过滤停用词和短词
         keywords = [
             w for w in words 
-            if w not in stop_words and len(w) >= 2
+            if w not in _STOP_WORDS and len(w) >= 2
         ]
         
         # 添加简称的全称
@@ -136,7 +196,7 @@ class QAExpansion:
             if keyword.lower() in cls.ABBREVIATION_MAP:
                 expanded_keywords.extend(cls.ABBREVIATION_MAP[keyword.lower()])
         
-        return list(set(expanded_keywords))
+        return tuple(set(expanded_keywords))
 
 
 # 全局实例
@@ -3,15 +3,37 @@ QA 格式生成器 - 使用 OpenAI 将文档转换为问答对
 """
 
 from typing import List, Dict
-from openai import AsyncOpenAI
+from openai import AsyncOpenAI, APIConnectionError, APIStatusError, RateLimitError
 from loguru import logger
+from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt, wait_exponential
+import asyncio
 from app.core.config import settings
+from app.utils import json_codec
+
+
+# 并发生成的文本块数（受OpenAI TPM限制）、单块超时（秒）与最大尝试次数
+QA_MAX_CONCURRENCY = 5
+QA_CHUNK_TIMEOUT = 120
+QA_MAX_ATTEMPTS = 4
+
+
+def _is_retriable(exc: BaseException) -> bool:
+    """429限流、连接错误与5xx服务端错误可重试"""
+    if isinstance(exc, (RateLimitError, APIConnectionError)):
+        return True
+    return isinstance(exc, APIStatusError) and exc.status_code >= 500
 
 
 class QAGenerator:
     """QA 格式生成器"""
     
-    def __init__(self, api_key: str = None, base_url: str = None, model: str = None):
+    def __init__(
+        self,
+        api_key: str = None,
+        base_url: str = None,
+        model: str = None,
+        max_concurrency: int = QA_MAX_CONCURRENCY
+    ):
         """
         初始化 QA 生成器
         
@@ -19,9 +41,11 @@ class QAGenerator:
             api_key: OpenAI API密钥（优先使用传入的，否则使用settings）
             base_url: OpenAI API基础URL（优先使用传入的，否则使用settings）
             model: 使用的模型名称（默认使用settings中的）
+            max_concurrency: 批量生成时的最大并发请求数
         """
         self.client = None
         self.model = model or settings.OPENAI_MODEL
+        self.max_concurrency = max_concurrency
         
         # 优先使用传入的配置，否则使用settings
         final_api_key = api_key or settings.OPENAI_API_KEY
@@ -31,6 +55,7 @@ class QAGenerator:
             self.client = AsyncOpenAI(
                 api_key=final_api_key,
                 base_url=final_base_url,
+                max_retries=0,  # 由 tenacity 统一控制重试
             )
             logger.info(f"✅ QA Generator 初始化成功，使用模型: {self.model}")
         else:
@@ -76,26 +101,33 @@ class QAGenerator:
 请生成问答对："""
 
         try:
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "你是一个专业的数据标注专家。"},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=2000,
-            )
+            # 限流与服务端错误按指数退避重试
+            async for attempt in AsyncRetrying(
+                retry=retry_if_exception(_is_retriable),
+                wait=wait_exponential(multiplier=1, max=20),
+                stop=stop_after_attempt(QA_MAX_ATTEMPTS),
+                reraise=True
+            ):
+                with attempt:
+                    response = await self.client.chat.completions.create(
+                        model=self.model,
+                        messages=[
+                            {"role": "system", "content": "你是一个专业的数据标注专家。"},
+                            {"role": "user", "content": prompt}
+                        ],
+                        temperature=0.7,
+                        max_tokens=2000,
+                    )
             
             content = response.choices[0].message.content
             
             # 尝试解析 JSON
-            import json
             import re
             
             # 提取 JSON 部分
             json_match = re.search(r'\[[\s\S]*\]', content)
             if json_match:
-                qa_pairs = json.loads(json_match.group())
+                qa_pairs = json_codec.loads(json_match.group())
                 logger.info(f"成功生成 {len(qa_pairs)} 个问答对")
                 return qa_pairs
             else:
@@ -123,12 +155,24 @@ class QAGenerator:
         Returns:
             完整的问答对列表
         """
-        all_qa_pairs = []
+        chunks = chunks[:10]  # 限制前10个块，避免API费用过高
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        
+        async def _bounded(i: int, chunk: str) -> List[Dict[str, str]]:
+            async with semaphore:
+                logger.info(f"正在处理第 {i+1}/{len(chunks)} 个文本块...")
+                try:
+                    return await asyncio.wait_for(
+                        self.generate_qa_pairs(chunk, questions_per_chunk, domain),
+                        timeout=QA_CHUNK_TIMEOUT
+                    )
+                except asyncio.TimeoutError:
+                    logger.warning(f"⚠️ 第 {i+1} 个文本块生成超时（{QA_CHUNK_TIMEOUT}秒），已跳过")
+                    return []
         
-        for i, chunk in enumerate(chunks[:10]):  # 限制前10个块，避免API费用过高
-            logger.info(f"正在处理第 {i+1}/{min(len(chunks), 10)} 个文本块...")
-            qa_pairs = await self.generate_qa_pairs(chunk, questions_per_chunk, domain)
-            all_qa_pairs.extend(qa_pairs)
+        # 多个文本块并发生成，总耗时取决于最慢的一批请求而非逐块累加
+        results = await asyncio.gather(*[_bounded(i, chunk) for i, chunk in enumerate(chunks)])
+        all_qa_pairs = [qa for qa_pairs in results for qa in qa_pairs]
         
         logger.info(f"共生成 {len(all_qa_pairs)} 个问答对")
         return all_qa_pairs
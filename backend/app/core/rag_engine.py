@@ -2,9 +2,11 @@
 RAG 检索增强生成引擎 - 支持多种向量数据库和 Embedding 提供商
 """
 
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from loguru import logger
-from sentence_transformers import SentenceTransformer
+import asyncio
+import time
+from collections import OrderedDict
 from app.core.config import settings
 from app.core.vector_db_interface import VectorDBInterface, create_vector_db_adapter
 
@@ -12,6 +14,17 @@ from app.core.vector_db_interface import VectorDBInterface, create_vector_db_ada
 class RAGEngine:
     """RAG 引擎 - 支持多种向量数据库和 Embedding 提供商"""
     
+    # 入库时每批向量化并写入的文档数
+    INGEST_BATCH_SIZE = 256
+    
+    # 集合存在性/维度缓存有效期（秒）与容量上限（LRU）
+    COLLECTION_INFO_TTL = 300
+    COLLECTION_INFO_CACHE_SIZE = 1024
+    # (向量数据库标识, 集合名) -> 写入时间 / (维度, 写入时间)；RAGEngine按请求创建，缓存在实例间共享
+    # 存在性只缓存"存在"，集合可能随时被其他worker创建
+    _exists_cache: "OrderedDict[Tuple, float]" = OrderedDict()
+    _dim_cache: "OrderedDict[Tuple, Tuple[int, float]]" = OrderedDict()
+    
     def __init__(
         self, 
         embedding_provider_config: Optional[Dict] = None,
@@ -37,13 +50,65 @@ class RAGEngine:
     
     @property
     def embedding_model(self):
-        """懒加载本地 Embedding 模型（仅用于本地模型）"""
+        """懒加载本地 Embedding 模型（仅用于本地模型，与 embedding_engine 共享同一实例）"""
         if self._embedding_model is None:
-            logger.info(f"正在加载 Embedding 模型: {settings.EMBEDDING_MODEL}")
-            self._embedding_model = SentenceTransformer(settings.EMBEDDING_MODEL)
-            logger.info("✅ Embedding 模型加载完成")
+            from app.core.embedding_engine import embedding_engine
+            self._embedding_model = embedding_engine._get_local_model(settings.EMBEDDING_MODEL)
         return self._embedding_model
     
+    @staticmethod
+    def _local_embedding_config() -> Dict:
+        """未配置云端提供商时使用的本地模型配置"""
+        return {"provider_type": "local", "model_name": settings.EMBEDDING_MODEL}
+    
+    async def _embed_queries(self, query_texts: List[str]) -> List[List[float]]:
+        """
+        向量化查询文本（经 embedding_engine 的LRU缓存，重复查询无需重新编码，未命中的文本一次批量编码）
+        """
+        from app.core.embedding_engine import embedding_engine
+        
+        if self.embedding_provider_config and self.embedding_provider_config.get('provider_type') != 'local':
+            # 使用配置的云端提供商（OpenAI等）
+            try:
+                query_embeddings = await embedding_engine.embed_queries(
+                    query_texts,
+                    self.embedding_provider_config
+                )
+                provider_name = self.embedding_provider_config.get('name', self.embedding_provider_config.get('provider_type', '未知'))
+                logger.info(f"✅ 使用 {provider_name} 进行查询向量化 (维度: {len(query_embeddings[0])})")
+            except Exception as e:
+                logger.error(f"❌ OpenAI Embedding API调用失败: {e}")
+                raise Exception(f"向量化失败: {str(e)}。请检查API配置或使用本地模型。")
+        else:
+            # 使用本地模型
+            query_embeddings = await embedding_engine.embed_queries(query_texts, self._local_embedding_config())
+            logger.info(f"使用本地模型进行查询向量化 (维度: {len(query_embeddings[0])})")
+        
+        return query_embeddings
+    
+    def _collection_key(self, collection_name: str) -> Tuple:
+        """集合信息缓存键（区分不同的向量数据库实例）"""
+        config = self.vector_db_config or {}
+        provider_type = config.get("provider_type", "chromadb")
+        if provider_type == "chromadb":
+            return (provider_type, collection_name)
+        return (provider_type, config.get("host"), config.get("port"), collection_name)
+    
+    @classmethod
+    def _cache_put(cls, cache: OrderedDict, key: Tuple, value):
+        """写入集合信息缓存，超出容量时淘汰最久未使用的条目"""
+        cache[key] = value
+        cache.move_to_end(key)
+        if len(cache) > cls.COLLECTION_INFO_CACHE_SIZE:
+            cache.popitem(last=False)
+    
+    @classmethod
+    def invalidate_collection_cache(cls, collection_name: str):
+        """清除集合的存在性/维度缓存（集合被创建或删除时调用）"""
+        for cache in (cls._exists_cache, cls._dim_cache):
+            for key in [k for k in cache if k[-1] == collection_name]:
+                del cache[key]
+    
     def create_collection(self, collection_name: str, dimension: int = 1536, metadata: Optional[Dict] = None):
         """创建知识库集合"""
         try:
@@ -52,28 +117,160 @@ class RAGEngine:
                 dimension=dimension,
                 metadata=metadata or {}
             )
+            self.invalidate_collection_cache(collection_name)
             logger.info(f"✅ 创建知识库集合: {collection_name} (维度: {dimension})")
         except Exception as e:
             logger.error(f"创建集合失败: {e}")
             raise
     
     def collection_exists(self, collection_name: str) -> bool:
-        """检查集合是否存在"""
+        """检查集合是否存在（"存在"的结果缓存 COLLECTION_INFO_TTL 秒，不存在或检查失败不缓存）"""
+        key = self._collection_key(collection_name)
+        cached_at = self._exists_cache.get(key)
+        if cached_at is not None and time.monotonic() - cached_at < self.COLLECTION_INFO_TTL:
+            self._exists_cache.move_to_end(key)
+            return True
+        
         try:
-            return self.vector_db.collection_exists(collection_name)
+            exists = self.vector_db.collection_exists(collection_name)
         except Exception as e:
             logger.error(f"检查集合失败: {e}")
             return False
+        if exists:
+            self._cache_put(self._exists_cache, key, time.monotonic())
+        else:
+            self._exists_cache.pop(key, None)
+        return exists
+    
+    def get_collection_dimension(self, collection_name: str, use_cache: bool = True) -> Optional[int]:
+        """获取集合的向量维度（结果缓存 COLLECTION_INFO_TTL 秒，未知维度不缓存）
+        
+        Args:
+            collection_name: 集合名称
+            use_cache: 为False时直接查询向量数据库（删除集合等破坏性操作前使用）
+        """
+        key = self._collection_key(collection_name)
+        cached = self._dim_cache.get(key) if use_cache else None
+        if cached is not None and time.monotonic() - cached[1] < self.COLLECTION_INFO_TTL:
+            self._dim_cache.move_to_end(key)
+            return cached[0]
+        
+        if not hasattr(self.vector_db, 'get_collection_dimension'):
+            return None
+        dimension = self.vector_db.get_collection_dimension(collection_name)
+        if dimension:
+            self._cache_put(self._dim_cache, key, (dimension, time.monotonic()))
+        else:
+            self._dim_cache.pop(key, None)
+        return dimension
     
     def delete_collection(self, collection_name: str):
         """删除知识库集合"""
         try:
             self.vector_db.delete_collection(collection_name)
+            self.invalidate_collection_cache(collection_name)
             logger.info(f"✅ 删除知识库集合: {collection_name}")
         except Exception as e:
             logger.error(f"删除集合失败: {e}")
             raise
     
+    @property
+    def ingest_batch_size(self) -> int:
+        """入库流水线每级的文档数（云端提供商一级包含多个并发的Embedding请求）"""
+        if self.embedding_provider_config and self.embedding_provider_config.get('provider_type') != 'local':
+            return max(self.INGEST_BATCH_SIZE, settings.EMBEDDING_BATCH_SIZE * settings.EMBEDDING_CONCURRENCY)
+        return self.INGEST_BATCH_SIZE
+    
+    async def _embed_documents(self, documents: List[str]) -> List[List[float]]:
+        """向量化一批文档（经持久化缓存，重复文本不再编码；本地模型在线程池中编码，不阻塞事件循环）"""
+        from app.core.embedding_engine import embedding_engine
+        
+        if self.embedding_provider_config:
+            return await embedding_engine.embed_texts_cached(documents, self.embedding_provider_config)
+        # 回退到本地模型（共享模型实例，按批编码）
+        return await embedding_engine.embed_texts_cached(documents, self._local_embedding_config())
+    
+    async def _upsert_batched(
+        self,
+        collection_name: str,
+        embeddings: List[List[float]],
+        documents: List[str],
+        metadatas: Optional[List[Dict]],
+        ids: Optional[List[str]]
+    ) -> List[str]:
+        """
+        写入向量数据库：远程数据库按 EMBEDDING_UPSERT_BATCH 切分为对齐的小批次，
+        以 UPSERT_CONCURRENCY 为上限并发上传；本地数据库整批交给适配器
+        """
+        batch_size = settings.EMBEDDING_UPSERT_BATCH
+        if not self.vector_db.CONCURRENT_UPSERT or len(documents) <= batch_size:
+            return await self.vector_db.add_documents(
+                collection_name=collection_name,
+                embeddings=embeddings,
+                documents=documents,
+                metadatas=metadatas,
+                ids=ids
+            )
+        
+        semaphore = asyncio.Semaphore(settings.UPSERT_CONCURRENCY)
+        
+        async def upsert(start: int) -> List[str]:
+            end = start + batch_size
+            async with semaphore:
+                return await self.vector_db.add_documents(
+                    collection_name=collection_name,
+                    embeddings=embeddings[start:end],
+                    documents=documents[start:end],
+                    metadatas=metadatas[start:end] if metadatas else None,
+                    ids=ids[start:end] if ids else None
+                )
+        
+        results = await asyncio.gather(*[upsert(start) for start in range(0, len(documents), batch_size)])
+        return [id_ for batch_ids in results for id_ in batch_ids]
+    
+    async def _add_pipelined(
+        self,
+        collection_name: str,
+        documents: List[str],
+        metadatas: Optional[List[Dict]],
+        ids: Optional[List[str]],
+        first_embeddings: List[List[float]]
+    ) -> List[str]:
+        """
+        两级流水线写入：写入当前批的同时向量化下一批，向量化耗时与数据库写入相互重叠
+        
+        Args:
+            first_embeddings: 第一批文档（前 ingest_batch_size 个）已生成的向量
+        """
+        batch_size = self.ingest_batch_size
+        all_ids = []
+        embeddings = first_embeddings
+        
+        for start in range(0, len(documents), batch_size):
+            end = start + batch_size
+            next_task = None
+            if end < len(documents):
+                next_task = asyncio.create_task(self._embed_documents(documents[end:end + batch_size]))
+            
+            try:
+                batch_ids = await self._upsert_batched(
+                    collection_name,
+                    embeddings,
+                    documents[start:end],
+                    metadatas[start:end] if metadatas else None,
+                    ids[start:end] if ids else None
+                )
+            except Exception:
+                if next_task is not None:
+                    next_task.cancel()
+                raise
+            
+            all_ids.extend(batch_ids)
+            if next_task is not None:
+                embeddings = await next_task
+        
+        return all_ids
+    
     async def add_documents(
         self,
         collection_name: str,
@@ -86,17 +283,11 @@ class RAGEngine:
             logger.info(f"📝 准备添加 {len(documents)} 个文档到集合: {collection_name}")
             logger.info(f"🔍 使用向量数据库: {self.vector_db.__class__.__name__}")
             
-            # 生成 embeddings - 先生成向量，以便获取维度信息
+            # 生成 embeddings - 先向量化第一批，以便获取维度信息（其余批次在写入时流水线生成）
+            embeddings = await self._embed_documents(documents[:self.ingest_batch_size])
             if self.embedding_provider_config:
-                from app.core.embedding_engine import embedding_engine
-                embeddings = await embedding_engine.embed_texts(
-                    documents,
-                    self.embedding_provider_config
-                )
                 logger.info(f"使用 {self.embedding_provider_config.get('name')} 进行向量化")
             else:
-                # 回退到本地模型
-                embeddings = self.embedding_model.encode(documents).tolist()
                 logger.info("使用本地模型进行向量化")
             
             # 获取向量维度
@@ -110,25 +301,27 @@ class RAGEngine:
                 
                 if exists:
                     # 集合存在，检查维度是否匹配
-                    if hasattr(self.vector_db, 'get_collection_dimension'):
-                        existing_dimension = self.vector_db.get_collection_dimension(collection_name)
-                        if existing_dimension and existing_dimension != dimension:
-                            logger.warning(f"⚠️ 维度不匹配！集合维度: {existing_dimension}, 当前embedding维度: {dimension}")
-                            logger.warning(f"🗑️ 删除旧集合并重新创建...")
-                            
-                            # 删除旧集合
-                            try:
-                                self.delete_collection(collection_name)
-                                logger.info(f"✅ 已删除旧集合: {collection_name}")
-                            except Exception as del_err:
-                                logger.error(f"❌ 删除旧集合失败: {del_err}")
-                                raise Exception(f"维度不匹配且无法删除旧集合: {del_err}")
-                            
-                            # 创建新集合
-                            self.create_collection(collection_name, dimension)
-                            logger.info(f"✅ 已使用新维度 {dimension} 重新创建集合: {collection_name}")
-                        else:
-                            logger.info(f"✅ 集合维度匹配: {dimension}")
+                    existing_dimension = self.get_collection_dimension(collection_name)
+                    if existing_dimension and existing_dimension != dimension:
+                        # 缓存的维度可能已过时（集合被其他worker重建），删除前绕过缓存再确认一次
+                        existing_dimension = self.get_collection_dimension(collection_name, use_cache=False)
+                    if existing_dimension and existing_dimension != dimension:
+                        logger.warning(f"⚠️ 维度不匹配！集合维度: {existing_dimension}, 当前embedding维度: {dimension}")
+                        logger.warning(f"🗑️ 删除旧集合并重新创建...")
+                        
+                        # 删除旧集合
+                        try:
+                            self.delete_collection(collection_name)
+                            logger.info(f"✅ 已删除旧集合: {collection_name}")
+                        except Exception as del_err:
+                            logger.error(f"❌ 删除旧集合失败: {del_err}")
+                            raise Exception(f"维度不匹配且无法删除旧集合: {del_err}")
+                        
+                        # 创建新集合
+                        self.create_collection(collection_name, dimension)
+                        logger.info(f"✅ 已使用新维度 {dimension} 重新创建集合: {collection_name}")
+                    else:
+                        logger.info(f"✅ 集合维度匹配: {dimension}")
                 else:
                     # 集合不存在，创建新集合
                     logger.warning(f"⚠️ 集合不存在，尝试自动创建: {collection_name}")
@@ -139,13 +332,7 @@ class RAGEngine:
             
             # 使用向量数据库适配器添加文档
             try:
-                ids = await self.vector_db.add_documents(
-                    collection_name=collection_name,
-                    embeddings=embeddings,
-                    documents=documents,
-                    metadatas=metadatas,
-                    ids=ids
-                )
+                ids = await self._add_pipelined(collection_name, documents, metadatas, ids, embeddings)
                 
                 logger.info(f"✅ 添加 {len(documents)} 个文档到知识库: {collection_name}")
                 return ids
@@ -172,13 +359,7 @@ class RAGEngine:
                     
                     # 重试添加文档
                     logger.info(f"🔄 重试添加 {len(documents)} 个文档...")
-                    ids = await self.vector_db.add_documents(
-                        collection_name=collection_name,
-                        embeddings=embeddings,
-                        documents=documents,
-                        metadatas=metadatas,
-                        ids=ids
-                    )
+                    ids = await self._add_pipelined(collection_name, documents, metadatas, ids, embeddings)
                     
                     logger.info(f"✅ 添加 {len(documents)} 个文档到知识库: {collection_name} (重建后)")
                     return ids
@@ -203,7 +384,9 @@ class RAGEngine:
             {
                 "documents": List[str],  # 检索到的文档
                 "distances": List[float],  # 相似度距离
-                "metadatas": List[Dict]  # 元数据
+                "metadatas": List[Dict],  # 元数据
+                "scores": List[float],  # 可选：原生余弦相似度
+                "score_type": str  # 可选：scores 类型
             }
         """
         try:
@@ -219,40 +402,74 @@ class RAGEngine:
                     logger.warning(f"⚠️ 检查集合存在性失败: {check_err}，假设collection存在并继续")
             
             # 生成查询 embedding
-            if self.embedding_provider_config and self.embedding_provider_config.get('provider_type') != 'local':
-                # 使用配置的云端提供商（OpenAI等）
-                from app.core.embedding_engine import embedding_engine
-                try:
-                    query_embeddings = await embedding_engine.embed_texts(
-                        [query_text],
-                        self.embedding_provider_config
-                    )
-                    query_embedding = query_embeddings[0]
-                    provider_name = self.embedding_provider_config.get('name', self.embedding_provider_config.get('provider_type', '未知'))
-                    logger.info(f"✅ 使用 {provider_name} 进行查询向量化 (维度: {len(query_embedding)})")
-                except Exception as e:
-                    logger.error(f"❌ OpenAI Embedding API调用失败: {e}")
-                    raise Exception(f"向量化失败: {str(e)}。请检查API配置或使用本地模型。")
-            else:
-                # 使用本地模型
-                query_embedding = self.embedding_model.encode([query_text]).tolist()[0]
-                logger.info(f"使用本地模型进行查询向量化 (维度: {len(query_embedding)})")
-            
-            # 使用向量数据库适配器查询
-            results = await self.vector_db.query(
-                collection_name=collection_name,
-                query_embedding=query_embedding,
-                n_results=n_results
-            )
-            
-            logger.info(f"✅ 检索完成，找到 {len(results['documents'])} 个相关文档")
+            query_embedding = (await self._embed_queries([query_text]))[0]
             
-            return results
+            return await self.query_by_vector(collection_name, query_embedding, n_results)
             
         except Exception as e:
             logger.error(f"检索失败: {e}")
             raise
     
+    async def query_batch(
+        self,
+        collection_name: str,
+        query_texts: List[str],
+        n_results: int = 3
+    ) -> List[Dict]:
+        """
+        批量检索多个查询：一次批量向量化 + 一次向量数据库往返
+        
+        Returns:
+            与 query_texts 一一对应的 query() 结果列表
+        """
+        query_embeddings = await self._embed_queries(query_texts)
+        return await self.query_by_vectors(collection_name, query_embeddings, n_results)
+    
+    async def query_by_vector(
+        self,
+        collection_name: str,
+        query_embedding: List[float],
+        n_results: int = 3
+    ) -> Dict:
+        """
+        使用已生成的查询向量检索相关文档（调用方已向量化查询时避免重复向量化）
+        
+        Returns:
+            与 query() 相同
+        """
+        # 使用向量数据库适配器查询
+        results = await self.vector_db.query(
+            collection_name=collection_name,
+            query_embedding=query_embedding,
+            n_results=n_results
+        )
+        
+        logger.info(f"✅ 检索完成，找到 {len(results['documents'])} 个相关文档")
+        
+        return results
+    
+    async def query_by_vectors(
+        self,
+        collection_name: str,
+        query_embeddings: List[List[float]],
+        n_results: int = 3
+    ) -> List[Dict]:
+        """
+        使用多个查询向量（如原始查询与扩展问法）批量检索，一次数据库往返
+        
+        Returns:
+            与 query_embeddings 一一对应的 query() 结果列表
+        """
+        results = await self.vector_db.query_batch(
+            collection_name=collection_name,
+            query_embeddings=query_embeddings,
+            n_results=n_results
+        )
+        
+        logger.info(f"✅ 批量检索完成: {len(query_embeddings)} 个查询向量")
+        
+        return results
+    
     def get_collection_stats(self, collection_name: str) -> Dict:
         """获取知识库统计信息"""
         try:
@@ -0,0 +1,335 @@
+"""
+语义答案缓存
+按查询向量的余弦相似度命中已生成的答案，避免重复的检索与LLM生成
+"""
+
+from typing import Dict, List, Optional, Any, Tuple
+from collections import OrderedDict
+from loguru import logger
+import asyncio
+import copy
+import hashlib
+import json
+import time
+import numpy as np
+
+from app.utils import json_codec
+
+
+# 命中阈值（过低会把相近但不同的问题当作同一问题）、容量与过期时间
+SEMANTIC_CACHE_THRESHOLD = 0.95
+SEMANTIC_CACHE_MAX_SIZE = 1024
+SEMANTIC_CACHE_TTL = 300
+
+# 精确文本缓存容量与过期时间
+EXACT_CACHE_MAX_SIZE = 10000
+EXACT_CACHE_TTL = 600
+
+# LLM响应缓存：语义命中阈值、精确层容量、单个上下文作用域容量与数量、过期时间
+LLM_CACHE_THRESHOLD = 0.95
+LLM_CACHE_MAX_SIZE = 10000
+LLM_CACHE_SCOPE_SIZE = 256
+LLM_CACHE_MAX_SCOPES = 256
+LLM_CACHE_TTL = 3600
+# 仅对较短的最后一条用户消息做语义匹配（长文本会被Embedding模型截断，语义相近不代表请求相同）
+LLM_CACHE_SEMANTIC_MAX_CHARS = 512
+
+# 规范化查询时去掉的结尾标点
+_TRAILING_PUNCTUATION = "?？!！。.,，;；~～…"
+
+
+def normalize_query(query: str) -> str:
+    """规范化查询文本：小写、合并空白、去掉结尾标点"""
+    return " ".join(query.lower().split()).rstrip(_TRAILING_PUNCTUATION).rstrip()
+
+
+class ExactAnswerCache:
+    """精确文本答案缓存（语义缓存之前的第一层，无需向量化）"""
+
+    def __init__(self, max_size: int = EXACT_CACHE_MAX_SIZE, ttl: float = EXACT_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple, Tuple[Dict[str, Any], float]]" = OrderedDict()  # 键 -> (结果, 过期时间)
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self) -> float:
+        """命中率"""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def get(self, key: Tuple) -> Optional[Dict[str, Any]]:
+        """按键查找缓存结果副本（metadata.cache_hit=True）"""
+        entry = self._entries.get(key)
+        if entry is None or entry[1] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        logger.info(f"🎯 精确缓存命中 (命中率: {self.hit_rate:.2%})")
+
+        result = copy.deepcopy(entry[0])
+        result.setdefault("metadata", {})["cache_hit"] = True
+        return result
+
+    def put(self, key: Tuple, result: Dict[str, Any]):
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        self._entries[key] = (copy.deepcopy(result), time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate_app(self, app_id: int):
+        """清除某个应用的精确缓存（键的第一项为应用ID）"""
+        for key in [k for k in self._entries if k[0] == app_id]:
+            del self._entries[key]
+
+    def clear(self):
+        """清除全部精确缓存"""
+        self._entries.clear()
+
+
+class SemanticAnswerCache:
+    """语义答案缓存（单个应用+模式+配置作用域）
+
+    向量存放在预分配的 (max_size, D) 归一化float32矩阵中，
+    槽位按LRU顺序淘汰并复用，查找只需一次矩阵-向量乘法。
+    """
+
+    # (app_id, mode) -> (config_hash, cache)，配置变化时整体替换
+    _registry: Dict[Tuple[int, str], Tuple[str, "SemanticAnswerCache"]] = {}
+
+    def __init__(
+        self,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        max_size: int = SEMANTIC_CACHE_MAX_SIZE,
+        ttl: float = SEMANTIC_CACHE_TTL
+    ):
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ttl = ttl
+        self.config_hash = ""
+
+        self._matrix: Optional[np.ndarray] = None  # 首次写入时按维度分配
+        self._valid: Optional[np.ndarray] = None
+        self._entries: "OrderedDict[int, Tuple[Dict[str, Any], float]]" = OrderedDict()  # 槽位 -> (结果, 过期时间)
+        self._free_slots = []
+
+    @classmethod
+    def for_app(cls, app_id: int, mode: str, config: Optional[Dict[str, Any]] = None) -> "SemanticAnswerCache":
+        """获取应用+模式对应的缓存，配置变更后旧缓存自动失效"""
+        config_hash = hashlib.md5(
+            json.dumps(dict(config or {}), sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()
+        key = (app_id, mode)
+        entry = cls._registry.get(key)
+        if entry is None or entry[0] != config_hash:
+            entry = (config_hash, cls())
+            entry[1].config_hash = config_hash
+            cls._registry[key] = entry
+        return entry[1]
+
+    @classmethod
+    def invalidate_app(cls, app_id: int):
+        """清除某个应用的全部语义缓存（如Q&A或知识库更新后）"""
+        for key in [k for k in cls._registry if k[0] == app_id]:
+            del cls._registry[key]
+
+    @classmethod
+    def clear_all(cls):
+        """清除所有应用的语义缓存"""
+        cls._registry.clear()
+
+    @staticmethod
+    def normalize(vector) -> Optional[np.ndarray]:
+        """L2归一化查询向量，零向量返回None"""
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            return None
+        return vector / norm
+
+    def _evict(self, slot: int):
+        """释放槽位"""
+        self._entries.pop(slot, None)
+        self._valid[slot] = False
+        self._free_slots.append(slot)
+
+    def get(self, query_vector: np.ndarray) -> Optional[Dict[str, Any]]:
+        """查找语义相近的缓存答案
+
+        Args:
+            query_vector: 已归一化的查询向量
+
+        Returns:
+            缓存结果副本（metadata.cache_hit=True），未命中返回None
+        """
+        if not self._entries or query_vector.shape[0] != self._matrix.shape[1]:
+            return None
+
+        scores = self._matrix @ query_vector
+        scores[~self._valid] = -np.inf
+        slot = int(np.argmax(scores))
+        score = float(scores[slot])
+        if score < self.threshold:
+            return None
+
+        result, expires_at = self._entries[slot]
+        if expires_at < time.monotonic():
+            self._evict(slot)
+            return None
+
+        self._entries.move_to_end(slot)
+        logger.info(f"🎯 语义缓存命中 (相似度: {score:.2%})")
+
+        result = copy.deepcopy(result)
+        result.setdefault("metadata", {})["cache_hit"] = True
+        return result
+
+    def put(self, query_vector: np.ndarray, result: Dict[str, Any]):
+        """写入缓存，容量满时淘汰最久未使用的条目"""
+        if self._matrix is None:
+            self._matrix = np.zeros((self.max_size, query_vector.shape[0]), dtype=np.float32)
+            self._valid = np.zeros(self.max_size, dtype=bool)
+            self._free_slots = list(range(self.max_size - 1, -1, -1))
+        elif query_vector.shape[0] != self._matrix.shape[1]:
+            return
+
+        if not self._free_slots:
+            self._evict(next(iter(self._entries)))
+
+        slot = self._free_slots.pop()
+        self._matrix[slot] = query_vector
+        self._valid[slot] = True
+        self._entries[slot] = (copy.deepcopy(result), time.monotonic() + self.ttl)
+
+
+class SemanticLLMCache:
+    """LLM响应缓存（精确文本 + 语义两层）
+
+    精确层按 (提供商, 模型, 温度, 最大token数, 原始消息) 的blake2b摘要O(1)命中（重试、重复请求）；
+    语义层只用于温度为0的请求，只比较最后一条用户消息的向量，且要求之前的消息（系统提示、上下文、历史）完全一致。
+    """
+
+    def __init__(self, max_size: int = LLM_CACHE_MAX_SIZE, ttl: float = LLM_CACHE_TTL):
+        self.ttl = ttl
+        self.exact = ExactAnswerCache(max_size=max_size, ttl=ttl)
+        self._scopes: "OrderedDict[Tuple, SemanticAnswerCache]" = OrderedDict()  # 上下文作用域 -> 语义缓存
+
+    @staticmethod
+    def _hash(items) -> str:
+        """消息列表的稳定哈希"""
+        return hashlib.md5(json.dumps(items, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _exact_key(
+        provider: str,
+        model: str,
+        temperature: float,
+        max_tokens: Optional[int],
+        messages: List[Dict[str, Any]]
+    ) -> Tuple[str]:
+        """精确层键：规范化请求的blake2b摘要（只保留角色与内容，与字典键顺序无关）"""
+        canonical = [
+            provider, model, round(temperature or 0.0, 2), max_tokens,
+            [[m.get("role", ""), m.get("content")] for m in messages]
+        ]
+        return (hashlib.blake2b(json_codec.dumps(canonical), digest_size=16).hexdigest(),)
+
+    @staticmethod
+    async def _embed(text: str) -> Optional[np.ndarray]:
+        """使用已加载的本地Embedding模型向量化（模型未加载时跳过语义层，不为缓存触发模型加载）"""
+        from app.core.config import settings
+        from app.core.embedding_engine import embedding_engine
+
+        model = embedding_engine.get_loaded_local_model(settings.EMBEDDING_MODEL)
+        if model is None:
+            return None
+        try:
+            vectors = await asyncio.to_thread(model.encode, [text], normalize_embeddings=True)
+        except Exception as e:
+            logger.warning(f"⚠️ LLM缓存向量化失败，跳过语义缓存: {e}")
+            return None
+        return np.asarray(vectors[0], dtype=np.float32)
+
+    @staticmethod
+    def _strip_cache_marker(result: Dict[str, Any]) -> Dict[str, Any]:
+        """去掉答案缓存添加的 metadata.cache_hit，保持提供商原始响应格式"""
+        metadata = result.get("metadata")
+        if isinstance(metadata, dict):
+            metadata.pop("cache_hit", None)
+            if not metadata:
+                del result["metadata"]
+        return result
+
+    async def lookup(
+        self,
+        provider: str,
+        model: str,
+        temperature: float,
+        messages: List[Dict[str, Any]],
+        max_tokens: Optional[int] = None
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[Tuple]]:
+        """查找缓存的LLM响应
+
+        Returns:
+            (缓存响应, None) 或 (None, 写入缓存所需的键)
+        """
+        exact_key = self._exact_key(provider, model, temperature, max_tokens, messages)
+        result = self.exact.get(exact_key)
+        if result is not None:
+            return self._strip_cache_marker(result), None
+
+        # 语义层只用于确定性采样：温度大于0时相近的问题不应复用同一答案
+        if temperature:
+            return None, (exact_key, None, None)
+
+        canonical = [(m.get("role", ""), normalize_query(str(m.get("content") or ""))) for m in messages]
+        scope = (provider, model, round(temperature or 0.0, 1), max_tokens, self._hash(canonical[:-1]))
+
+        vector = None
+        last = messages[-1] if messages else {}
+        if last.get("role") == "user" and len(str(last.get("content") or "")) <= LLM_CACHE_SEMANTIC_MAX_CHARS:
+            vector = await self._embed(canonical[-1][1])
+            cache = self._scopes.get(scope) if vector is not None else None
+            if cache is not None:
+                self._scopes.move_to_end(scope)
+                result = cache.get(vector)
+                if result is not None:
+                    return self._strip_cache_marker(result), None
+
+        return None, (exact_key, scope, vector)
+
+    def store(self, cache_key: Tuple, response: Dict[str, Any]):
+        """写入LLM响应（cache_key 为 lookup 未命中时返回的键）"""
+        exact_key, scope, vector = cache_key
+        self.exact.put(exact_key, response)
+        if vector is None:
+            return
+
+        cache = self._scopes.get(scope)
+        if cache is None:
+            cache = SemanticAnswerCache(threshold=LLM_CACHE_THRESHOLD, max_size=LLM_CACHE_SCOPE_SIZE, ttl=self.ttl)
+            self._scopes[scope] = cache
+            if len(self._scopes) > LLM_CACHE_MAX_SCOPES:
+                self._scopes.popitem(last=False)
+        else:
+            self._scopes.move_to_end(scope)
+        cache.put(vector, response)
+
+
+# 全局精确缓存实例
+exact_answer_cache = ExactAnswerCache()
+
+
+def invalidate_answer_caches():
+    """知识库内容变更后清除所有应用的答案缓存（知识库可被多个应用引用，整体清除）"""
+    SemanticAnswerCache.clear_all()
+    exact_answer_cache.clear()
+
+# 全局LLM响应缓存实例
+llm_response_cache = SemanticLLMCache()
@@ -3,15 +3,30 @@ Tavily AI Search API 集成
 为AI应用优化的实时网络搜索引擎
 """
 
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, ClassVar, Tuple
+from collections import OrderedDict
 from loguru import logger
+import copy
+import hashlib
 import httpx
 import asyncio
+import time
+
+from app.utils.http2 import HTTP2_AVAILABLE
 
 
 class TavilySearch:
     """Tavily AI Search 客户端"""
     
+    # 所有实例共享的HTTP客户端（API密钥在请求体中传递，连接可跨密钥复用）
+    _client: ClassVar[Optional[httpx.AsyncClient]] = None
+    
+    # 搜索结果缓存：容量与过期时间（实时搜索，结果只短时复用）
+    RESULT_CACHE_SIZE = 256
+    RESULT_CACHE_TTL = 600
+    # (API密钥摘要, 搜索参数) -> (成功的搜索结果, 过期时间)
+    _result_cache: ClassVar["OrderedDict[Tuple, Tuple[Dict[str, Any], float]]"] = OrderedDict()
+    
     def __init__(self, api_key: str):
         """
         初始化Tavily搜索客户端
@@ -22,6 +37,25 @@ class TavilySearch:
         self.api_key = api_key
         self.base_url = "https://api.tavily.com"
         self.timeout = 30.0
+        self._key_digest = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+    
+    @classmethod
+    def _get_client(cls) -> httpx.AsyncClient:
+        """获取共享的HTTP客户端（保持到Tavily的连接池，避免每次搜索重新建立TLS连接；支持时启用HTTP/2多路复用）"""
+        if cls._client is None or cls._client.is_closed:
+            cls._client = httpx.AsyncClient(
+                timeout=30.0,
+                limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+                http2=HTTP2_AVAILABLE
+            )
+        return cls._client
+    
+    @classmethod
+    async def aclose(cls):
+        """关闭共享的HTTP客户端（应用关闭时调用）"""
+        if cls._client is not None:
+            client, cls._client = cls._client, None
+            await client.aclose()
     
     async def search(
         self,
@@ -50,6 +84,23 @@ class TavilySearch:
         Returns:
             搜索结果字典
         """
+        # 键包含API密钥摘要：不同租户互不共享结果，失效的密钥也不会命中他人缓存的成功结果
+        cache_key = (
+            self._key_digest,
+            " ".join(query.lower().split()), search_depth, max_results,
+            include_answer, include_raw_content, include_images,
+            tuple(include_domains or ()), tuple(exclude_domains or ())
+        )
+        cached = self._result_cache.get(cache_key)
+        if cached is not None:
+            if cached[1] >= time.monotonic():
+                self._result_cache.move_to_end(cache_key)
+                logger.info(f"🎯 Tavily搜索缓存命中: {query}")
+                result = copy.deepcopy(cached[0])
+                result["cached"] = True
+                return result
+            del self._result_cache[cache_key]
+        
         try:
             url = f"{self.base_url}/search"
             
@@ -71,55 +122,63 @@ class TavilySearch:
             
             logger.info(f"🌐 Tavily搜索: {query} (深度: {search_depth}, 最大结果: {max_results})")
             
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    url,
-                    json=payload,
-                    headers={"Content-Type": "application/json"}
-                )
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    result_count = len(data.get("results", []))
-                    logger.info(f"✅ Tavily搜索成功，返回 {result_count} 条结果")
-                    
-                    return {
-                        "success": True,
-                        "query": data.get("query", query),
-                        "answer": data.get("answer", ""),
-                        "results": data.get("results", []),
-                        "images": data.get("images", []),
-                        "follow_up_questions": data.get("follow_up_questions", []),
-                        "search_depth": search_depth,
-                        "result_count": result_count
-                    }
+            client = self._get_client()
+            response = await client.post(
+                url,
+                json=payload,
+                headers={"Content-Type": "application/json"}
+            )
+            
+            if response.status_code == 200:
+                data = response.json()
+                result_count = len(data.get("results", []))
+                logger.info(f"✅ Tavily搜索成功，返回 {result_count} 条结果")
                 
-                elif response.status_code == 401:
-                    logger.error("❌ Tavily API密钥无效")
-                    return {
-                        "success": False,
-                        "error": "API密钥无效",
-                        "results": []
-                    }
+                result = {
+                    "success": True,
+                    "query": data.get("query", query),
+                    "answer": data.get("answer", ""),
+                    "results": data.get("results", []),
+                    "images": data.get("images", []),
+                    "follow_up_questions": data.get("follow_up_questions", []),
+                    "search_depth": search_depth,
+                    "result_count": result_count
+                }
                 
-                elif response.status_code == 429:
-                    logger.error("⚠️ Tavily API配额已用完")
-                    return {
-                        "success": False,
-                        "error": "API配额已用完",
-                        "results": []
-                    }
+                # 只缓存成功的结果，错误响应不进入缓存
+                self._result_cache[cache_key] = (copy.deepcopy(result), time.monotonic() + self.RESULT_CACHE_TTL)
+                self._result_cache.move_to_end(cache_key)
+                if len(self._result_cache) > self.RESULT_CACHE_SIZE:
+                    self._result_cache.popitem(last=False)
                 
-                else:
-                    error_data = response.json() if response.text else {}
-                    error_message = error_data.get("detail", response.text[:200])
-                    logger.error(f"❌ Tavily搜索失败: {error_message}")
-                    return {
-                        "success": False,
-                        "error": error_message,
-                        "results": []
-                    }
-        
+                return result
+            
+            elif response.status_code == 401:
+                logger.error("❌ Tavily API密钥无效")
+                return {
+                    "success": False,
+                    "error": "API密钥无效",
+                    "results": []
+                }
+            
+            elif response.status_code == 429:
+                logger.error("⚠️ Tavily API配额已用完")
+                return {
+                    "success": False,
+                    "error": "API配额已用完",
+                    "results": []
+                }
+            
+            else:
+                error_data = response.json() if response.text else {}
+                error_message = error_data.get("detail", response.text[:200])
+                logger.error(f"❌ Tavily搜索失败: {error_message}")
+                return {
+                    "success": False,
+                    "error": error_message,
+                    "results": []
+                }
+    
         except asyncio.TimeoutError:
             logger.error("⏱️ Tavily搜索超时")
             return {
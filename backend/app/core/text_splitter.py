@@ -335,7 +335,8 @@ class TextSplitter:
                         }
                     ],
                     temperature=0.3,
-                    max_tokens=4000
+                    max_tokens=4000,
+                    use_cache=True  # 同一文本重复拆分时复用结果
                 )
                 
                 # 解析响应
@@ -377,8 +378,8 @@ class TextSplitter:
                 # 恢复原始API密钥
                 if original_key:
                     multi_model_engine.set_api_key(provider, original_key)
-                elif provider in multi_model_engine.api_keys:
-                    del multi_model_engine.api_keys[provider]
+                else:
+                    multi_model_engine.remove_api_key(provider)
         
         except Exception as e:
             logger.error(f"语义拆分失败: {e}", exc_info=True)
@@ -472,7 +473,8 @@ class TextSplitter:
                         }
                     ],
                     temperature=0.3,
-                    max_tokens=1000
+                    max_tokens=1000,
+                    use_cache=True  # 同一文本重复拆分时复用结果
                 )
                 
                 # 解析分析结果
@@ -509,8 +511,8 @@ class TextSplitter:
                 # 恢复原始API密钥
                 if original_key:
                     multi_model_engine.set_api_key(provider, original_key)
-                elif provider in multi_model_engine.api_keys:
-                    del multi_model_engine.api_keys[provider]
+                else:
+                    multi_model_engine.remove_api_key(provider)
         
         except Exception as e:
             logger.error(f"智能拆分失败: {e}", exc_info=True)
@@ -6,12 +6,16 @@
 from abc import ABC, abstractmethod
 from typing import List, Dict, Optional, Any
 from loguru import logger
+import asyncio
 import uuid
 
 
 class VectorDBInterface(ABC):
     """向量数据库统一接口"""
     
+    # 是否适合按小批次并发写入（远程服务为True；本地嵌入式数据库写入串行，整批交给适配器处理）
+    CONCURRENT_UPSERT = False
+    
     @abstractmethod
     def create_collection(self, collection_name: str, dimension: int, metadata: Optional[Dict] = None):
         """创建集合"""
@@ -46,9 +50,39 @@ class VectorDBInterface(ABC):
         query_embedding: List[float],
         n_results: int = 3
     ) -> Dict:
-        """查询相似文档"""
+        """
+        查询相似文档
+        
+        Returns:
+            {
+                "documents": List[str],
+                "distances": List[float],  # 距离（越小越相似）
+                "metadatas": List[Dict],
+                "scores": List[float],  # 可选：数据库原生余弦相似度
+                "score_type": str  # 可选：scores 的类型，目前为 "cosine"
+            }
+        """
         pass
     
+    async def query_batch(
+        self,
+        collection_name: str,
+        query_embeddings: List[List[float]],
+        n_results: int = 3
+    ) -> List[Dict]:
+        """
+        批量查询相似文档（多个查询向量）
+        
+        默认逐个并发调用 query()，支持原生批量查询的适配器可覆盖为单次请求
+        
+        Returns:
+            与 query_embeddings 一一对应的 query() 结果列表
+        """
+        return list(await asyncio.gather(*[
+            self.query(collection_name, embedding, n_results)
+            for embedding in query_embeddings
+        ]))
+    
     @abstractmethod
     def get_collection_stats(self, collection_name: str) -> Dict:
         """获取集合统计信息"""
@@ -63,6 +97,9 @@ class VectorDBInterface(ABC):
 class ChromaDBAdapter(VectorDBInterface):
     """ChromaDB 适配器 - 本地向量数据库"""
     
+    # 单次 collection.add 的最大文档数
+    ADD_BATCH_SIZE = 1000
+    
     def __init__(self, persist_directory: str):
         import chromadb
         from chromadb.config import Settings as ChromaSettings
@@ -80,9 +117,10 @@ class ChromaDBAdapter(VectorDBInterface):
     def create_collection(self, collection_name: str, dimension: int, metadata: Optional[Dict] = None):
         """创建集合"""
         try:
+            # 使用余弦距离，与 Qdrant 的 COSINE 一致，查询时可直接换算为余弦相似度
             collection = self.client.create_collection(
                 name=collection_name,
-                metadata=metadata or {}
+                metadata={"hnsw:space": "cosine", **(metadata or {})}
             )
             logger.info(f"✅ ChromaDB 创建集合: {collection_name}")
             return collection
@@ -142,14 +180,18 @@ class ChromaDBAdapter(VectorDBInterface):
             collection = self.client.get_collection(name=collection_name)
             
             if not ids:
-                ids = [str(uuid.uuid4()) for _ in documents]
+                ids = [uuid.uuid4().hex for _ in documents]
             
-            collection.add(
-                embeddings=embeddings,
-                documents=documents,
-                metadatas=metadatas or [{}] * len(documents),
-                ids=ids
-            )
+            # 按批写入：单次超大插入会拖慢SQLite后端，且可能超过Chroma的最大批量
+            for start in range(0, len(documents), self.ADD_BATCH_SIZE):
+                end = start + self.ADD_BATCH_SIZE
+                await asyncio.to_thread(
+                    collection.add,
+                    embeddings=embeddings[start:end],
+                    documents=documents[start:end],
+                    metadatas=metadatas[start:end] if metadatas else None,
+                    ids=ids[start:end]
+                )
             
             logger.info(f"✅ ChromaDB 添加 {len(documents)} 个文档到 {collection_name}")
             return ids
@@ -164,19 +206,41 @@ class ChromaDBAdapter(VectorDBInterface):
         n_results: int = 3
     ) -> Dict:
         """查询相似文档"""
+        return (await self.query_batch(collection_name, [query_embedding], n_results))[0]
+    
+    async def query_batch(
+        self,
+        collection_name: str,
+        query_embeddings: List[List[float]],
+        n_results: int = 3
+    ) -> List[Dict]:
+        """批量查询相似文档（ChromaDB原生支持多个查询向量，一次调用完成）"""
         try:
             collection = self.client.get_collection(name=collection_name)
             
-            results = collection.query(
-                query_embeddings=[query_embedding],
+            # 同步客户端调用放到线程池，使多个集合的并发查询真正重叠
+            results = await asyncio.to_thread(
+                collection.query,
+                query_embeddings=query_embeddings,
                 n_results=n_results
             )
             
-            return {
-                "documents": results["documents"][0],
-                "distances": results["distances"][0],
-                "metadatas": results["metadatas"][0]
-            }
+            # 余弦空间的集合：distance = 1 - cosine；旧的 l2 集合无法换算，仅返回距离
+            is_cosine = (collection.metadata or {}).get("hnsw:space") == "cosine"
+            
+            responses = []
+            for row, distances in enumerate(results["distances"]):
+                response = {
+                    "documents": results["documents"][row],
+                    "distances": distances,
+                    "metadatas": results["metadatas"][row]
+                }
+                if is_cosine:
+                    response["scores"] = [1.0 - d for d in distances]
+                    response["score_type"] = "cosine"
+                responses.append(response)
+            
+            return responses
         except Exception as e:
             logger.error(f"ChromaDB 查询失败: {e}")
             raise
@@ -209,6 +273,8 @@ class ChromaDBAdapter(VectorDBInterface):
 class QdrantAdapter(VectorDBInterface):
     """Qdrant 适配器 - 云端向量数据库"""
     
+    CONCURRENT_UPSERT = True
+    
     def __init__(self, host: str, port: int = 6333, api_key: Optional[str] = None, https: bool = False):
         from qdrant_client import QdrantClient
         from qdrant_client.models import Distance, VectorParams
@@ -358,7 +424,9 @@ class QdrantAdapter(VectorDBInterface):
                     payload=payload
                 ))
             
-            self.client.upsert(
+            # 同步客户端在线程池中执行，多个批次可并发上传
+            await asyncio.to_thread(
+                self.client.upsert,
                 collection_name=collection_name,
                 points=points
             )
@@ -377,7 +445,9 @@ class QdrantAdapter(VectorDBInterface):
     ) -> Dict:
         """查询相似文档"""
         try:
-            search_result = self.client.search(
+            # 同步客户端调用放到线程池，使多个集合的并发查询真正重叠
+            search_result = await asyncio.to_thread(
+                self.client.search,
                 collection_name=collection_name,
                 query_vector=query_embedding,
                 limit=n_results
@@ -385,10 +455,12 @@ class QdrantAdapter(VectorDBInterface):
             
             documents = []
             distances = []
+            scores = []
             metadatas = []
             
             for hit in search_result:
                 documents.append(hit.payload.get("text", ""))
+                scores.append(hit.score)  # 集合使用 COSINE 度量，score 即余弦相似度
                 distances.append(1 - hit.score)  # 转换为距离（越小越相似）
                 # 移除 text 字段，保留其他元数据
                 metadata = {k: v for k, v in hit.payload.items() if k != "text"}
@@ -397,7 +469,9 @@ class QdrantAdapter(VectorDBInterface):
             return {
                 "documents": documents,
                 "distances": distances,
-                "metadatas": metadatas
+                "metadatas": metadatas,
+                "scores": scores,
+                "score_type": "cosine"
             }
         except Exception as e:
             logger.error(f"Qdrant 查询失败: {e}")
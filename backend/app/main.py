@@ -10,7 +10,9 @@ from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
+import asyncio
+import importlib.util
 import uvicorn
 from loguru import logger
 import sys
@@ -20,6 +22,12 @@ from app.core.config import settings
 from app.api import documents, knowledge_bases, training, models, inference, ai_providers, embedding_providers, applications, fixed_qa, app_inference, search_providers, vector_db_providers
 from app.models.database import init_db
 
+# 可选依赖 orjson：更快的JSON响应序列化（支持numpy标量）
+if importlib.util.find_spec("orjson") is not None:
+    from fastapi.responses import ORJSONResponse as DefaultResponseClass
+else:
+    DefaultResponseClass = JSONResponse
+
 # 配置日志
 logger.remove()
 logger.add(
@@ -66,11 +74,31 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.warning(f"⚠️ API配置自动导入失败: {e}")
     
+    # 定期写入累计的搜索提供商使用量
+    from app.core.hybrid_retrieval_engine import hybrid_retrieval_engine
+    usage_flush_task = asyncio.create_task(hybrid_retrieval_engine.run_search_usage_flusher())
+    
     logger.info(f"✅ cbitXForge 启动成功！监听端口: {settings.API_PORT}")
     
     yield
     
     logger.info("👋 cbitXForge 正在关闭...")
+    
+    # 停止定期写入，并写入尚未提交的搜索提供商使用量
+    usage_flush_task.cancel()
+    with suppress(asyncio.CancelledError):
+        await usage_flush_task
+    await hybrid_retrieval_engine.flush_search_usage()
+    
+    # 关闭模型提供商与Tavily搜索的持久HTTP连接
+    from app.core.multi_model_engine import multi_model_engine
+    from app.core.tavily_search import TavilySearch
+    await multi_model_engine.aclose()
+    await TavilySearch.aclose()
+    
+    # 关闭Embedding持久化缓存
+    from app.core.embedding_cache import embedding_cache
+    embedding_cache.close()
 
 
 # 创建 FastAPI 应用
@@ -79,6 +107,7 @@ app = FastAPI(
     description="计算与推理大模型服务平台 - 支持 RAG 检索增强 & 模型微调",
     version="1.0.0",
     lifespan=lifespan,
+    default_response_class=DefaultResponseClass,
     docs_url="/docs",
     redoc_url="/redoc",
 )
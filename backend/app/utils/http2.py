@@ -0,0 +1,7 @@
+"""
+HTTP/2 支持检测 - 安装了 h2（pip install httpx[http2]）时 httpx 客户端可启用 HTTP/2
+"""
+
+import importlib.util
+
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
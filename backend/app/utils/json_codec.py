@@ -0,0 +1,25 @@
+"""
+JSON编解码工具 - 安装了 orjson 时使用 orjson，否则回退到标准库 json
+"""
+
+import json
+from typing import Any, Union
+
+try:
+    import orjson  # 可选依赖：更快的JSON编解码
+except ImportError:
+    orjson = None
+
+
+def dumps(obj: Any) -> bytes:
+    """序列化为UTF-8编码的JSON字节串（可直接作为HTTP请求体）"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    """解析JSON字符串或字节串"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)